@@ -369,6 +369,7 @@ class LocationCoordinate(models.Model):
 ####### Signals for Business #######
 # Included here to make sure it is loaded before a request needs it
 from advertiser.signals import business_categories_callback
+from consumer.signals import on_save_consumer
 
 ####### Register signals #######
 # Use a dispatch UID to prevent this from getting kicked multiple times 
@@ -376,3 +377,5 @@ from advertiser.signals import business_categories_callback
 #######
 models.signals.m2m_changed.connect(business_categories_callback, 
     sender=Business, dispatch_uid=__name__)
+models.signals.post_save.connect(on_save_consumer, sender=Advertiser,
+    dispatch_uid='advertiser_consumer_counts')
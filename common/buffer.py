@@ -0,0 +1,75 @@
+""" A base for buffers that gather work in a process to do it in batches. """
+import logging
+import threading
+
+from django.conf import settings
+from django.db import connection
+
+LOG = logging.getLogger('ten.%s' % __name__)
+LOG.setLevel(logging.ERROR)
+
+
+class TimedBuffer(object):
+    """
+    Buffers work in this process, and writes it in one batch when flush_size
+    items are held, or from a timer thread flush_seconds after the first of
+    them was added, so an idle worker does not sit on its buffer. When tasks
+    run eagerly, in the web process, everything is written at once.
+
+    Subclasses hold the lock while adding, call added() afterward, and define
+    reset(), __len__(), take() to return what is held and reset, and
+    write(batch) for what take returned.
+    """
+    def __init__(self, flush_size, flush_seconds):
+        self.flush_size = flush_size
+        self.flush_seconds = flush_seconds
+        self.lock = threading.RLock()
+        self.timer = None
+        self.reset()
+
+    def reset(self):
+        """ Empty this buffer. """
+        raise NotImplementedError
+
+    def __len__(self):
+        raise NotImplementedError
+
+    def take(self):
+        """ Return what this buffer holds, and reset it. """
+        raise NotImplementedError
+
+    def write(self, batch):
+        """ Write this batch, as returned by take. """
+        raise NotImplementedError
+
+    def added(self):
+        """ Flush this buffer if it is due, or else make sure the timer will.
+        """
+        with self.lock:
+            is_due = (getattr(settings, 'CELERY_ALWAYS_EAGER', False)
+                or len(self) >= self.flush_size)
+            if not is_due and len(self) and not self.timer:
+                self.timer = threading.Timer(self.flush_seconds,
+                    self.flush_on_timer)
+                self.timer.daemon = True
+                self.timer.start()
+        if is_due:
+            self.flush()
+
+    def flush(self):
+        """ Write what this buffer holds. """
+        with self.lock:
+            if self.timer:
+                self.timer.cancel()
+                self.timer = None
+            batch = self.take()
+        self.write(batch)
+
+    def flush_on_timer(self):
+        """ Flush from the timer thread, which has a connection of its own. """
+        try:
+            self.flush()
+        except Exception:
+            LOG.exception('%s failed to flush.' % self.__class__.__name__)
+        finally:
+            connection.close()
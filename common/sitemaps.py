@@ -6,6 +6,7 @@ from django.core.urlresolvers import reverse
 
 from advertiser.models import Business
 from coupon.models import Coupon
+from coupon.service.coupons_service import ALL_COUPONS
 from market.models import Site
 
 from zinnia.sitemaps import EntrySitemap
@@ -89,7 +90,8 @@ class CouponsMap(Sitemap):
     
     @classmethod
     def items(cls):
-        return Coupon.current_coupons.all()
+        return Coupon.objects.filter(id__in=ALL_COUPONS.get_listed_coupon_ids(
+            Site.objects.get_or_set_cache()))
     
     @classmethod
     def lastmod(cls, obj):
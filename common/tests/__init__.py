@@ -16,6 +16,7 @@ from common.tests.test_service import TestService, TestGetHomeData
 from common.tests.test_session import TestSessionKeyParser
 from common.tests.test_sitemap import TestSitemap
 from common.tests.test_blog import TestBlog
+from common.tests.test_buffer import TestTimedBuffer
 from common.tests.test_utils import TestFacebookMetaBuilder, TestUtils
 from common.tests.test_views import (TestAdRepSignIn, TestConsumerMap, 
     TestCrossSiteSignIn, TestGenericHomeView, TestGenericLinkRedirects,
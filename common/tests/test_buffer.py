@@ -0,0 +1,76 @@
+""" Tests of the timed buffer base of common. """
+import time
+
+from django.conf import settings
+from django.test import TestCase
+
+from common.buffer import TimedBuffer
+
+
+class ListBuffer(TimedBuffer):
+    """ A buffer of items, which records the batches it writes. """
+    def __init__(self, flush_size, flush_seconds):
+        self.batches = []
+        super(ListBuffer, self).__init__(flush_size, flush_seconds)
+
+    def __len__(self):
+        return len(self.items)
+
+    def reset(self):
+        self.items = []
+
+    def add(self, item):
+        """ Buffer this item. """
+        with self.lock:
+            self.items.append(item)
+        self.added()
+
+    def take(self):
+        items = self.items
+        self.reset()
+        return items
+
+    def write(self, batch):
+        if batch:
+            self.batches.append(batch)
+
+
+class TestTimedBuffer(TestCase):
+    """ Test case for TimedBuffer. """
+
+    def setUp(self):
+        self.always_eager = settings.CELERY_ALWAYS_EAGER
+        settings.CELERY_ALWAYS_EAGER = False
+
+    def tearDown(self):
+        settings.CELERY_ALWAYS_EAGER = self.always_eager
+
+    def test_flush_when_full(self):
+        """ Assert a full buffer is written at once, as one batch. """
+        buffer_ = ListBuffer(flush_size=2, flush_seconds=3600)
+        buffer_.add(1)
+        self.assertEqual(buffer_.batches, [])
+        buffer_.add(2)
+        self.assertEqual(buffer_.batches, [[1, 2]])
+        self.assertEqual(len(buffer_), 0)
+        self.assertEqual(buffer_.timer, None)
+
+    def test_flush_on_timer(self):
+        """ Assert a buffer that is not added to again is written by its timer.
+        """
+        buffer_ = ListBuffer(flush_size=100, flush_seconds=0.1)
+        buffer_.add(1)
+        buffer_.add(2)
+        for _ in range(50):
+            if buffer_.batches:
+                break
+            time.sleep(0.1)
+        self.assertEqual(buffer_.batches, [[1, 2]])
+        self.assertEqual(buffer_.timer, None)
+
+    def test_flush_eagerly(self):
+        """ Assert everything is written at once when tasks run eagerly. """
+        settings.CELERY_ALWAYS_EAGER = True
+        buffer_ = ListBuffer(flush_size=100, flush_seconds=3600)
+        buffer_.add(1)
+        self.assertEqual(buffer_.batches, [[1]])
@@ -11,6 +11,7 @@ import logging
 import os
 import random
 import re
+import tempfile
 import time
 import urllib
 import urllib2
@@ -428,4 +429,18 @@ def random_string_generator(string_length=10, alpha_only=False,
         current_string_length += 1
     return random_string
 
-
+def write_file_atomically(file_name, content):
+    """ Write content to file_name by renaming a temporary file over it, so
+    readers see the whole old file or the whole new one.
+    """
+    file_descriptor, temp_name = tempfile.mkstemp(
+        dir=os.path.dirname(file_name))
+    try:
+        temp_file = os.fdopen(file_descriptor, 'w')
+        temp_file.write(content)
+        temp_file.close()
+        os.chmod(temp_name, 0644)
+        os.rename(temp_name, file_name)
+    except (IOError, OSError):
+        os.remove(temp_name)
+        raise
@@ -4,9 +4,10 @@ import datetime
 import hashlib
 import logging
 
-from django.db import DatabaseError, IntegrityError, models, transaction
+from django.db import (DatabaseError, IntegrityError, connection, models,
+    transaction)
 from django.db.models import SET_NULL
-from django.db.models.signals import m2m_changed
+from django.db.models.signals import m2m_changed, post_save
 from django.contrib.auth.models import User, UserManager
 from django.contrib.contenttypes import generic
 from django.contrib.contenttypes.models import ContentType
@@ -15,7 +16,8 @@ from django.core.exceptions import ObjectDoesNotExist, ValidationError
 from django.utils.translation import ugettext_lazy as _
 
 from common.utils import generate_email_hash, generate_guid
-from consumer.signals import on_change_email_subscription
+from consumer.signals import on_change_email_subscription, on_save_consumer
+from geolocation.models import USZip
 from market.models import Site
 
 LOG = logging.getLogger('ten.%s' % __name__)
@@ -130,7 +132,7 @@ class Consumer(User):
     is_email_verified = models.BooleanField('Verified by email', 
         default=False)
     consumer_zip_postal = models.CharField('Zip/Postal', max_length=9, 
-        null=True, blank=True)
+        null=True, blank=True, db_index=True)
     geolocation_type = models.ForeignKey(ContentType, 
         limit_choices_to={"model__in": ("uszip",)},
         help_text=_("Is this a zip or a postal code?"))
@@ -155,6 +157,10 @@ class Consumer(User):
         related_name='consumers', blank=True, help_text=_("If not, why not?"))
     objects = ConsumerManager()
 
+    def __init__(self, *args, **kwargs):
+        super(Consumer, self).__init__(*args, **kwargs)
+        self._count_key = self.get_count_key()
+
     def __unicode__(self):
         return u'%s' % (self.email)
 
@@ -204,6 +210,23 @@ class Consumer(User):
         self.consumer_actions.all().delete()
         super(Consumer, self).save(*args, **kwargs)
         
+    def get_count_key(self):
+        """ Return what places this consumer in the consumer counts: the zip,
+        site id and is_emailable, each None if deferred.
+        """
+        return (self.__dict__.get('consumer_zip_postal'),
+            self.__dict__.get('site_id'), self.__dict__.get('is_emailable'))
+
+    def update_consumer_counts(self, is_forced=False):
+        """ Recount the consumer counts this consumer was and is in, if it has
+        moved since they were counted or is_forced.
+        """
+        count_key = self.get_count_key()
+        if is_forced or count_key != self._count_key:
+            ConsumerCount.objects.refresh((count_key[:2],
+                self._count_key[:2]))
+            self._count_key = count_key
+
     def get_geolocation_id(self):
         """ Derives correct content type for GenericForeignKey. """
         try:
@@ -311,6 +334,82 @@ class ConsumerHistoryEvent(models.Model):
         return u'%s---%s--%s--%s' % (self.event_datetime, self.event_type,
             self.ip, self.data)
 
+
+COUNT_CONSUMERS_SQL = """
+    INSERT INTO consumer_consumercount (us_zip_id, site_id, consumer_count,
+        mailable_count)
+    SELECT z.id, c.site_id, COUNT(c.user_ptr_id), COUNT(ces.consumer_id)
+    FROM consumer_consumer c
+    JOIN geolocation_uszip z
+        ON z.code = c.consumer_zip_postal
+    LEFT JOIN consumer_consumer_email_subscription ces
+        ON ces.consumer_id = c.user_ptr_id
+        AND ces.emailsubscription_id = 1
+        AND c.is_emailable = True
+    %s
+    GROUP BY z.id, c.site_id"""
+
+class ConsumerCountManager(models.Manager):
+    """ Default manager for ConsumerCount. """
+    def refresh(self, count_keys):
+        """ Recount the consumers of these (consumer_zip_postal, site_id) keys.
+
+        The zips recounted are locked first, so that two transactions cannot
+        recount one zip at once.
+        """
+        count_keys = tuple(set([(zip_postal, site_id)
+            for zip_postal, site_id in count_keys if zip_postal and site_id]))
+        if not count_keys:
+            return
+        cursor = connection.cursor()
+        cursor.execute("""
+            SELECT id FROM geolocation_uszip WHERE code IN %s FOR UPDATE""",
+            [tuple(set([zip_postal for zip_postal, site_id in count_keys]))])
+        cursor.execute("""
+            DELETE FROM consumer_consumercount cc
+            USING geolocation_uszip z
+            WHERE z.id = cc.us_zip_id
+                AND (z.code, cc.site_id) IN %s""", [count_keys])
+        cursor.execute(COUNT_CONSUMERS_SQL %
+            "WHERE (c.consumer_zip_postal, c.site_id) IN %s", [count_keys])
+        transaction.commit_unless_managed()
+
+    @transaction.commit_on_success
+    def reconcile(self):
+        """ Rebuild every consumer count, correcting those changed where no
+        signal is sent, as by a bulk update or delete.
+        """
+        cursor = connection.cursor()
+        cursor.execute("""
+            LOCK TABLE consumer_consumercount IN EXCLUSIVE MODE""")
+        cursor.execute("DELETE FROM consumer_consumercount")
+        cursor.execute(COUNT_CONSUMERS_SQL % '')
+
+
+class ConsumerCount(models.Model):
+    """ How many consumers of a site are in a zip, and how many of them are
+    mailable: emailable and subscribed to the flyer. Recounted as consumers
+    are saved and subscribed, and rebuilt nightly, so consumer counts by zip,
+    city, county and site are indexed lookups.
+    """
+    us_zip = models.ForeignKey(USZip, related_name='consumer_counts')
+    site = models.ForeignKey(Site, related_name='consumer_counts')
+    consumer_count = models.PositiveIntegerField(default=0)
+    mailable_count = models.PositiveIntegerField(default=0)
+    objects = ConsumerCountManager()
+
+    class Meta:
+        verbose_name = 'Consumer Count'
+        verbose_name_plural = 'Consumer Counts'
+        unique_together = (('us_zip', 'site'),)
+
+    def __unicode__(self):
+        return u'%s %s' % (self.us_zip_id, self.site_id)
+
 # Signal for EmailSubscription to clear consumer-site-count when it changes.
 m2m_changed.connect(on_change_email_subscription,
     sender = Consumer.email_subscription.through)
+# Signal for Consumer to update the consumer counts. Each subclass connects
+# it for itself, in its own models.
+post_save.connect(on_save_consumer, sender=Consumer,
+    dispatch_uid='consumer_counts')
@@ -2,12 +2,20 @@
 #pylint: disable=W0613
 def on_change_email_subscription(sender, instance, **kwargs):
     """
-    Receives signal that a Consumer's email subscription was changed and clears
-    cache.
+    Receives signal that a Consumer's email subscription was changed, clears
+    cache and recounts the consumer counts of its zip and site.
     """
     if kwargs.get('action') in ['post_add', 'post_clear', 'post_remove']:
         try:
             consumer = instance
             consumer.clear_cache()      
+            consumer.update_consumer_counts(is_forced=True)
         except (AttributeError, KeyError):
-            pass
\ No newline at end of file
+            pass
+
+def on_save_consumer(sender, instance, created, **kwargs):
+    """
+    Receives signal that a Consumer, or an instance of a subclass, was saved
+    and updates the consumer counts of its zip and site.
+    """
+    instance.update_consumer_counts(is_forced=created)
\ No newline at end of file
@@ -0,0 +1,11 @@
+""" Celery tasks for consumer app of project ten. """
+from celery.decorators import task
+
+from consumer.models import ConsumerCount
+
+@task(ignore_result=True)
+def reconcile_consumer_counts():
+    """ Rebuild the consumer counts, which are recounted as consumers are
+    saved; scheduled nightly to correct those changed without a signal.
+    """
+    ConsumerCount.objects.reconcile()
@@ -5,7 +5,7 @@ from django.db import DatabaseError, IntegrityError, transaction
 from django.test import TestCase, TransactionTestCase
 
 from consumer.factories.consumer_factory import CONSUMER_FACTORY
-from consumer.models import Consumer
+from consumer.models import Consumer, ConsumerCount
 from geolocation.models import USZip
 from market.models import Site
 from subscriber.models import MobilePhone
@@ -72,6 +72,35 @@ class TestModels(TestCase):
             self.fail('Retain Consumer when subscriber is deleted!')
         self.assertEqual(consumer.subscriber, None)
 
+    def test_consumer_counts(self):
+        """ Assert the consumer counts follow a consumer as it moves zip and
+        unsubscribes, and agree with a full rebuild.
+        """
+        site = Site.objects.get(id=2)
+        consumer = Consumer.objects.create_consumer(
+            username='consumer_counts@example.com',
+            email='consumer_counts@example.com', consumer_zip_postal='12550',
+            site=site)
+        count = ConsumerCount.objects.get(us_zip__code='12550', site=site)
+        self.assertTrue(count.consumer_count > 0)
+        self.assertEqual(count.mailable_count, Consumer.objects.filter(
+            site=site, consumer_zip_postal='12550', is_emailable=True,
+            email_subscription=1).count())
+        consumer.consumer_zip_postal = '12601'
+        consumer.save()
+        self.assertEqual(ConsumerCount.objects.get(us_zip__code='12550',
+            site=site).consumer_count, count.consumer_count - 1)
+        count = ConsumerCount.objects.get(us_zip__code='12601', site=site)
+        consumer.email_subscription.clear()
+        self.assertEqual(ConsumerCount.objects.get(id=count.id).mailable_count,
+            count.mailable_count - 1)
+        counts = list(ConsumerCount.objects.values_list('us_zip', 'site',
+            'consumer_count', 'mailable_count').order_by('us_zip', 'site'))
+        ConsumerCount.objects.reconcile()
+        self.assertEqual(list(ConsumerCount.objects.values_list('us_zip',
+            'site', 'consumer_count', 'mailable_count').order_by('us_zip',
+            'site')), counts)
+
 
 class TestModelsTransaction(TransactionTestCase):
     """ Tests for consumer model requiring a transaction. """
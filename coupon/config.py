@@ -6,3 +6,49 @@ IS_REDEEMED_BY_SMS_CHOICES = (
 )
 
 TEN_COUPON_RESTRICTIONS = 'No cash value. Not valid in combination with other offers. Coupon void if altered.'
+
+# How many consumers to render and send a flyer to per batch. Progress of the
+# send is checkpointed on the flyer after each batch.
+FLYER_SEND_CHUNK_SIZE = 1000
+
+# How many flyers may be sending at once on flyer day. Each sending flyer holds
+# one SMTP connection.
+FLYER_SEND_CONCURRENCY = 4
+
+# The most connections each SMTP relay (by settings.EMAIL_HOST) will take from
+# flyer sends at once. Relays not listed get one connection.
+SMTP_RELAY_CONNECTION_CAPS = {
+    'localhost': 4,
+    'smtp01.strausdigital.com': 2,
+}
+
+# Seconds to wait between checks on flyers that are sending.
+FLYER_SEND_POLL_SECONDS = 5
+
+# A flyer sending whose sender has not claimed it or saved a checkpoint for
+# this many seconds was left by a send that died, and may be resumed. Longer
+# than sending one chunk can take.
+FLYER_SEND_STALE_SECONDS = 30 * 60
+
+# A worker writes the coupon actions it has buffered once it holds this many
+# distinct (action, coupon) counts and consumer or subscriber actions...
+COUPON_ACTION_FLUSH_SIZE = 5000
+
+# ...or once the oldest of them is this many seconds old.
+COUPON_ACTION_FLUSH_SECONDS = 60
+
+# A worker sends the coupons queued for search indexing to solr once it holds
+# this many distinct coupons...
+COUPON_INDEX_FLUSH_SIZE = 200
+
+# ...or once the oldest of them is this many seconds old.
+COUPON_INDEX_FLUSH_SECONDS = 30
+
+# How many coupons to prepare and send to solr at once when reindexing.
+COUPON_INDEX_BATCH_SIZE = 500
+
+# How many coupon codes to create at once when sending a coupon to many.
+COUPON_CODE_BATCH_SIZE = 500
+
+# How many batched inserts may be tried to create a set of unique codes.
+MAX_COUPON_CODE_ATTEMPTS = 10
@@ -359,12 +359,14 @@ class SearchCouponForm(SearchForm):
         LOG.debug('searchqueryset_ids: %s' % searchqueryset_ids)
         # Filter results against coupons that are eligible for display on 
         # the site.
-        coupon_ids = ALL_COUPONS.get_all_coupons(get_current_site(request))[1]
-        LOG.debug('coupon_ids: %s' % coupon_ids)
-        good_ids = set(coupon_ids).intersection(set(searchqueryset_ids))
+        listing = ALL_COUPONS.get_site_listing(get_current_site(request))
+        LOG.debug('coupon_ids: %s' % listing['coupon_ids'])
+        searchqueryset_ids = set(searchqueryset_ids)
+        good_ids = [coupon_id for coupon_id in listing['coupon_ids']
+            if coupon_id in searchqueryset_ids]
         LOG.debug('good_ids: %s' % good_ids)
-        sorted_coupon_ids, coupons = SORT_COUPONS.sorted_coupons(good_ids)
-        ALL_COUPONS.join_coupon_with_locations(sorted_coupon_ids, coupons)
+        coupons = SORT_COUPONS.sorted_coupons(good_ids, presorted=True)[1]
+        ALL_COUPONS.set_location_lists(coupons, listing['location_lists'])
         LOG.debug('coupons: %s' % coupons)
         return coupons
 
@@ -0,0 +1 @@
+""" Management of the coupon app of project ten. """
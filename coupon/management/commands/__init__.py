@@ -0,0 +1 @@
+""" Management commands of the coupon app of project ten. """
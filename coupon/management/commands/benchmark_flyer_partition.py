@@ -0,0 +1,70 @@
+""" Management command to benchmark the partitioning of markets among flyers.
+"""
+from optparse import make_option
+import random
+import time
+
+from django.core.management.base import NoArgsCommand
+
+from coupon.service.flyer_create_service import (partition_zips,
+    SubdivisionHierarchy)
+from market.models import Site
+
+def get_placement_zip_ids(hierarchy, county_ids, count, seed):
+    """ Return the sets of zips of count placements, each for a random county,
+    city or zip of these counties.
+    """
+    chooser = random.Random(seed)
+    zip_ids = sorted(hierarchy.get_site_zip_ids(county_ids))
+    placement_zip_ids = []
+    if not zip_ids:
+        return placement_zip_ids
+    for _ in range(count):
+        zip_id = chooser.choice(zip_ids)
+        subdivision_model = chooser.choice(('uszip', 'uscity', 'uscounty'))
+        if subdivision_model == 'uszip':
+            geolocation_id = zip_id
+        elif subdivision_model == 'uscity':
+            geolocation_id = hierarchy.zip_cities[zip_id]
+        else:
+            geolocation_id = chooser.choice(county_ids)
+        placement_zip_ids.append(hierarchy.get_zip_ids(subdivision_model,
+            geolocation_id))
+    return placement_zip_ids
+
+
+class Command(NoArgsCommand):
+    """
+    For each market of more than one county, load its zips, partition them
+    among flyers for random placements of its counties, cities and zips, and
+    report the flyers, subdivisions and milliseconds it took.
+    """
+    help = 'Benchmark the partitioning of markets among flyers.'
+    option_list = NoArgsCommand.option_list + (
+        make_option('--placements', action='store', type='int',
+            dest='placements', default=10,
+            help='How many placements each market sold.'),
+        )
+
+    def handle_noargs(self, **options):
+        for site in Site.objects.exclude(id=1).order_by('id'):
+            county_ids = list(site.us_county.values_list('id', flat=True))
+            if len(county_ids) < 2:
+                continue
+            start = time.time()
+            hierarchy = SubdivisionHierarchy(county_ids)
+            load_seconds = time.time() - start
+            placement_zip_ids = get_placement_zip_ids(hierarchy, county_ids,
+                options['placements'], site.id)
+            start = time.time()
+            partition = partition_zips(placement_zip_ids,
+                hierarchy.get_site_zip_ids(county_ids))
+            subdivision_count = sum([len(hierarchy.get_subdivisions(zip_ids))
+                for indexes, zip_ids in partition])
+            partition_seconds = time.time() - start
+            self.stdout.write(
+                '%s: %s counties, %s zips, %s placements: %s flyers, '
+                '%s subdivisions; load %.1f ms, partition %.1f ms\n' % (
+                    site.name, len(county_ids), len(hierarchy.zip_cities),
+                    options['placements'], len(partition), subdivision_count,
+                    load_seconds * 1000, partition_seconds * 1000))
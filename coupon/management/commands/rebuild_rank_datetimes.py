@@ -0,0 +1,14 @@
+""" Management command to recompute the rank datetime of every coupon. """
+from django.core.management.base import NoArgsCommand
+
+from coupon.service.coupon_action_service import update_rank_datetimes
+
+
+class Command(NoArgsCommand):
+    """ Recompute the rank datetime of every coupon, creating those missing.
+    """
+    help = 'Recompute the rank datetime of every coupon.'
+
+    def handle_noargs(self, **options):
+        count = update_rank_datetimes(rebuild=True)
+        self.stdout.write('Recomputed %s rank datetimes.\n' % count)
@@ -0,0 +1,57 @@
+""" Management command to rebuild the coupon search index in parallel. """
+from multiprocessing import Pool
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand
+from django.db import connection
+from django.db.models import Max, Min
+
+from haystack.sites import site as haystack_site
+
+from coupon.config import COUPON_INDEX_BATCH_SIZE
+from coupon.models import Coupon
+from coupon.service.search_index_service import (get_id_ranges,
+    reindex_id_range)
+
+
+class Command(NoArgsCommand):
+    """
+    Split the coupons of the search index queryset into ranges of ids, and
+    send each range to solr from one of a pool of processes, a batch at a
+    time.
+    """
+    help = 'Rebuild the coupon search index in parallel.'
+    option_list = NoArgsCommand.option_list + (
+        make_option('--workers', action='store', type='int',
+            dest='workers', default=4,
+            help='How many processes send coupons to solr.'),
+        make_option('--batch-size', action='store', type='int',
+            dest='batch_size', default=COUPON_INDEX_BATCH_SIZE,
+            help='How many coupons each process sends at once.'),
+        make_option('--clear', action='store_true', dest='clear',
+            default=False,
+            help='Clear the coupon search index first.'),
+        )
+
+    def handle_noargs(self, **options):
+        index = haystack_site.get_index(Coupon)
+        if options['clear']:
+            index.backend.clear(models=[Coupon])
+        bounds = index.index_queryset().aggregate(Min('id'), Max('id'))
+        # Several ranges per worker, so one slow range does not hold up the
+        # rest.
+        id_ranges = [id_range + (options['batch_size'],)
+            for id_range in get_id_ranges(bounds['id__min'], bounds['id__max'],
+                options['workers'] * 4)]
+        # Each process opens its own connection.
+        connection.close()
+        if options['workers'] > 1:
+            pool = Pool(options['workers'])
+            try:
+                counts = pool.map(reindex_id_range, id_ranges)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            counts = map(reindex_id_range, id_ranges)
+        self.stdout.write('Indexed %s coupons.\n' % sum(counts))
@@ -15,3 +15,16 @@ __all__ = ['DefaultRestrictions', 'RedemptionMethod', 'Offer', 'CouponType',
     'Action', 'CouponAction', 'ConsumerAction', 'SubscriberAction',
     'RankDateTime',
     'Slot', 'SlotTimeFrame']
+
+
+####### Signals for coupon listings #######
+from django.db.models import signals
+from coupon.signals import coupon_listing_changed_callback
+
+# Deletes are caught before the delete, while the slot time frames relating a
+# coupon to its sites still exist.
+for sender_ in (Coupon, Slot, SlotTimeFrame, FlyerPlacement):
+    signals.post_save.connect(coupon_listing_changed_callback,
+        sender=sender_, dispatch_uid='%s.%s' % (__name__, sender_.__name__))
+    signals.pre_delete.connect(coupon_listing_changed_callback,
+        sender=sender_, dispatch_uid='%s.%s' % (__name__, sender_.__name__))
@@ -90,9 +90,12 @@ class SubscriberAction(models.Model):
 
 
 class RankDateTime(models.Model):
-    """ A computed field for ordering coupons. """
+    """ A computed field for ordering coupons. Prints and shares mark it dirty,
+    to be recomputed in bulk by update_rank_datetimes.
+    """
     coupon = models.OneToOneField(Coupon, related_name='rank_datetime')
     rank_datetime = models.DateTimeField(null=True, blank=True)
+    is_dirty = models.BooleanField(default=False, db_index=True)
 
     class Meta:
         app_label = 'coupon'
@@ -111,4 +114,5 @@ class RankDateTime(models.Model):
             prints = 0
         self.rank_datetime = (self.coupon.coupon_create_datetime +
             datetime.timedelta(15 * shares + 3 * prints))
+        self.is_dirty = False
         super(RankDateTime, self).save(*args, **kwargs)
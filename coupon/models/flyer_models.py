@@ -142,6 +142,11 @@ class Flyer(models.Model):
     num_recipients: defaults to -1 to differentiate between flyers that went to 
     0 people and flyers that didn't acutally send (or save) properly for some 
     reason.
+    send_checkpoint: the highest consumer id this flyer has been sent to. A send
+    that is interrupted resumes with the consumers after it.
+    send_heartbeat: when the sender of this flyer last claimed it or saved its
+    checkpoint. A flyer sending without a recent heartbeat was left by a send
+    that died.
     """
     coupon = models.ManyToManyField(Coupon, related_name='flyers', 
         through='FlyerCoupon')
@@ -157,6 +162,11 @@ class Flyer(models.Model):
         choices=SEND_STATUS_CHOICES)
     num_recipients = models.IntegerField(default=-1,
         help_text=_('To how many addresses was this flyer sent?'))
+    send_checkpoint = models.PositiveIntegerField(default=0, editable=False,
+        help_text=_('Last consumer id sent, for resuming a failed send.'))
+    send_heartbeat = models.DateTimeField(blank=True, null=True,
+        editable=False,
+        help_text=_('When the sender of this flyer last made progress.'))
 
     class Meta:
         app_label = 'coupon'
@@ -9,10 +9,24 @@ from haystack import indexes, site
 from gargoyle import gargoyle
 
 from coupon.models import Coupon, SlotTimeFrame
+from coupon.service.search_index_service import (get_coupon_category_ids,
+    get_coupon_site_ids)
+
+
+class QueuedSearchIndex(indexes.RealTimeSearchIndex):
+    """
+    A RealTimeSearchIndex that queues the objects it is asked to update, for a
+    worker to send to solr in batches, instead of preparing and sending each
+    within the request that saved it. Deletes are still sent at once.
+    """
+    def update_object(self, instance, **kwargs):
+        """ Queue this instance to be indexed. """
+        from coupon.tasks import INDEX_COUPONS
+        INDEX_COUPONS.delay([instance.id])
 
 # Realtime search indexing thrashes for fixture resests during tests builds.
 # Override it for *all* Jenkins builds, and (locally) any EnhancedTestCase).
-INDEX_CLASS = indexes.RealTimeSearchIndex
+INDEX_CLASS = QueuedSearchIndex
 if not settings.SEARCH_REALTIME:
     INDEX_CLASS = indexes.SearchIndex
 try:
@@ -57,14 +71,16 @@ class CouponIndex(INDEX_CLASS):
         prepared_data['suggestions'] = prepared_data['text']
         return prepared_data
         
-    @classmethod
-    def prepare_categories(cls, obj): 
+    def prepare_categories(self, obj): 
         """ Format categories m2m as MultiValueField. """
+        if hasattr(obj, 'index_category_ids'):
+            return obj.index_category_ids
         return [category.id for category in obj.offer.business.categories.all()]
 
-    @classmethod
-    def prepare_site_id(cls, obj): 
+    def prepare_site_id(self, obj): 
         """ Format site_id to ensure this coupon has an active slot. """
+        if hasattr(obj, 'index_site_id'):
+            return obj.index_site_id
         active_time_frame = \
             SlotTimeFrame.current_slot_time_frames.get_query_set().filter(
                 coupon=obj)
@@ -74,4 +90,21 @@ class CouponIndex(INDEX_CLASS):
             site_id = None
         return site_id
 
+    def update_objects(self, coupons):
+        """
+        Send these coupons to solr in one request, preparing them from the
+        site ids and categories of the whole batch, fetched in two queries and
+        set on each coupon as index_site_id and index_category_ids.
+        """
+        coupons = list(coupons)
+        if not coupons:
+            return
+        coupon_ids = [coupon.id for coupon in coupons]
+        site_ids = get_coupon_site_ids(coupon_ids)
+        category_ids = get_coupon_category_ids(coupon_ids)
+        for coupon in coupons:
+            coupon.index_site_id = site_ids.get(coupon.id)
+            coupon.index_category_ids = category_ids[coupon.id]
+        self.backend.update(self, coupons)
+
 site.register(Coupon, CouponIndex)
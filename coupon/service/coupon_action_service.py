@@ -0,0 +1,258 @@
+""" Service functions for buffering coupon actions and writing them to the
+database in batches.
+"""
+import atexit
+import logging
+
+from django.db import IntegrityError, connection, transaction
+
+from common.buffer import TimedBuffer
+from coupon.config import COUPON_ACTION_FLUSH_SECONDS, COUPON_ACTION_FLUSH_SIZE
+
+LOG = logging.getLogger('ten.%s' % __name__)
+LOG.setLevel(logging.ERROR)
+
+# Actions that move a coupon's rank_datetime: print and share.
+RANKED_ACTION_IDS = (3, 7)
+
+# Text blasted: counted toward the monthly blast limit of a subscriber.
+BLAST_ACTION_ID = 11
+
+def build_values(rows):
+    """ Return a VALUES list of placeholders for these rows, and its params.
+    """
+    values = ', '.join(['(%s)' % ', '.join(['%s'] * len(row))
+        for row in rows])
+    params = []
+    for row in rows:
+        params.extend(row)
+    return values, params
+
+def mark_rank_datetimes_dirty(cursor, coupon_ids):
+    """ Mark the rank_datetime of these coupons to be recomputed, creating it
+    at the coupon create datetime if missing.
+    """
+    cursor.execute("""
+        INSERT INTO "coupon_rankdatetime" (
+            "coupon_id", "rank_datetime", "is_dirty")
+        SELECT c.id, c.coupon_create_datetime, true
+        FROM "coupon_coupon" c
+        WHERE c.id IN %(coupon_ids)s
+        AND NOT EXISTS (
+            SELECT 1
+            FROM "coupon_rankdatetime" r
+            WHERE r.coupon_id = c.id
+            );
+        UPDATE "coupon_rankdatetime"
+        SET "is_dirty" = true
+        WHERE "coupon_id" IN %(coupon_ids)s
+        AND NOT "is_dirty";""", {'coupon_ids': tuple(coupon_ids)})
+
+def add_subscriber_blasts(cursor, subscriber_ids):
+    """ Count a text blast this month for each of these subscribers. """
+    cursor.execute("""
+        UPDATE "subscriber_subscriberblastcount"
+        SET "blast_count" = "blast_count" + 1
+        WHERE "month" = date_trunc('month', now())::date
+        AND "subscriber_id" IN %(subscriber_ids)s;
+        INSERT INTO "subscriber_subscriberblastcount" (
+            "subscriber_id", "month", "blast_count")
+        SELECT s.id, date_trunc('month', now())::date, 1
+        FROM "subscriber_subscriber" s
+        WHERE s.id IN %(subscriber_ids)s
+        AND NOT EXISTS (
+            SELECT 1
+            FROM "subscriber_subscriberblastcount" b
+            WHERE b.subscriber_id = s.id
+            AND b.month = date_trunc('month', now())::date
+            );""", {'subscriber_ids': tuple(subscriber_ids)})
+
+@transaction.commit_on_success
+def update_rank_datetimes(rebuild=False):
+    """ Recompute rank_datetime as the coupon create datetime + 15 days per
+    share + 3 days per print, for dirty rank datetimes, or if rebuild, for
+    every coupon. Return how many were recomputed.
+    """
+    cursor = connection.cursor()
+    if rebuild:
+        cursor.execute("""
+            INSERT INTO "coupon_rankdatetime" (
+                "coupon_id", "rank_datetime", "is_dirty")
+            SELECT c.id, c.coupon_create_datetime, true
+            FROM "coupon_coupon" c
+            WHERE NOT EXISTS (
+                SELECT 1
+                FROM "coupon_rankdatetime" r
+                WHERE r.coupon_id = c.id
+                );""")
+    # The dirty flag is cleared by the same statement. An action written while
+    # this runs waits on the row, then marks it dirty again for the next run.
+    cursor.execute("""
+        UPDATE "coupon_rankdatetime" r
+        SET "rank_datetime" = c.coupon_create_datetime
+                + interval '1 day' * (15 * COALESCE(shares.count, 0)
+                    + 3 * COALESCE(prints.count, 0)),
+            "is_dirty" = false
+        FROM "coupon_coupon" c
+        LEFT JOIN "coupon_couponaction" shares
+            ON shares.coupon_id = c.id
+            AND shares.action_id = 7
+        LEFT JOIN "coupon_couponaction" prints
+            ON prints.coupon_id = c.id
+            AND prints.action_id = 3
+        WHERE r.coupon_id = c.id
+        AND (r.is_dirty OR %(rebuild)s);""", {'rebuild': bool(rebuild)})
+    count = cursor.rowcount
+    LOG.debug('Recomputed %s rank datetimes.' % count)
+    return count
+
+@transaction.commit_on_success
+def write_coupon_actions(coupon_counts, consumer_actions, subscriber_actions):
+    """ Write these coupon action counts, a dict of (action_id, coupon_id) to
+    the count to add, and these sets of (action_id, coupon_id, consumer_id) and
+    (action_id, coupon_id, subscriber_id) in one transaction.
+    
+    Consumer and subscriber actions already recorded, or for coupons,
+    consumers or subscribers that do not exist, are skipped. Text blasts
+    written are counted in the subscriber blast counts of this month.
+    """
+    cursor = connection.cursor()
+    # Sorted, so concurrent flushes reach rows in the same order.
+    values, params = build_values(sorted([key + (count,)
+        for key, count in coupon_counts.iteritems()]))
+    cursor.execute("""
+        INSERT INTO "coupon_couponaction" ("action_id", "coupon_id", "count")
+        SELECT v.action_id, v.coupon_id, 0
+        FROM (VALUES %(values)s) AS v (action_id, coupon_id, count)
+        JOIN "coupon_coupon" c
+            ON c.id = v.coupon_id
+        WHERE NOT EXISTS (
+            SELECT 1
+            FROM "coupon_couponaction" ca
+            WHERE ca.action_id = v.action_id
+            AND ca.coupon_id = v.coupon_id
+            );
+        UPDATE "coupon_couponaction" ca
+        SET "count" = ca.count + v.count
+        FROM (VALUES %(values)s) AS v (action_id, coupon_id, count)
+        WHERE ca.action_id = v.action_id
+        AND ca.coupon_id = v.coupon_id;""" % {'values': values},
+        params + params)
+    if consumer_actions:
+        values, params = build_values(sorted(consumer_actions))
+        cursor.execute("""
+        INSERT INTO "coupon_consumeraction" (
+            "action_id", "coupon_id", "consumer_id", "create_datetime")
+        SELECT v.action_id, v.coupon_id, v.consumer_id, now()
+        FROM (VALUES %s) AS v (action_id, coupon_id, consumer_id)
+        JOIN "coupon_coupon" c
+            ON c.id = v.coupon_id
+        JOIN "consumer_consumer" con
+            ON con.user_ptr_id = v.consumer_id
+        WHERE NOT EXISTS (
+            SELECT 1
+            FROM "coupon_consumeraction" ca
+            WHERE ca.action_id = v.action_id
+            AND ca.consumer_id = v.consumer_id
+            AND ca.coupon_id = v.coupon_id
+            );""" % values, params)
+    if subscriber_actions:
+        values, params = build_values(sorted(subscriber_actions))
+        cursor.execute("""
+        INSERT INTO "coupon_subscriberaction" (
+            "action_id", "coupon_id", "subscriber_id", "create_datetime")
+        SELECT v.action_id, v.coupon_id, v.subscriber_id, now()
+        FROM (VALUES %s) AS v (action_id, coupon_id, subscriber_id)
+        JOIN "coupon_coupon" c
+            ON c.id = v.coupon_id
+        JOIN "subscriber_subscriber" s
+            ON s.id = v.subscriber_id
+        WHERE NOT EXISTS (
+            SELECT 1
+            FROM "coupon_subscriberaction" sa
+            WHERE sa.action_id = v.action_id
+            AND sa.subscriber_id = v.subscriber_id
+            AND sa.coupon_id = v.coupon_id
+            )
+        RETURNING "action_id", "subscriber_id";""" % values, params)
+        blasted_subscriber_ids = set([subscriber_id
+            for action_id, subscriber_id in cursor.fetchall()
+            if action_id == BLAST_ACTION_ID])
+        if blasted_subscriber_ids:
+            add_subscriber_blasts(cursor, blasted_subscriber_ids)
+    ranked_coupon_ids = set([coupon_id for action_id, coupon_id
+        in coupon_counts if action_id in RANKED_ACTION_IDS])
+    if ranked_coupon_ids:
+        mark_rank_datetimes_dirty(cursor, ranked_coupon_ids)
+    return ranked_coupon_ids
+
+
+class CouponActionBuffer(TimedBuffer):
+    """ Buffers the coupon actions recorded in this process, so that many
+    views, clicks and prints of a coupon are one increment of its count, and
+    writes them in one transaction when it is due to flush.
+    
+    Actions buffered when a worker is killed are lost; these are counters, not
+    a ledger.
+    """
+    def __init__(self, flush_size=COUPON_ACTION_FLUSH_SIZE,
+            flush_seconds=COUPON_ACTION_FLUSH_SECONDS):
+        super(CouponActionBuffer, self).__init__(flush_size, flush_seconds)
+
+    def __len__(self):
+        return (len(self.coupon_counts) + len(self.consumer_actions) +
+            len(self.subscriber_actions))
+
+    def reset(self):
+        """ Empty this buffer. """
+        self.coupon_counts = {}
+        self.consumer_actions = set()
+        self.subscriber_actions = set()
+
+    def add(self, action_id, coupon_ids, consumer_id=None,
+            subscriber_id=None):
+        """ Buffer an action on these coupons, by this consumer or subscriber
+        if given, and flush if due.
+        """
+        with self.lock:
+            for coupon_id in coupon_ids:
+                key = (int(action_id), int(coupon_id))
+                self.coupon_counts[key] = self.coupon_counts.get(key, 0) + 1
+                if consumer_id:
+                    self.consumer_actions.add(key + (int(consumer_id),))
+                if subscriber_id:
+                    self.subscriber_actions.add(key + (int(subscriber_id),))
+        self.added()
+
+    def take(self):
+        """ Return the buffered coupon counts, consumer actions and subscriber
+        actions, and reset.
+        """
+        batch = (self.coupon_counts, self.consumer_actions,
+            self.subscriber_actions)
+        self.reset()
+        return batch
+
+    def write(self, batch):
+        """ Write these buffered actions. If coupons were printed or shared,
+        their rank datetimes are marked dirty and a recompute is queued.
+        """
+        coupon_counts, consumer_actions, subscriber_actions = batch
+        if not coupon_counts:
+            return
+        try:
+            ranked_coupon_ids = write_coupon_actions(coupon_counts,
+                consumer_actions, subscriber_actions)
+        except IntegrityError:
+            # Another process inserted one of these coupon actions first.
+            LOG.info('Retrying write of coupon actions.')
+            ranked_coupon_ids = write_coupon_actions(coupon_counts,
+                consumer_actions, subscriber_actions)
+        LOG.debug('Flushed %s coupon action counts.' % len(coupon_counts))
+        if ranked_coupon_ids:
+            from coupon.tasks import UPDATE_RANK_DATETIMES
+            UPDATE_RANK_DATETIMES.delay()
+
+COUPON_ACTION_BUFFER = CouponActionBuffer()
+# Write what is buffered when a worker exits cleanly.
+atexit.register(COUPON_ACTION_BUFFER.flush)
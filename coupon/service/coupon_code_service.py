@@ -1,7 +1,8 @@
 """ Service functions for CouponCode model. """
 
-from django.db import IntegrityError, transaction
+from django.db import IntegrityError, connection, transaction
 
+from coupon.config import COUPON_CODE_BATCH_SIZE, MAX_COUPON_CODE_ATTEMPTS
 from coupon.models import CouponCode
 from common.utils import normalize_code, random_code_generator
 
@@ -14,30 +15,75 @@ def check_coupon_code(coupon, code):
         return -1
     return coupon_code.used_count
 
-@transaction.commit_manually
-def create_coupon_code(coupon, *args, **kwargs):
-    """ Create a coupon_code for this coupon. """
-    coupon_code = CouponCode()
-    coupon_code.coupon = coupon
-    coupon_code.code = random_code_generator(*args, **kwargs)
-    # Codes are required to be unique per coupon.
-    # If they collide, try once more only.
-    try:
-        coupon_code.save()
-    except IntegrityError:
-        transaction.rollback()
-        coupon_code.code = random_code_generator(*args, **kwargs)
-        coupon_code.save()
-    transaction.commit()
-    return coupon_code
-    
+@transaction.commit_on_success
+def insert_coupon_codes(coupon, codes):
+    """ Insert these codes for this coupon in one statement, skipping codes
+    this coupon already has. Return the inserted (id, code) rows.
+    """
+    cursor = connection.cursor()
+    cursor.execute("""
+        INSERT INTO "coupon_couponcode" ("coupon_id", "code", "used_count")
+        SELECT %%s, v.code, 0
+        FROM (VALUES %s) AS v (code)
+        WHERE NOT EXISTS (
+            SELECT 1
+            FROM "coupon_couponcode" cc
+            WHERE cc.coupon_id = %%s
+            AND cc.code = v.code
+            )
+        RETURNING "id", "code";""" % ', '.join(['(%s)'] * len(codes)),
+        [coupon.id] + list(codes) + [coupon.id])
+    return cursor.fetchall()
+
 def create_multiple_coupon_codes(coupon, count, *args, **kwargs):
-    """ For this coupon create n coupon_codes. """
+    """ For this coupon create count coupon_codes, in batched inserts.
+    
+    Codes are required to be unique per coupon. Codes the coupon already has
+    are rejected by the insert, and only those are generated again.
+    """
     coupon_code_set = []
-    x = 0
-    while x < count:
-        coupon_code = create_coupon_code(coupon, *args, **kwargs)
-        coupon_code_set.append(coupon_code)
-        x += 1
+    attempts = 0
+    while len(coupon_code_set) < count:
+        if attempts == MAX_COUPON_CODE_ATTEMPTS:
+            raise IntegrityError(
+                'Could not create %s unique codes for coupon %s' % (count,
+                coupon.id))
+        attempts += 1
+        codes = set()
+        while len(codes) < count - len(coupon_code_set):
+            codes.add(random_code_generator(*args, **kwargs))
+        try:
+            rows = insert_coupon_codes(coupon, codes)
+        except IntegrityError:
+            # Another process inserted one of these codes first; try again.
+            continue
+        coupon_code_set += [CouponCode(id=coupon_code_id, coupon=coupon,
+            code=code) for coupon_code_id, code in rows]
     return coupon_code_set
 
+def create_coupon_code(coupon, *args, **kwargs):
+    """ Create a coupon_code for this coupon. """
+    return create_multiple_coupon_codes(coupon, 1, *args, **kwargs)[0]
+
+
+class CouponCodePool(object):
+    """ Draws coupon codes for a coupon, creating them in batches of
+    batch_size, for sending a coupon to many recipients.
+    
+    The arguments after batch_size are those of random_code_generator.
+    """
+    def __init__(self, coupon, batch_size=COUPON_CODE_BATCH_SIZE, *args,
+            **kwargs):
+        self.coupon = coupon
+        self.batch_size = batch_size
+        self.args = args
+        self.kwargs = kwargs
+        self.coupon_codes = []
+
+    def draw(self):
+        """ Return an unused coupon_code for this coupon. """
+        if not self.coupon_codes:
+            self.coupon_codes = create_multiple_coupon_codes(self.coupon,
+                self.batch_size, *self.args, **self.kwargs)
+            self.coupon_codes.reverse()
+        return self.coupon_codes.pop()
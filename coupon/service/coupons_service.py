@@ -6,9 +6,12 @@ Ex: (site_coupons, bulk_coupons, all_coupons_this_business...)
 import datetime
 import logging
 
+from django.core.cache import cache
+from django.db import connection
+
 from advertiser.models import Location
 from common.utils import uniquify_sequence
-from coupon.models import Coupon, Slot
+from coupon.models import Coupon
 
 LOG = logging.getLogger('ten.%s' % __name__)
 LOG.setLevel(logging.ERROR)
@@ -20,10 +23,10 @@ class AllCoupons(object):
 
     def get_all_coupons(self, site):
         """ Return all_coupons for this site and coupon_ids. """
-        coupon_ids = self.get_site_coupons(site, max_results=200)
-        coupon_ids, all_coupons = SORT_COUPONS.sorted_coupons(coupon_ids,
-            presorted=True)
-        self.join_coupon_with_locations(coupon_ids, all_coupons)
+        listing = self.get_site_listing(site)
+        coupon_ids, all_coupons = SORT_COUPONS.sorted_coupons(
+            listing['coupon_ids'], presorted=True)
+        self.set_location_lists(all_coupons, listing['location_lists'])
         return all_coupons, coupon_ids
     
     def get_site_coupons(self, site, max_results=20):
@@ -31,9 +34,15 @@ class AllCoupons(object):
         Return a list of coupon ids that are eligible to be displayed on this
         site.
         """
-        coupon_ids = list(Coupon.current_coupons.get_current_coupons_by_site(
-            site).values_list('id', flat=True))
-        coupon_ids = SORT_COUPONS.sort_coupon_ids(coupon_ids)
+        coupon_ids = SORT_COUPONS.sort_coupon_ids(list(
+            Coupon.current_coupons.get_current_coupons_by_site(
+                site).values_list('id', flat=True)))
+        return self.add_filler_coupons(site, coupon_ids, max_results)
+
+    def add_filler_coupons(self, site, coupon_ids, max_results):
+        """ Append media partner coupons of this site to this list of coupon
+        ids, then national coupons until there are max_results.
+        """
         media_partner_coupons = list(self.get_media_partner_coupons(site
             ).values_list('id', flat=True))
         coupon_ids += media_partner_coupons
@@ -44,6 +53,69 @@ class AllCoupons(object):
             coupon_ids += national_coupons
         return coupon_ids
 
+    @staticmethod
+    def get_listing_cache_key(site_id):
+        """ Return the cache key of the coupon listing of this site. """
+        return 'site-%s-coupon-listing' % site_id
+
+    def build_site_listing(self, site):
+        """ Build the listing of coupons displayed on this site, as a dict:
+            slot_coupon_ids: current coupons of this site, in display order.
+            coupon_ids: those plus media partner and national filler coupons.
+            location_lists: coupon id -> display string of its cities.
+        """
+        slot_coupon_ids = SORT_COUPONS.sort_coupon_ids(list(
+            Coupon.current_coupons.get_current_coupons_by_site(
+                site).values_list('id', flat=True)))
+        coupon_ids = uniquify_sequence(self.add_filler_coupons(site,
+            slot_coupon_ids[:], max_results=200))
+        location_lists = {}
+        for coupon_id, cities in self.build_coupon_location_list(
+                coupon_ids).items():
+            if cities:
+                location_lists[coupon_id] = ','.join(cities).replace(',', ', ')
+        return {'slot_coupon_ids': slot_coupon_ids, 'coupon_ids': coupon_ids,
+            'location_lists': location_lists}
+
+    def set_site_listing(self, site):
+        """ Build the coupon listing of this site and put it in cache until the
+        next hour boundary, when current coupons can change.
+        """
+        listing = self.build_site_listing(site)
+        now = datetime.datetime.now()
+        next_hour = now.replace(minute=0, second=0, microsecond=0) + \
+            datetime.timedelta(hours=1)
+        cache.set(self.get_listing_cache_key(site.id), listing,
+            max(1, (next_hour - now).seconds))
+        return listing
+
+    def get_site_listing(self, site):
+        """ Return the coupon listing of this site from cache, building it if
+        needed.
+        """
+        listing = cache.get(self.get_listing_cache_key(site.id))
+        if listing is None:
+            listing = self.set_site_listing(site)
+        return listing
+
+    def get_listed_coupon_ids(self, sites):
+        """ Return the current coupon ids of the listings of these sites. """
+        listings = cache.get_many([self.get_listing_cache_key(site.id)
+            for site in sites])
+        coupon_ids = []
+        for site in sites:
+            listing = listings.get(self.get_listing_cache_key(site.id))
+            if listing is None:
+                listing = self.set_site_listing(site)
+            coupon_ids += listing['slot_coupon_ids']
+        return uniquify_sequence(coupon_ids)
+
+    def clear_site_listings(self, site_ids):
+        """ Drop the coupon listings of these sites, to be rebuilt on next use.
+        """
+        cache.delete_many([self.get_listing_cache_key(site_id)
+            for site_id in site_ids])
+
     @staticmethod
     def get_bulk_coupons(zip_postals=None, excluding=None):
         """
@@ -127,6 +199,15 @@ class AllCoupons(object):
                     'location_city'].title())]
         return temp_loc_dict
 
+    @staticmethod
+    def set_location_lists(coupons, location_lists):
+        """ Set the location_list of these coupons from this dict of location
+        display strings by coupon id.
+        """
+        for coupon in coupons:
+            if location_lists.get(getattr(coupon, 'id', None), None):
+                coupon.location_list = location_lists[coupon.id]
+
     def join_coupon_with_locations(self, coupon_ids, all_coupons):
         """ Associate all the locations for these coupons that we are about to
         display. """
@@ -153,9 +234,9 @@ class SortCoupons(object):
         coupons = Coupon.objects.filter(id__in=sorted_coupon_ids
             ).select_related('coupon_type', 'offer', 'offer__business')
         # Convert QuerySet to a sorted list of coupons.
-        sorted_coupons_ = sorted_coupon_ids[:]
-        for coupon in coupons:
-            sorted_coupons_[sorted_coupon_ids.index(coupon.id)] = coupon
+        coupons_by_id = dict((coupon.id, coupon) for coupon in coupons)
+        sorted_coupons_ = [coupons_by_id.get(coupon_id, coupon_id)
+            for coupon_id in sorted_coupon_ids]
         return sorted_coupon_ids, sorted_coupons_
     
     @staticmethod
@@ -167,29 +248,46 @@ class SortCoupons(object):
          3) Date created + 15 days/fb like, + 3 days/print, newest first.
             - This part of the formula is now precomputed and stored in
             coupon.rank_datetime.rank_datetime.
+        All three tiers are ranked in one query.
         """
         if not len(coupon_ids):
             return []
-        coupons_placed_today = list(Coupon.objects.filter(id__in=coupon_ids,
-            coupon_create_datetime__gt=datetime.date.today()).values_list(
-            'id', flat=True).order_by('-coupon_create_datetime'))
-        LOG.debug('coupons_placed_today: %s' % coupons_placed_today)
-        coupons_in_flyer = list(Coupon.objects.filter(id__in=coupon_ids,
-            slot_time_frames__slot__id__in=Slot.current_slots.filter(
-                flyer_placements__send_date__gt=datetime.date.today(),
-                flyer_placements__send_date__lte=datetime.date.today() +
-                    datetime.timedelta(7))).values_list(
-            'id', flat=True).order_by('-coupon_create_datetime'))
-        LOG.debug('coupons_in_flyer: %s' % coupons_in_flyer)
-        coupons_rank_dated = list(Coupon.objects.filter(
-            id__in=coupon_ids).values_list(
-            'id', flat=True).order_by('-rank_datetime__rank_datetime'))
-        LOG.debug('coupons_rank_dated: %s' % coupons_rank_dated)
-        sorted_coupon_ids = []
-        for coupon_id in (coupons_placed_today + coupons_in_flyer +
-                coupons_rank_dated):
-            if coupon_id not in sorted_coupon_ids:
-                sorted_coupon_ids.append(coupon_id)
+        today = datetime.date.today()
+        cursor = connection.cursor()
+        cursor.execute("""
+SELECT ranked.id
+FROM (
+    SELECT c.id,
+        c.coupon_create_datetime,
+        r.rank_datetime,
+        CASE WHEN c.coupon_create_datetime > %(today)s THEN 1
+            WHEN EXISTS (
+                SELECT 1
+                FROM coupon_slottimeframe stf
+                JOIN coupon_slot s
+                    ON stf.slot_id = s.id
+                    AND s.start_date <= %(today)s
+                    AND s.end_date >= %(today)s
+                JOIN coupon_flyerplacement fp
+                    ON fp.slot_id = s.id
+                    AND fp.send_date > %(today)s
+                    AND fp.send_date <= %(next_week)s
+                WHERE stf.coupon_id = c.id) THEN 2
+            ELSE 3
+        END AS tier
+    FROM coupon_coupon c
+    LEFT JOIN coupon_rankdatetime r
+        ON r.coupon_id = c.id
+    WHERE c.id IN %(coupon_ids)s
+    ) ranked
+ORDER BY ranked.tier,
+    CASE WHEN ranked.tier = 3 THEN ranked.rank_datetime
+        ELSE ranked.coupon_create_datetime
+    END DESC,
+    ranked.id DESC
+""", {'today': today, 'next_week': today + datetime.timedelta(7),
+            'coupon_ids': tuple(coupon_ids)})
+        sorted_coupon_ids = [row[0] for row in cursor.fetchall()]
         LOG.debug('sorted_coupon_ids: %s' % sorted_coupon_ids)
         return sorted_coupon_ids
     
@@ -4,15 +4,20 @@ For functions specific to creating flyers, see flyer_create_service.py.
 """
 import datetime
 import logging
+import time
 
 from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
+from django.core import mail
 from django.db import connection, transaction
 from django.db.models import Q
 
 from common.utils import format_date_for_dsp
+from coupon.config import (FLYER_SEND_CHUNK_SIZE, FLYER_SEND_CONCURRENCY,
+    FLYER_SEND_POLL_SECONDS, FLYER_SEND_STALE_SECONDS,
+    SMTP_RELAY_CONNECTION_CAPS)
 from coupon.models import (Coupon, Flyer, FlyerCoupon, FlyerPlacement,
-    FlyerSubject, FlyerPlacementSubdivision)
+    FlyerSubject, FlyerPlacementSubdivision, Slot)
 from ecommerce.models import OrderItem
 from email_gateway.send import send_email
 from firestorm.tasks import UPDATE_CONSUMER_BONUS_POOL
@@ -396,24 +401,28 @@ def get_flyer_positions_available(flyer_placements):
 
 def record_flyer_consumers(flyer, consumer_ids):
     """
-    Record that this flyer was sent to these consumers.
+    Record that this flyer was sent to these consumers, a chunk of recipients,
+    in one multi-row insert. A consumer already recorded for this flyer, as
+    when a chunk is sent again on resuming, is skipped by a lookup on the
+    unique index of flyer and consumer.
     """
-    if type(consumer_ids) != tuple or len(consumer_ids) == 0:
+    consumer_ids = list(consumer_ids)
+    if not consumer_ids:
         return
     cursor = connection.cursor()
     cursor.execute("""
         INSERT INTO "coupon_flyerconsumer" ("flyer_id", "consumer_id")
-        SELECT %(flyer_id)s, "user_ptr_id"
-        FROM "consumer_consumer"
-        WHERE "user_ptr_id" IN %(consumer_ids)s
-        AND "user_ptr_id" NOT IN (
-            SELECT "consumer_id"
-            FROM "coupon_flyerconsumer"
-            WHERE "flyer_id" = %(flyer_id)s
-            AND "consumer_id" IN %(consumer_ids)s
-            );""", {'flyer_id': flyer.id, 'consumer_ids': consumer_ids})
+        SELECT %%s, recipient.consumer_id
+        FROM (VALUES %s) AS recipient (consumer_id)
+        JOIN "consumer_consumer" ON "user_ptr_id" = recipient.consumer_id
+        WHERE NOT EXISTS (
+            SELECT 1
+            FROM "coupon_flyerconsumer" flyer_consumer
+            WHERE flyer_consumer."flyer_id" = %%s
+            AND flyer_consumer."consumer_id" = recipient.consumer_id
+            );""" % ', '.join(['(%s)'] * len(consumer_ids)),
+        [flyer.id] + consumer_ids + [flyer.id])
     transaction.commit_unless_managed()
-    return
 
 def update_order_item_sent_coupons(flyer):
     """
@@ -423,67 +432,153 @@ def update_order_item_sent_coupons(flyer):
     This coupon might belong to multiple slots.
     This slot might have several outstanding flyer placement purchases, choose 
     the first of them.
+
+    The order items of every coupon of the flyer are moved in one statement.
+    A flyer coupon that already has an order item does not get another, so
+    this is safe to repeat for a flyer. Items of locked orders are not moved.
     """
-    flyer_coupon_content_type = ContentType.objects.get(
-        app_label='coupon', model='flyercoupon')
-    for flyer_coupon in flyer.flyer_coupons.all():
-        # What is the min flyer placement order id of the slot, if any?
-        try:
-            order_item = OrderItem.objects.filter(
-                item_id__in=flyer_coupon.coupon.slot_time_frames.all(
-                    ).values_list('id', flat=True),
-                product=1,
-                content_type=ContentType.objects.get(
-                    app_label='coupon', model='slot')).order_by('id')[0]
-            order_item.content_type = flyer_coupon_content_type
-            order_item.item_id = flyer_coupon.id
-            order_item.save()
-            LOG.debug('updated order_item %s' % order_item)
-        except IndexError:
-            pass
+    cursor = connection.cursor()
+    cursor.execute("""
+        UPDATE ecommerce_orderitem
+        SET content_type_id = %(flyer_coupon_type_id)s,
+            item_id = placement.flyer_coupon_id
+        FROM (
+            SELECT DISTINCT ON (order_item_id) order_item_id, flyer_coupon_id
+            FROM (
+                SELECT fc.id AS flyer_coupon_id,
+                    MIN(slot_item.id) AS order_item_id
+                FROM coupon_flyercoupon fc
+                JOIN coupon_slottimeframe stf ON stf.coupon_id = fc.coupon_id
+                JOIN ecommerce_orderitem slot_item
+                    ON slot_item.item_id = stf.slot_id
+                    AND slot_item.product_id = 1
+                    AND slot_item.content_type_id = %(slot_type_id)s
+                JOIN ecommerce_order o ON o.id = slot_item.order_id
+                WHERE fc.flyer_id = %(flyer_id)s
+                    AND NOT o.is_locked
+                    AND NOT EXISTS (
+                        SELECT 1
+                        FROM ecommerce_orderitem sent_item
+                        WHERE sent_item.content_type_id =
+                                %(flyer_coupon_type_id)s
+                            AND sent_item.item_id = fc.id
+                        )
+                GROUP BY fc.id
+                ) first_items
+            ORDER BY order_item_id, flyer_coupon_id
+            ) placement
+        WHERE ecommerce_orderitem.id = placement.order_item_id;""", {
+            'flyer_id': flyer.id,
+            'slot_type_id': ContentType.objects.get_for_model(Slot).id,
+            'flyer_coupon_type_id':
+                ContentType.objects.get_for_model(FlyerCoupon).id})
+    LOG.debug('moved %s order items to coupons of %s' % (cursor.rowcount,
+        flyer))
 
-def send_flyer(flyer, recipient=None, context=None):
+def get_flyer_consumers(flyer):
     """
-    For a flyer w/o subdivisions, grab a list of users from the site (opted-in, 
+    For a flyer w/o subdivisions, return the consumers of the site (opted-in,
     non-bouncing, etc.). This could be a flyer for a site in phase 1, or a site
     in phase 2 that did not sell any subdivisions for this week.
     
     For a flyer with subdivisions, filter these consumers by those that have a
     zip code matching a flyer subdivision, or have a zip code that is in a
     county matching a flyer subdivision.
+    """
+    consumers = flyer.site.get_flyer_recipients().filter(is_active=True)
+    if flyer.flyer_subdivisions.all():
+        flyer_sub_zips = USZip.objects.filter(
+            id__in=flyer.flyer_subdivisions.filter(
+                    geolocation_type=ContentType.objects.get(model='uszip')
+                ).values_list('geolocation_id', flat=True)
+            ).values_list('code', flat=True)
+        flyer_sub_city_zips = USZip.objects.filter(
+            us_city__id__in=flyer.flyer_subdivisions.filter(
+                    geolocation_type=ContentType.objects.get(
+                        model='uscity')
+                ).values_list('geolocation_id', flat=True)
+            ).values_list('code', flat=True)
+        flyer_sub_county_zips = USZip.objects.filter(
+            us_county__id__in=flyer.flyer_subdivisions.filter(
+                    geolocation_type=ContentType.objects.get(
+                        model='uscounty')
+                ).values_list('geolocation_id', flat=True)
+            ).values_list('code', flat=True)
+        consumers = consumers.filter(
+            consumer_zip_postal__in= flyer_sub_zips | flyer_sub_city_zips |
+                flyer_sub_county_zips )
+    return consumers
+
+def get_recipient_chunks(consumers, after_consumer_id=0, chunk_size=None):
+    """
+    Generate lists of (consumer id, email) tuples from these consumers, in
+    consumer id order, starting after after_consumer_id.
+    
+    Each chunk is its own query, seeking on the primary key rather than using an
+    offset, so only one chunk of recipients is ever held in memory no matter
+    how large the market is.
+    """
+    if not chunk_size:
+        chunk_size = FLYER_SEND_CHUNK_SIZE
+    while True:
+        chunk = list(consumers.filter(id__gt=after_consumer_id).order_by(
+            'id').values_list('id', 'email')[:chunk_size])
+        if not chunk:
+            break
+        yield chunk
+        after_consumer_id = chunk[-1][0]
+
+def send_flyer_chunks(flyer, consumers, template, context, chunk_size=None):
+    """
+    Send this flyer to these consumers a chunk at a time, over one SMTP
+    connection.
+    
+    After each chunk the recipients are recorded as flyer consumers and the
+    last consumer id is saved as flyer.send_checkpoint, with a send_heartbeat
+    to show the send is alive, so a send that dies
+    part way through picks up from the chunk after the checkpoint instead of
+    starting over. At worst the chunk that was in flight is sent again.
+    
+    Returns the number of consumers this flyer has been sent to, including any
+    sent to before a resume.
+    """
+    mail_connection = mail.get_connection()
+    mail_connection.open()
+    try:
+        for chunk in get_recipient_chunks(consumers, flyer.send_checkpoint,
+                chunk_size):
+            LOG.debug('sending flyer %s to consumers %s through %s' % (
+                flyer.id, chunk[0][0], chunk[-1][0]))
+            context.update({
+                'to_email': [email for consumer_id, email in chunk]})
+            send_email(template, flyer.site, context,
+                connection=mail_connection)
+            record_flyer_consumers(flyer,
+                [consumer_id for consumer_id, email in chunk])
+            flyer.send_checkpoint = chunk[-1][0]
+            flyer.send_heartbeat = datetime.datetime.now()
+            Flyer.objects.filter(id=flyer.id).update(
+                send_checkpoint=flyer.send_checkpoint,
+                send_heartbeat=flyer.send_heartbeat)
+            transaction.commit_unless_managed()
+    finally:
+        mail_connection.close()
+    return flyer.flyer_consumers.count()
+
+def send_flyer(flyer, recipient=None, context=None):
+    """
+    Send this flyer to recipient, or, if there is no recipient, to the consumers
+    of its site and subdivisions (see get_flyer_consumers).
     
     Concatenate the coupons into a context dictionary. 
-    Pass info into send.multi.
+    Recipients are streamed from the database in chunks and sent through
+    send_email (see send_flyer_chunks). A flyer with a send_checkpoint resumes
+    after it.
     """
     if not context:
         context = dict()
-    num_flyer_recipients = 0
     if not recipient:
-        consumers = flyer.site.get_flyer_recipients().filter(is_active=True)
-        if flyer.flyer_subdivisions.all():
-            flyer_sub_zips = USZip.objects.filter(
-                id__in=flyer.flyer_subdivisions.filter(
-                        geolocation_type=ContentType.objects.get(model='uszip')
-                    ).values_list('geolocation_id', flat=True)
-                ).values_list('code', flat=True)
-            flyer_sub_city_zips = USZip.objects.filter(
-                us_city__id__in=flyer.flyer_subdivisions.filter(
-                        geolocation_type=ContentType.objects.get(
-                            model='uscity')
-                    ).values_list('geolocation_id', flat=True)
-                ).values_list('code', flat=True)
-            flyer_sub_county_zips = USZip.objects.filter(
-                us_county__id__in=flyer.flyer_subdivisions.filter(
-                        geolocation_type=ContentType.objects.get(
-                            model='uscounty')
-                    ).values_list('geolocation_id', flat=True)
-                ).values_list('code', flat=True)
-            consumers = consumers.filter(
-                consumer_zip_postal__in= flyer_sub_zips | flyer_sub_city_zips |
-                    flyer_sub_county_zips )
-        flyer_recipients = list(consumers.values_list('email', flat=True))
-        LOG.debug('flyer_recipients: %s' % flyer_recipients)
-        num_flyer_recipients = len(flyer_recipients)
+        consumers = get_flyer_consumers(flyer)
     num_this_flyer_coupons = flyer.flyer_coupons.count() 
     template = 'consumer_standard_flyer'
     week = flyer.create_datetime.isocalendar()[1]
@@ -507,21 +602,21 @@ def send_flyer(flyer, recipient=None, context=None):
         'flyer_coupons': flyer_coupons,
         'first_national': first_national,
     })
-    if num_flyer_recipients > 0:
-        LOG.info('sending flyer to %d consumers in site %s' % 
-            (len(flyer_recipients), flyer.site))
-        context.update({'to_email': flyer_recipients})
-        send_email(template, flyer.site, context)
-        flyer_sent(flyer=flyer, num_recipients=len(flyer_recipients))
-        update_order_item_sent_coupons(flyer)
-        record_flyer_consumers(flyer, 
-            tuple(consumers.values_list('id', flat=True)))
-        UPDATE_CONSUMER_BONUS_POOL.delay(flyer.id, flyer_recipients)
-    elif recipient:
+    if recipient:
         LOG.info('Sending flyer %s for site %s to %s' %
             (flyer.id, flyer.site, recipient))
         context.update({'to_email': recipient})
         send_email(template, flyer.site, context)
+    elif flyer.send_checkpoint or consumers.exists():
+        if flyer.send_checkpoint:
+            LOG.info('resuming flyer %s in site %s after consumer %s' % 
+                (flyer.id, flyer.site, flyer.send_checkpoint))
+        else:
+            LOG.info('sending flyer %s to consumers in site %s' % 
+                (flyer.id, flyer.site))
+        num_recipients = send_flyer_chunks(flyer, consumers, template, context)
+        flyer_sent(flyer=flyer, num_recipients=num_recipients)
+        UPDATE_CONSUMER_BONUS_POOL.delay(flyer.id)
     else:
         LOG.warning('Flyer for %s has no eligible recipients!!!' % 
             flyer.site.domain)
@@ -581,46 +676,134 @@ def get_national_text(flyer):
         'region': flyer.site.region
         }}
 
+def claim_flyer(flyer_id):
+    """
+    Mark this flyer as sending if, and only if, it is still unsent. The check
+    and the update are one statement, so of any number of concurrent callers
+    exactly one gets True.
+    """
+    claimed = Flyer.objects.filter(id=flyer_id, send_status='0').update(
+        send_status='1', send_heartbeat=datetime.datetime.now())
+    transaction.commit_unless_managed()
+    return claimed == 1
+
+def stale_send_q():
+    """ Return a Q of flyers whose sender has not claimed them or saved a
+    checkpoint for FLYER_SEND_STALE_SECONDS.
+    """
+    return Q(send_heartbeat=None) | Q(send_heartbeat__lt=
+        datetime.datetime.now() -
+        datetime.timedelta(seconds=FLYER_SEND_STALE_SECONDS))
+
+def claim_stale_flyer(flyer_id):
+    """
+    Take over this flyer for sending if, and only if, it is sending and its
+    sender has made no progress for FLYER_SEND_STALE_SECONDS. As with
+    claim_flyer, of any number of concurrent callers exactly one gets True.
+    """
+    claimed = Flyer.objects.filter(stale_send_q(), id=flyer_id,
+        send_status='1').update(send_heartbeat=datetime.datetime.now())
+    transaction.commit_unless_managed()
+    return claimed == 1
+
+def send_claimed_flyer(flyer):
+    """ Send this flyer, already claimed by claim_flyer, and return its row for
+    the flyer send report: [domain, number of recipients, seconds to send].
+    """
+    start_time = datetime.datetime.now()
+    LOG.info('Prepping flyer %s' % flyer.id)
+    context = get_national_text(flyer)
+    send_flyer(flyer=flyer, context=context)
+    duration = datetime.datetime.now() - start_time
+    return [flyer.site.domain, flyer.num_recipients, duration.seconds]
+
+def release_flyer(flyer_id):
+    """ Mark this flyer, left sending by a send that failed, as made no
+    progress, so that it may be resumed at once.
+    """
+    Flyer.objects.filter(id=flyer_id, send_status='1').update(
+        send_heartbeat=None)
+    transaction.commit_unless_managed()
+
+def get_flyer_send_concurrency():
+    """ Return how many flyers may send at once: FLYER_SEND_CONCURRENCY, capped
+    by what our SMTP relay allows. A relay not in SMTP_RELAY_CONNECTION_CAPS
+    gets one connection, as what it allows is not known.
+    """
+    return max(1, min(FLYER_SEND_CONCURRENCY, SMTP_RELAY_CONNECTION_CAPS.get(
+        getattr(settings, 'EMAIL_HOST', None), 1)))
+
+def collect_sent_flyers(pending, flyer_log):
+    """
+    Of pending, a dict of flyer id to when its send was queued, append the
+    report row of each flyer that has finished sending to flyer_log, and
+    return those still pending, as read from the flyers.
+
+    A flyer that failed, or made no progress for FLYER_SEND_STALE_SECONDS, is
+    no longer waited on; it is left for resume_flyers_this_week.
+    """
+    now = datetime.datetime.now()
+    stale_datetime = now - datetime.timedelta(seconds=FLYER_SEND_STALE_SECONDS)
+    still_pending = {}
+    for flyer_id, domain, send_status, num_recipients, send_heartbeat in \
+            Flyer.objects.filter(id__in=pending.keys()).values_list('id',
+                'site__domain', 'send_status', 'num_recipients',
+                'send_heartbeat'):
+        if send_status in ('2', '3'):
+            flyer_log.append([domain, num_recipients,
+                (now - pending[flyer_id]).seconds])
+        elif send_heartbeat is None or max(send_heartbeat,
+                pending[flyer_id]) < stale_datetime:
+            LOG.error('Flyer %s for %s failed or stopped sending.' % (
+                flyer_id, domain))
+        else:
+            still_pending[flyer_id] = pending[flyer_id]
+    return still_pending
+
 def send_flyers_this_week():
     """
     Check for approved flyers that have not been sent and are scheduled to be
-    send today, and pass each to send_flyer.
+    send today, and claim and send each one as a separate task.
+
+    Up to get_flyer_send_concurrency() flyers send at once; as each finishes the
+    next one starts. Each task records how its send went on its flyer, which is
+    polled here. When they are all done, the flyer send report goes out.
+    This waits on the tasks, so it should not be run within a celery worker.
     """
+    from coupon.tasks import SEND_FLYER
     LOG.debug('getting all valid flyers')
     send_date = datetime.date.today()
     flyers = Flyer.objects.filter(send_date=send_date, send_status='0',
         is_approved=True).order_by('site__id')
     flyer_log = []
-    total_recipients = 0
     subject = "Flyer send results for %s" % datetime.date.today()
     LOG.debug('got flyers, gonna do something with them')
-    if flyers:
+    flyer_ids = list(flyers.values_list('id', flat=True))
+    if flyer_ids:
         send_start_time = datetime.datetime.now()
-        for flyer in flyers:
-            # Make sure flyer is unsent and not currently sending
-            send_check_flyer = Flyer.objects.get(id=flyer.id)
-            if send_check_flyer.send_status == '0':
-                # Set status to "sending" to prevent double-taps
-                flyer.send_status = '1'
-                flyer.save()
-                flyer.start_time = datetime.datetime.now()
-                LOG.info('Prepping flyer %s' % flyer.id)
-                context = get_national_text(flyer)
-                send_flyer(flyer=flyer, context=context)
-                flyer.finish_time = datetime.datetime.now()
-                flyer.duration = flyer.finish_time - flyer.start_time
-                flyer_log.append([flyer.site.domain, flyer.num_recipients,
-                    flyer.duration.seconds])
-                total_recipients += flyer.num_recipients
-            else:
-                LOG.warning('Flyer %s seems to be sending/sent already!' % 
-                    flyer.id)
+        concurrency = get_flyer_send_concurrency()
+        pending = {}
+        for flyer_id in flyer_ids:
+            while len(pending) >= concurrency:
+                time.sleep(FLYER_SEND_POLL_SECONDS)
+                pending = collect_sent_flyers(pending, flyer_log)
+            if not claim_flyer(flyer_id):
+                LOG.warning('Flyer %s seems to be sending/sent already!' %
+                    flyer_id)
+                continue
+            pending[flyer_id] = datetime.datetime.now()
+            SEND_FLYER.delay(flyer_id, is_claimed=True)
+            pending = collect_sent_flyers(pending, flyer_log)
+        while pending:
+            time.sleep(FLYER_SEND_POLL_SECONDS)
+            pending = collect_sent_flyers(pending, flyer_log)
+        total_recipients = sum([row[1] for row in flyer_log])
         if total_recipients:
             total_duration = datetime.datetime.now() - send_start_time
             flyer_log.append(['Total', total_recipients, '%d (minutes) ' %
                 (total_duration.seconds/60)])
             subject = " %s flyers sent to %d markets on %s" % (
-                str(total_recipients), flyers.count(), datetime.date.today())
+                str(total_recipients), len(flyer_ids), datetime.date.today())
         message = ''
     else:
         message = "There are no unsent, approved flyers available to send."
@@ -632,45 +815,76 @@ def send_flyers_this_week():
                 'subject': subject, 'show_unsubscribe': False,
                 'flyer_log': flyer_log, 'warning': message})
 
+def resume_flyers_this_week():
+    """
+    Queue the resumption of approved flyers for today left sending by a send
+    that died: those whose sender has made no progress for
+    FLYER_SEND_STALE_SECONDS. Each is taken over by claim_stale_flyer in its
+    task, so a flyer still sending, or resumed by another caller, is not sent
+    twice; it picks up after its send_checkpoint. Return the ids queued.
+    """
+    from coupon.tasks import SEND_FLYER
+    flyer_ids = list(Flyer.objects.filter(stale_send_q(),
+        send_date=datetime.date.today(), send_status='1',
+        is_approved=True).order_by('site__id').values_list('id', flat=True))
+    for flyer_id in flyer_ids:
+        LOG.info('Resuming flyer %s' % flyer_id)
+        SEND_FLYER.delay(flyer_id, resume=True)
+    return flyer_ids
+
+@transaction.commit_on_success
 def flyer_sent(flyer, num_recipients):
     """
     Perform cleanup/maintenance operations after a successful flyer send.
     
     Set num_recipients on flyer.
     Set is_sent = True on flyer.
+    Move the order items of sent coupons to their flyer coupons.
     Updates service date on newly sent, paid coupons.
     
     Note: "recipients" here is a count of users that we sent to, not how many
     emails were actually received. 
+
+    All of this is done in one transaction, for every coupon of the flyer at
+    once. A flyer sent already keeps its send_datetime, so a retried send sets
+    the same service dates.
     """
+    if flyer.send_status != '2' or not flyer.send_datetime:
+        flyer.send_datetime = datetime.datetime.now()
     flyer.num_recipients = num_recipients
     flyer.send_status = '2'
-    flyer.send_datetime = datetime.datetime.now()
     flyer.save()
+    update_order_item_sent_coupons(flyer)
     LOG.debug('Checking/adding service dates for coupons in flyer %d' %
         flyer.id)
-    for flyer_coupon in flyer.flyer_coupons.all():
-        coupon_id = flyer_coupon.coupon.id
-        LOG.debug("checking on coupon %d" % coupon_id)
-        # See if the coupon has an order_item associated with it.
-        try:
-            order_item = OrderItem.objects.filter(item_id=coupon_id)[0]
-            # If so, see if the coupon has been sent before. If not, set the
-            # service date to now.
-            used_before = FlyerCoupon.objects.filter(coupon__id=coupon_id,
-                    flyer__send_status__gt=1)
-            if used_before:
-                LOG.debug('Coupon %d sent before, keeping original'
-                    ' service date: %s' % (coupon_id, order_item.end_datetime))
-            else:
-                LOG.debug("Adding current service date for item %d" % 
-                    coupon_id)
-                order_item.end_datetime = datetime.datetime.now()
-                order_item.save()
-        # If not, we don't worry about a service date.
-        except IndexError:
-            LOG.debug('Coupon %d has no order item associated, skipping' % 
-                coupon_id)
+    # The service date of an order item of a coupon is when it was first
+    # sent; a coupon sent before keeps its original service date.
+    cursor = connection.cursor()
+    cursor.execute("""
+        UPDATE ecommerce_orderitem
+        SET end_datetime = %(send_datetime)s
+        FROM coupon_flyercoupon fc, ecommerce_order o
+        WHERE ecommerce_orderitem.content_type_id = %(flyer_coupon_type_id)s
+            AND ecommerce_orderitem.item_id = fc.id
+            AND fc.flyer_id = %(flyer_id)s
+            AND o.id = ecommerce_orderitem.order_id
+            AND NOT o.is_locked
+            AND NOT EXISTS (
+                SELECT 1
+                FROM coupon_flyercoupon earlier_fc
+                JOIN coupon_flyer earlier ON earlier.id = earlier_fc.flyer_id
+                WHERE earlier_fc.coupon_id = fc.coupon_id
+                    AND earlier.send_status = '2'
+                    AND (earlier.send_datetime IS NULL
+                        OR earlier.send_datetime < %(send_datetime)s
+                        OR (earlier.send_datetime = %(send_datetime)s
+                            AND earlier.id < %(flyer_id)s))
+                );""", {
+            'flyer_id': flyer.id,
+            'send_datetime': flyer.send_datetime,
+            'flyer_coupon_type_id':
+                ContentType.objects.get_for_model(FlyerCoupon).id})
+    LOG.debug('set service dates of %s order items' % cursor.rowcount)
 
 def get_coupon_sent_dates(coupon_id):
     """
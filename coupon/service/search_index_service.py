@@ -0,0 +1,123 @@
+""" Service functions for preparing coupons for the search index in batches,
+and for queueing them to be sent to solr in bulk.
+"""
+import atexit
+import logging
+
+from django.db import connection
+
+from haystack.sites import site as haystack_site
+
+from common.buffer import TimedBuffer
+from coupon.config import COUPON_INDEX_FLUSH_SECONDS, COUPON_INDEX_FLUSH_SIZE
+from coupon.models import Coupon, SlotTimeFrame
+
+LOG = logging.getLogger('ten.%s' % __name__)
+LOG.setLevel(logging.ERROR)
+
+def get_coupon_site_ids(coupon_ids):
+    """ Return a dict of coupon id to the site id of a current slot time frame
+    of the coupon, for these coupons, in one query. Coupons without a current
+    slot time frame are left out.
+    """
+    site_ids = {}
+    for coupon_id, site_id in \
+            SlotTimeFrame.current_slot_time_frames.get_query_set().filter(
+                coupon__id__in=coupon_ids).order_by('id').values_list(
+                'coupon', 'slot__site'):
+        site_ids.setdefault(coupon_id, site_id)
+    return site_ids
+
+def get_coupon_category_ids(coupon_ids):
+    """ Return a dict of coupon id to the list of category ids of the business
+    of the coupon, for these coupons, in one query.
+    """
+    category_ids = dict([(coupon_id, []) for coupon_id in coupon_ids])
+    for coupon_id, category_id in Coupon.objects.filter(
+            id__in=coupon_ids).values_list('id', 'offer__business__categories'):
+        if category_id is not None:
+            category_ids[coupon_id].append(category_id)
+    return category_ids
+
+def index_coupons(coupon_ids):
+    """ Send these coupons to the search index in one batch. """
+    index = haystack_site.get_index(Coupon)
+    index.update_objects(Coupon.objects.select_related('offer',
+        'offer__business', 'custom_restrictions', 'coupon_type').filter(
+        id__in=coupon_ids))
+
+def get_id_ranges(min_id, max_id, count):
+    """ Return up to count (start, stop) ranges of ids, of about equal size,
+    that together cover min_id through max_id.
+    """
+    if min_id is None or max_id is None:
+        return []
+    step = max(1, (max_id - min_id + count) // count)
+    return [(start, min(start + step, max_id + 1))
+        for start in range(min_id, max_id + 1, step)]
+
+def reindex_id_range(id_range):
+    """ Send the coupons of the index queryset with ids in this (start, stop,
+    batch_size) range to the search index, batch_size at a time. Return how
+    many were sent. Run by each process of a parallel reindex.
+    """
+    start, stop, batch_size = id_range
+    # A forked process must not share the connection of its parent.
+    connection.close()
+    index = haystack_site.get_index(Coupon)
+    coupons = index.index_queryset().filter(id__gte=start,
+        id__lt=stop).order_by('id')
+    count = 0
+    while True:
+        batch = list(coupons.filter(id__gte=start)[:batch_size])
+        if not batch:
+            break
+        index.update_objects(batch)
+        count += len(batch)
+        start = batch[-1].id + 1
+    connection.close()
+    return count
+
+
+class CouponIndexBuffer(TimedBuffer):
+    """ Buffers the ids of coupons queued for search indexing in this process,
+    so that many saves of a coupon are one update, and sends them to solr in
+    one batch when it is due to flush.
+
+    Coupons buffered when a worker is killed are not indexed until they are
+    saved again or the index is rebuilt.
+    """
+    def __init__(self, flush_size=COUPON_INDEX_FLUSH_SIZE,
+            flush_seconds=COUPON_INDEX_FLUSH_SECONDS):
+        super(CouponIndexBuffer, self).__init__(flush_size, flush_seconds)
+
+    def __len__(self):
+        return len(self.coupon_ids)
+
+    def reset(self):
+        """ Empty this buffer. """
+        self.coupon_ids = set()
+
+    def add(self, coupon_ids):
+        """ Buffer these coupons, and flush if due. """
+        with self.lock:
+            self.coupon_ids.update([int(coupon_id)
+                for coupon_id in coupon_ids])
+        self.added()
+
+    def take(self):
+        """ Return the buffered coupon ids, and reset. """
+        coupon_ids = self.coupon_ids
+        self.reset()
+        return coupon_ids
+
+    def write(self, coupon_ids):
+        """ Send these coupons to the search index. """
+        if not coupon_ids:
+            return
+        index_coupons(sorted(coupon_ids))
+        LOG.debug('Flushed %s coupons to the search index.' % len(coupon_ids))
+
+COUPON_INDEX_BUFFER = CouponIndexBuffer()
+# Index what is buffered when a worker exits cleanly.
+atexit.register(COUPON_INDEX_BUFFER.flush)
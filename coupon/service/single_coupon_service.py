@@ -13,7 +13,6 @@ from coupon.models import Coupon, DefaultRestrictions, SlotTimeFrame
 from coupon.service.coupons_service import ALL_COUPONS
 from coupon.service.expiration_date_service import frmt_expiration_date_for_dsp
 from coupon.service.valid_days_service import VALID_DAYS
-from geolocation.models import USZip
 from market.service import get_current_site
 
 LOG = logging.getLogger('ten.%s' % __name__)
@@ -110,7 +109,7 @@ class SingleCoupon(object):
                     .filter(offer__business__id=coupon.offer.business.id)
                     .values_list('id', flat=True))
             if not coupon.id in coupon_ids:
-                zip_postals = list(USZip.objects.get_zips_this_site(site))
+                zip_postals = site.get_zip_codes()
                 if zip_postals:
                     coupon_ids += list(ALL_COUPONS.get_bulk_coupons(zip_postals)
                         .filter(offer__business__id=coupon.offer.business.id)
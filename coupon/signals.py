@@ -0,0 +1,42 @@
+""" Signals for models of coupon app """
+#pylint: disable=W0613
+import logging
+
+LOG = logging.getLogger('ten.%s' % __name__)
+LOG.setLevel(logging.ERROR)
+
+def get_listing_site_ids(sender, instance):
+    """ Return the ids of sites whose coupon listing this instance of a Coupon,
+    Slot, SlotTimeFrame or FlyerPlacement can change.
+    """
+    from coupon.models import Coupon, Slot, SlotTimeFrame
+    from market.models import Site
+    if sender is Coupon:
+        coupon_type_name = instance.coupon_type.coupon_type_name
+        if coupon_type_name == 'National':
+            # National coupons are filler on every site.
+            return Site.objects.values_list('id', flat=True)
+        site_ids = set(Slot.objects.filter(
+            slot_time_frames__coupon=instance).values_list('site_id',
+            flat=True))
+        if coupon_type_name == 'MediaPartner':
+            site_ids.update(Coupon.objects.filter(id=instance.id).values_list(
+                'offer__business__advertiser__site_id', flat=True))
+        return site_ids
+    if sender is SlotTimeFrame:
+        return Slot.objects.filter(id=instance.slot_id).values_list('site_id',
+            flat=True)
+    # Slot or FlyerPlacement.
+    return [instance.site_id]
+
+def coupon_listing_changed_callback(sender, instance, **kwargs):
+    """ Receive signal that a coupon, slot, slot time frame or flyer placement
+    was saved or is to be deleted, and drop the coupon listings it changes.
+    """
+    from coupon.service.coupons_service import ALL_COUPONS
+    LOG.debug('coupon_listing_changed_callback signal called')
+    if kwargs.get('raw', False):
+        # Loading fixtures: related rows may not be loaded yet. Listings are
+        # rebuilt on the hour.
+        return
+    ALL_COUPONS.clear_site_listings(get_listing_site_ids(sender, instance))
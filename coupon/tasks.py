@@ -10,8 +10,7 @@ from django.conf import settings
 from django.core import urlresolvers
 from django.core.exceptions import ValidationError
 from django.core.urlresolvers import reverse
-from django.db import IntegrityError, connection, transaction
-from django.db.models import Count, Sum
+from django.db.models import Count
 from django.utils import simplejson
 
 from celery.decorators import task
@@ -19,10 +18,14 @@ from celery.task import Task
 
 from advertiser.models import Advertiser, Business
 from common.utils import open_url
-from coupon.models import (Coupon, CouponAction, Action, RankDateTime,
-    SlotTimeFrame)
+from coupon.models import Coupon, CouponAction, Action, Flyer, SlotTimeFrame
+from coupon.service.coupon_action_service import (COUPON_ACTION_BUFFER,
+    update_rank_datetimes)
 from coupon.service.coupons_service import ALL_COUPONS, SORT_COUPONS
-from coupon.service.flyer_service import latest_flyer_datetime
+from coupon.service.search_index_service import COUPON_INDEX_BUFFER
+from coupon.service.flyer_service import (claim_flyer, claim_stale_flyer,
+    latest_flyer_datetime, release_flyer, resume_flyers_this_week,
+    send_claimed_flyer)
 from coupon.service.flyer_create_service import (create_flyer_this_site_phase1,
     create_flyers_this_site_phase2, min_days_past)
 from coupon.service.twitter_service import TWITTER_SERVICE
@@ -117,30 +120,26 @@ class CreateWidget(Task):
         """ Set mode an ordered_coupons when type_instance is a Site. """
         self.site = site
         self.widget['mode'] = 'markets', site.directory_name
-        ordered_coupons = Coupon.current_coupons. \
-            get_current_coupons_by_site(site).annotate(
-                action_sum=Sum('coupon_actions__count')).order_by(
-                '-start_date')
+        ordered_coupons = [coupon for coupon in SORT_COUPONS.sorted_coupons(
+            ALL_COUPONS.get_site_listing(site)['slot_coupon_ids'],
+            presorted=True)[1] if isinstance(coupon, Coupon)]
+        # Latest started first, then first created.
+        ordered_coupons.sort(key=lambda coupon: (
+            -coupon.start_date.toordinal(), coupon.id))
         if len(ordered_coupons):
             # Prefer coupons from distinct businesses.
-            # A little wonky until django gets "DISTINCT ON", but avoids raw sql.
-            _distinct_business_ids = []
-            _sorted_coupon_ids = []
-            while len(_sorted_coupon_ids) < 10:
-                for coupon in ordered_coupons:
-                    if coupon.offer.business.id not in _distinct_business_ids:
-                        _distinct_business_ids.append(coupon.offer.business.id)
-                        _sorted_coupon_ids.append(coupon.id)
-                break
-            if len(_sorted_coupon_ids) < 10:
-                _sorted_coupon_ids += list(
-                    ordered_coupons.exclude(
-                        id__in=_sorted_coupon_ids
-                    ).values_list(
-                        'id', flat=True)[:10 - len(_sorted_coupon_ids)])
-            LOG.debug('_sorted_coupon_ids: %s' % _sorted_coupon_ids)
-            self.widget['ordered_coupons'] = SORT_COUPONS.sorted_coupons(
-                coupon_ids=_sorted_coupon_ids, presorted=True)[1]
+            _distinct_business_ids = set()
+            _preferred_coupons = []
+            _other_coupons = []
+            for coupon in ordered_coupons:
+                if coupon.offer.business_id in _distinct_business_ids:
+                    _other_coupons.append(coupon)
+                else:
+                    _distinct_business_ids.add(coupon.offer.business_id)
+                    _preferred_coupons.append(coupon)
+            self.widget['ordered_coupons'] = (
+                _preferred_coupons + _other_coupons)[:10]
+            LOG.debug('ordered_coupons: %s' % self.widget['ordered_coupons'])
         else:
             self.widget['ordered_coupons'] = Coupon.objects.none()
 
@@ -259,150 +258,70 @@ def create_all_widgets():
     for site in Site.objects.all():
         CreateWidget().run(site)
 
+@task()
+def refresh_site_coupon_listings():
+    """ Rebuild the coupon listing of each site. Schedule this on the hour,
+    when the listings expire, so they are rebuilt here instead of on request.
+    """
+    for site in Site.objects.get_or_set_cache():
+        ALL_COUPONS.set_site_listing(site)
+
 
 class RecordAction(Task):
     """ Task class for recording an action for a coupon. """
 
-    @staticmethod
-    @transaction.commit_on_success
-    def do_raw_sql(action_id, coupon_id, consumer_id, subscriber_id):
-        """ Perform raw sql then commit or rollback. """
-        # This would be the ORM way, which takes 4 queries...
-        #coupon_action, created = CouponAction.objects.get_or_create(
-        #   action=action, coupon=coupon)
-        #coupon_action.increment_count()
-        cursor = connection.cursor()
-        cursor.execute("""
-            INSERT INTO "coupon_couponaction" ("action_id", "coupon_id",
-                "count")
-            SELECT %(action_id)s, "id", 0
-            FROM "coupon_coupon"
-            WHERE "id" = %(coupon_id)s
-            AND "id" NOT IN (
-                SELECT "coupon_id"
-                FROM "coupon_couponaction"
-                WHERE "action_id" = %(action_id)s
-                AND "coupon_id" = %(coupon_id)s
-                );
-
-            UPDATE "coupon_couponaction"
-            SET "count" = "count" + 1
-            WHERE "action_id" = %(action_id)s
-            AND "coupon_id" = %(coupon_id)s;""",
-            {
-                'action_id': action_id,
-                'coupon_id': coupon_id,
-            }
-            )
-        if consumer_id:
-            cursor.execute("""
-            INSERT INTO "coupon_consumeraction" (
-                "action_id", "coupon_id", "consumer_id", "create_datetime")
-            SELECT %(action_id)s, "id", %(consumer_id)s, now()
-            FROM "coupon_coupon"
-            WHERE "id" = %(coupon_id)s
-            AND "id" NOT IN (
-                SELECT "coupon_id"
-                FROM "coupon_consumeraction"
-                WHERE "action_id" = %(action_id)s
-                AND "consumer_id" = %(consumer_id)s
-                AND "coupon_id" = %(coupon_id)s
-                );""",
-            {
-                'action_id': action_id,
-                'coupon_id': coupon_id,
-                'consumer_id': consumer_id,
-            }
-            )
-        if subscriber_id:
-            cursor.execute("""
-            INSERT INTO "coupon_subscriberaction" (
-                "action_id", "coupon_id", "subscriber_id", "create_datetime")
-            SELECT %(action_id)s, "id", %(subscriber_id)s, now()
-            FROM "coupon_coupon"
-            WHERE "id" = %(coupon_id)s
-            AND "id" NOT IN (
-                SELECT "coupon_id"
-                FROM "coupon_subscriberaction"
-                WHERE "action_id" = %(action_id)s
-                AND "subscriber_id" = %(subscriber_id)s
-                AND "coupon_id" = %(coupon_id)s
-                );""",
-            {
-                'action_id': action_id,
-                'coupon_id': coupon_id,
-                'subscriber_id': subscriber_id,
-            }
-            )
-        try:
-            transaction.commit()
-        except IntegrityError:
-            transaction.rollback()
-
     def run(self, action_id, coupon_id, consumer_id=None, subscriber_id=None):
         """
-        Creates or increments a coupon action.
-        If consumer, creates or increments a consumer action.
-        If subscriber, creates or increments a subscriber action.
+        Increments a coupon action.
+        If consumer, creates a consumer action.
+        If subscriber, creates a subscriber action.
+        Actions are buffered by this worker and written in batches; a print or
+        share marks the rank_datetime of the coupon dirty when written.
         """
-        self.do_raw_sql(action_id, coupon_id, consumer_id, subscriber_id)
-        if action_id in [3, 7]:
-            rank_date_time, created = RankDateTime.objects.get_or_create(
-                coupon_id=coupon_id)
-            if not created:
-                rank_date_time.save()
+        COUPON_ACTION_BUFFER.add(action_id, [coupon_id], consumer_id,
+            subscriber_id)
         return
 
 @task(ignore_result=True)
 def record_action_multiple_coupons(action_id, coupon_ids, consumer_id=None):
     """
-    Creates or increments a coupon action for multiple coupons.
-    If consumer, creates or increments a consumer action for multiple coupons.
+    Increments a coupon action for multiple coupons.
+    If consumer, creates a consumer action for multiple coupons.
     """ 
     if not len(coupon_ids):
         return
-    cursor = connection.cursor()
-    cursor.execute("""
-        INSERT INTO "coupon_couponaction" ("action_id", "coupon_id", "count")
-        SELECT %s, "id", 0
-        FROM "coupon_coupon"
-        WHERE "id" IN %s
-        AND "id" NOT IN (
-            SELECT "coupon_id" 
-            FROM "coupon_couponaction"
-            WHERE "action_id" = %s
-            AND "coupon_id" IN %s
-            );
-        UPDATE "coupon_couponaction"
-        SET "count" = "count"+ 1
-        WHERE "action_id" = %s 
-        AND "coupon_id" IN %s;""", 
-        [action_id, coupon_ids, action_id, coupon_ids, action_id, coupon_ids]
-        )
-    if consumer_id:
-        cursor.execute("""
-        INSERT INTO "coupon_consumeraction" (
-            "action_id", "coupon_id", "consumer_id", "create_datetime")
-        SELECT %s, "id", %s, now() 
-        FROM "coupon_coupon"
-        WHERE "id" IN %s
-        AND "id" NOT IN (
-            SELECT "coupon_id" 
-            FROM "coupon_consumeraction"
-            WHERE "action_id" = %s
-            AND "consumer_id" = %s
-            AND "coupon_id" IN %s
-            );""", 
-        [action_id, consumer_id, coupon_ids, 
-         action_id, consumer_id, coupon_ids]
-        )
-    try:
-        transaction.commit_unless_managed()
-    except IntegrityError:
-        transaction.rollback()
+    COUPON_ACTION_BUFFER.add(action_id, coupon_ids, consumer_id)
     return
 
 
+class UpdateRankDateTimesTask(Task):
+    """ Recompute the rank datetimes of coupons printed or shared since the
+    last run, in one statement. Queued by each flush of coupon actions that
+    includes prints or shares.
+    """
+    ignore_result = True
+
+    def run(self):
+        """ Recompute dirty rank datetimes. """
+        return update_rank_datetimes()
+
+UPDATE_RANK_DATETIMES = UpdateRankDateTimesTask()
+
+
+class IndexCouponsTask(Task):
+    """ Index coupons that were saved. Coupons are buffered by this worker and
+    sent to solr in batches, when enough are held or on a timer. Queued by
+    the coupon search index when it is real time.
+    """
+    ignore_result = True
+
+    def run(self, coupon_ids):
+        """ Buffer these coupons to be indexed. """
+        COUPON_INDEX_BUFFER.add(coupon_ids)
+
+INDEX_COUPONS = IndexCouponsTask()
+
+
 class ExtendCouponExpirationDateTask(Task):
     """ Extend the expiration date of coupons that are expiring tomorrow. """
 
@@ -490,6 +409,50 @@ def create_flyers_this_week(send_date=None, test_mode=False):
             'subject': 'Create Flyers output', 
             'admin_data': admin_data})
         
+class SendFlyerTask(Task):
+    """ Send one flyer. send_flyers_this_week fans flyers out to this task, and
+    resume_flyers_this_week queues it to resume a flyer left sending.
+    """
+
+    @staticmethod
+    def run(flyer_id, resume=False, is_claimed=False):
+        """ Claim this flyer, unless the caller is_claimed it already, and send
+        it; or if resume, take it over from a send that died. Return the row
+        of the flyer send report for this flyer, or None if it was already
+        sending or sent. A send that fails releases the flyer to be resumed.
+        """
+        if is_claimed:
+            claimed = True
+        elif resume:
+            claimed = claim_stale_flyer(flyer_id)
+        else:
+            claimed = claim_flyer(flyer_id)
+        if not claimed:
+            LOG.warning('Flyer %s seems to be sending/sent already!' % 
+                flyer_id)
+            return None
+        try:
+            return send_claimed_flyer(Flyer.objects.get(id=flyer_id))
+        except Exception:
+            release_flyer(flyer_id)
+            raise
+
+SEND_FLYER = SendFlyerTask()
+
+
+class ResumeFlyersTask(Task):
+    """ Resume the flyers of today left sending by a send that died. Schedule
+    this to run every few minutes on flyer day.
+    """
+    ignore_result = True
+
+    @staticmethod
+    def run():
+        """ Queue stale flyers to be resumed. """
+        return resume_flyers_this_week()
+
+RESUME_FLYERS = ResumeFlyersTask()
+
 @task()
 def send_coupon_published_email(coupon, just_created=True, test_mode=False):
     """ Sends an email to all staff when a coupon gets published either from 
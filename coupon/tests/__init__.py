@@ -8,7 +8,7 @@ from coupon.tests.test_edit_preview_edit import (
     TestEditModePreviewEdit)
 from coupon.tests.test_flyer import (TestAppendCouponToFlyer,
     TestConditionallyAppendCoupon, TestGetNationalText, TestFlyerPhase2,
-    TestFlyer, TestGetCouponsForFlyer, TestSetPriorWeeks,
+    TestFlyer, TestSendFlyerChunks, TestGetCouponsForFlyer, TestSetPriorWeeks,
     TestAddFlyerSubdivision, TestGetAvailableFlyerDates)
 from coupon.tests.test_flyer_models import (TestFlyerModel,
     TestFlyerSubdivisionModel, TestFlyerPlacementModel,
@@ -19,9 +19,9 @@ from coupon.tests.test_restrictions_views import (TestCouponRestrictions,
     TestValidDays)
 from coupon.tests.test_search_coupons import (TestSearchNothing,
     TestSearchCategoryAndQuery, TestSearchCategory, TestSearchQuery,
-    TestSpellingSuggestion)
-from coupon.tests.test_service import (TestGetScheduledFlyer, TestService, 
-    TestCouponPerformance, TestSortCoupons)
+    TestSpellingSuggestion, TestPrepareCouponBatch)
+from coupon.tests.test_service import (TestGetScheduledFlyer, TestService,
+    TestCouponPerformance, TestSortCoupons, TestSiteCouponListing)
 from coupon.tests.test_slot_models import (TestSlotModels,
     TestSlotModelFlyerPlacement, TestCalculateNextEndDate)
 from coupon.tests.test_slot_service import (TestGetSlotCoupons,
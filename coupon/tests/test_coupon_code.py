@@ -4,8 +4,10 @@ from django.test import TestCase
 
 from coupon.factories.coupon_factory import COUPON_FACTORY
 from coupon.models import CouponCode
+from coupon.service import coupon_code_service
 from coupon.service.coupon_code_service import (check_coupon_code, 
-    create_coupon_code, create_multiple_coupon_codes)
+    create_coupon_code, create_multiple_coupon_codes, insert_coupon_codes,
+    CouponCodePool)
 
 
 class TestCouponCode(TestCase):
@@ -49,3 +51,40 @@ class TestCouponCode(TestCase):
         create_multiple_coupon_codes(coupon, 6)
         new_count = CouponCode.objects.filter(coupon=coupon).count()
         self.assertEqual(preexisting_count + 6, new_count)
+
+    def test_create_codes_one_query(self):
+        """ Assert a batch of codes is created in one query. """
+        coupon = COUPON_FACTORY.create_coupon()
+        with self.assertNumQueries(1):
+            coupon_code_set = create_multiple_coupon_codes(coupon, 50, 8)
+        self.assertEqual(len(set([coupon_code.code
+            for coupon_code in coupon_code_set])), 50)
+        self.assertEqual(CouponCode.objects.filter(coupon=coupon).count(), 50)
+
+    def test_rejected_codes_refilled(self):
+        """ Assert codes the coupon already has are rejected and generated
+        again, until the count is reached.
+        """
+        coupon = COUPON_FACTORY.create_coupon()
+        insert_coupon_codes(coupon, ['AAAA', 'BBBB'])
+        generated = iter(['AAAA', 'CCCC', 'BBBB', 'DDDD', 'EEEE'])
+        random_code_generator = coupon_code_service.random_code_generator
+        coupon_code_service.random_code_generator = \
+            lambda *args, **kwargs: generated.next()
+        try:
+            coupon_code_set = create_multiple_coupon_codes(coupon, 3)
+        finally:
+            coupon_code_service.random_code_generator = random_code_generator
+        self.assertEqual(sorted([coupon_code.code
+            for coupon_code in coupon_code_set]), ['CCCC', 'DDDD', 'EEEE'])
+        self.assertEqual(list(generated), [])
+        self.assertEqual(CouponCode.objects.filter(coupon=coupon).count(), 5)
+
+    def test_coupon_code_pool(self):
+        """ Assert a pool draws distinct saved codes, creating them in batches.
+        """
+        coupon = COUPON_FACTORY.create_coupon()
+        coupon_codes = CouponCodePool(coupon, 3, 4)
+        codes = [coupon_codes.draw().code for x in range(5)]
+        self.assertEqual(len(set(codes)), 5)
+        self.assertEqual(CouponCode.objects.filter(coupon=coupon).count(), 6)
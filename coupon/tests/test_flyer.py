@@ -15,18 +15,22 @@ from common.service.payload_signing import PAYLOAD_SIGNING
 from common.test_utils import EnhancedTestCase
 from consumer.factories.consumer_factory import CONSUMER_FACTORY
 from consumer.models import Consumer
+from ecommerce.factories.order_factory import ORDER_FACTORY
+from coupon.config import FLYER_SEND_CONCURRENCY, FLYER_SEND_STALE_SECONDS
 from coupon.factories.coupon_factory import COUPON_FACTORY
 from coupon.factories.slot_factory import SLOT_FACTORY
 from coupon.models import (Coupon, Flyer, FlyerCoupon, FlyerConsumer,
     FlyerSubdivision, FlyerPlacement, FlyerPlacementSubdivision)
-from coupon.service.flyer_service import (add_flyer_subdivision,
-    next_flyer_date, set_prior_weeks, get_available_flyer_dates,
-    get_flyer_placements, get_national_text, send_flyers_this_week)
+from coupon.service.flyer_service import (add_flyer_subdivision, claim_flyer,
+    claim_stale_flyer, collect_sent_flyers, flyer_sent, next_flyer_date,
+    set_prior_weeks, get_available_flyer_dates, get_flyer_placements,
+    get_flyer_send_concurrency, get_national_text, get_recipient_chunks,
+    record_flyer_consumers, release_flyer, resume_flyers_this_week,
+    send_flyers_this_week)
 from coupon.service.flyer_create_service import (append_coupon_to_flyer,
-    conditionally_append_coupon, process_city, process_county,
-    split_subdivision, get_coupons_for_flyer, create_update_flyers_subs,
-    create_flyers_this_site_phase2)
-from geolocation.models import USCity
+    conditionally_append_coupon, create_flyers_for_placements,
+    create_flyers_this_site_phase2, get_coupons_for_flyer, partition_zips,
+    plan_flyer_coupons, SubdivisionHierarchy)
 from market.models import Site
 
 LOG = logging.getLogger('ten.%s' % __name__)
@@ -66,6 +70,25 @@ class TestConditionallyAppendCoupon(TestCase):
         self.assertTrue(skipped)
 
 
+class TestPlanFlyerCoupons(TestCase):
+    """ Test case for plan_flyer_coupons service function. """
+
+    def test_plan_flyer_coupons(self):
+        """ Assert placed coupons get in, then current coupons of businesses
+        not in the flyer, then skipped coupons before national coupons, until
+        the flyer is full.
+        """
+        in_flyer = [(1, 100)]
+        candidates = {
+            'placed': [(1, 100), (2, 101)],
+            'current': [(3, 100), (4, 102), (5, 102), (6, 103)],
+            'national': [(7, 104), (8, 105)]}
+        self.assertEqual(plan_flyer_coupons(in_flyer, candidates),
+            [2, 4, 6, 3, 5, 7, 8])
+        self.assertEqual(plan_flyer_coupons(in_flyer, candidates,
+            max_count=5), [2, 4, 6, 3])
+
+
 class TestGetNationalText(TestCase):
     """ Test case for service function get_national_text. """
 
@@ -289,59 +312,55 @@ class TestFlyerPhase2(EnhancedTestCase):
             geolocation_type=self.city_type,
             geolocation_id=17043).count(), 1)
 
-    def test_create_update_flyer_subs(self):
-        """ Assert minimal flyers created for placements in Dutchess county. """
-        slot = SLOT_FACTORY.create_slot()
-        coupon = SLOT_FACTORY.prepare_slot_coupons_for_flyer([slot])[0]
-        flyer_placement = FlyerPlacement.objects.create(site=self.site,
-            slot=slot, send_date=self.next_flyer_date)
-        # 12601.
-        flyer_placement_subdivision = FlyerPlacementSubdivision.objects.create(
-            flyer_placement=flyer_placement, geolocation_type=self.zip_type,
-            geolocation_id=16045)
-        flyer = Flyer.objects.create(site=self.site, is_approved=True,
-            send_date=self.next_flyer_date)
-        # Poughkeepsie
-        FlyerSubdivision.objects.create(flyer=flyer, geolocation_id=17009,
-            geolocation_type=self.city_type)
-        create_update_flyers_subs(FlyerPlacementSubdivision.objects.filter(
-            id=flyer_placement_subdivision.id), 'uszip', flyer_placement,
-            coupon, self.site)
-        # The city flyer subdivision has been split into at least 3 zip
-        # subdivisions.
-        self.assertTrue(FlyerSubdivision.objects.filter(
-            flyer__in=Flyer.objects.filter(
-                site=self.site, send_date=self.next_flyer_date),
-            geolocation_type=self.zip_type).count() > 2)
-
-    def test_process_city(self):
-        """ Assert all the zips of Poughkeepsie are covered when a flyer exists
-        for the zip code 12601.
+    def test_partition_zips(self):
+        """ Assert each zip is in the one flyer of the placements covering it,
+        and zips no placement covers are in the catchall flyer.
         """
-        slots = SLOT_FACTORY.create_slots(create_count=2)
-        coupons = SLOT_FACTORY.prepare_slot_coupons_for_flyer(slots)
-        flyer_placement = FlyerPlacement.objects.create(site=self.site,
-            slot=slots[0], send_date=self.next_flyer_date)
-        catchall_flyer = Flyer.objects.create(site=self.site,
-            send_date=self.next_flyer_date)
-        flyer_12601 = Flyer.objects.create(site=self.site,
-            send_date=self.next_flyer_date)
-        FlyerSubdivision.objects.create(
-            flyer=flyer_12601, geolocation_type=self.zip_type,
-            geolocation_id=16045)
-        process_city(catchall_flyer, 17009, coupons[1], flyer_placement, [])
-        # Assert two other zip codes of Poughkeepsie were added to the catchall
-        # flyer.
-        self.assertEqual(catchall_flyer.flyer_subdivisions.filter(
-            geolocation_type=self.zip_type,
-            geolocation_id__in=[30218, 31367]).count(), 2)
+        self.assertEqual(partition_zips([set([1]), set([2, 3]), set([2, 4])],
+            [1, 2, 3, 4, 5]), [((0,), set([1])), ((1,), set([3])),
+                ((1, 2), set([2])), ((2,), set([4])), ((), set([5]))])
 
-    def test_process_county(self):
-        """ Assert Orange County is fully covered for flyers. """
-        slots = SLOT_FACTORY.create_slots(create_count=2)
+    def test_get_subdivisions(self):
+        """ Assert zips are written as the whole counties and cities they make
+        up: Dutchess without 12601 is Poughkeepsie zips and other cities.
+        """
+        hierarchy = SubdivisionHierarchy([1844])
+        county_zip_ids = hierarchy.get_zip_ids('uscounty', 1844)
+        self.assertEqual(hierarchy.get_subdivisions(county_zip_ids),
+            [('uscounty', 1844)])
+        subdivisions = hierarchy.get_subdivisions(
+            county_zip_ids - set([16045]))
+        self.assertTrue(('uscounty', 1844) not in subdivisions)
+        self.assertTrue(('uscity', 17009) not in subdivisions)
+        self.assertTrue(('uszip', 30218) in subdivisions)
+        self.assertTrue(('uszip', 31367) in subdivisions)
+        self.assertTrue(('uscity', 17043) in subdivisions)
+
+    def test_placement_existing_flyers(self):
+        """ Assert flyers existing for the send date within a placement keep
+        their subdivisions and get its coupon, and the rest of Orange County
+        gets a new flyer. Assert an existing flyer for Dutchess is split into
+        Poughkeepsie, which gets the coupon of a placement there, and the rest
+        of Dutchess, each keeping the coupon it had.
+        """
+        slots = SLOT_FACTORY.create_slots(create_count=3)
         coupons = SLOT_FACTORY.prepare_slot_coupons_for_flyer(slots)
         flyer_placement = FlyerPlacement.objects.create(site=self.site,
             slot=slots[0], send_date=self.next_flyer_date)
+        FlyerPlacementSubdivision.objects.create(
+            flyer_placement=flyer_placement, geolocation_type=self.county_type,
+            geolocation_id=1866)
+        flyer_placement = FlyerPlacement.objects.create(site=self.site,
+            slot=slots[1], send_date=self.next_flyer_date)
+        FlyerPlacementSubdivision.objects.create(
+            flyer_placement=flyer_placement, geolocation_type=self.city_type,
+            geolocation_id=17009)
+        flyer_dutchess = Flyer.objects.create(site=self.site,
+            send_date=self.next_flyer_date, is_approved=True)
+        FlyerSubdivision.objects.create(flyer=flyer_dutchess,
+            geolocation_type=self.county_type, geolocation_id=1844)
+        FlyerCoupon.objects.create(flyer=flyer_dutchess, coupon=coupons[2],
+            rank=1)
         flyer_12550 = Flyer.objects.create(site=self.site,
             send_date=self.next_flyer_date)
         FlyerSubdivision.objects.create(flyer=flyer_12550,
@@ -350,37 +369,37 @@ class TestFlyerPhase2(EnhancedTestCase):
             send_date=self.next_flyer_date)
         FlyerSubdivision.objects.create(flyer=flyer_new_windsor,
             geolocation_type=self.city_type, geolocation_id=17555)
-        catchall_flyer = Flyer.objects.create(site=self.site)
-        process_county(catchall_flyer, 1866, coupons[1], flyer_placement)
-        # Assert it got the subdivision for city Cornwall.
-        self.assertTrue(catchall_flyer.flyer_subdivisions.filter(
-            geolocation_type=self.city_type, geolocation_id=17536).count(), 1)
-        # Assert it got the subdivision for city Maybrook.
-        self.assertTrue(catchall_flyer.flyer_subdivisions.filter(
-            geolocation_type=self.city_type, geolocation_id=17549).count(), 1)
-
-    def test_split_subdivision_city(self):
-        """ Assert Poughkeepsie is divided into its component zip codes."""
-        flyer = Flyer.objects.create(site=self.site, is_approved=True)
-        FlyerSubdivision.objects.create(flyer=flyer, geolocation_id=17009,
-            geolocation_type=self.city_type)
-        split_subdivision(flyer, 'uscity', USCity.objects.filter(id=17009))
-        try:
-            flyer.flyer_subdivisions.get(geolocation_type=self.city_type,
-                geolocation_id=17009)
-            self.fail('City subdivision not removed while splitting.')
-        except FlyerSubdivision.DoesNotExist:
-            pass
-        try:
-            flyer.flyer_subdivisions.get(geolocation_type=self.zip_type,
-                geolocation_id=16045)
-            flyer.flyer_subdivisions.get(geolocation_type=self.zip_type,
-                geolocation_id=31367)
-            flyer.flyer_subdivisions.get(geolocation_type=self.zip_type,
-                geolocation_id=30218)
-        except FlyerSubdivision.DoesNotExist as error:
-            self.fail(error)
-    
+        create_flyers_for_placements(self.site, self.next_flyer_date)
+        for flyer in (flyer_12550, flyer_new_windsor):
+            self.assertEqual(flyer.flyer_subdivisions.count(), 1)
+            self.assertTrue(flyer.flyer_coupons.filter(
+                coupon=coupons[0]).count())
+        # Assert it got the subdivisions for cities Cornwall and Maybrook.
+        flyer = self.site.flyers.get(send_date=self.next_flyer_date,
+            flyer_subdivisions__geolocation_type=self.city_type,
+            flyer_subdivisions__geolocation_id=17536)
+        self.assertTrue(flyer.flyer_subdivisions.filter(
+            geolocation_type=self.city_type, geolocation_id=17549).count())
+        self.assertFalse(flyer.flyer_subdivisions.filter(
+            geolocation_type=self.zip_type, geolocation_id=23181).count())
+        self.assertEqual(list(flyer.flyer_coupons.values_list(
+            'coupon__id', 'rank')), [(coupons[0].id, 1)])
+        self.assertEqual(list(flyer_dutchess.flyer_subdivisions.values_list(
+            'geolocation_type', 'geolocation_id')),
+            [(self.city_type.id, 17009)])
+        self.assertEqual(list(flyer_dutchess.flyer_coupons.order_by(
+            'rank').values_list('coupon__id', 'rank')),
+            [(coupons[2].id, 1), (coupons[1].id, 2)])
+        # Assert the rest of Dutchess, with Red Hook, got a flyer of its own.
+        flyer = self.site.flyers.get(send_date=self.next_flyer_date,
+            flyer_subdivisions__geolocation_type=self.city_type,
+            flyer_subdivisions__geolocation_id=17043)
+        self.assertTrue(flyer.is_approved)
+        self.assertFalse(flyer.flyer_subdivisions.filter(
+            geolocation_type=self.county_type).count())
+        self.assertEqual(list(flyer.flyer_coupons.values_list(
+            'coupon__id', 'rank')), [(coupons[2].id, 1)])
+
     def test_send_flyers_12550(self):
         """ Assert a flyer is sent 3 consumers in the zip code 12550. """
         flyer = Flyer.objects.create(site=self.site, is_approved=True)
@@ -551,6 +570,84 @@ class TestFlyer(EnhancedTestCase):
         self.assertTrue(FlyerConsumer.objects.filter(flyer=flyer, 
             consumer__id=consumer.id).count(), 1)
         
+    def test_flyer_sent(self):
+        """ Assert the flyer placement order item of a sent coupon is moved to
+        its flyer coupon with the service date of its first send, which a
+        retried send or a later flyer does not change.
+        """
+        order = ORDER_FACTORY.create_order(product_id=1)
+        order_item = order.order_items.get()
+        coupon = SLOT_FACTORY.prepare_slot_coupons_for_flyer(
+            [order_item.ordered_object])[0]
+        flyer = Flyer.objects.create(site_id=2, is_approved=True)
+        flyer_coupon = FlyerCoupon.objects.create(flyer=flyer, coupon=coupon)
+        flyer_sent(flyer, 5)
+        order_item = order.order_items.get()
+        self.assertEqual(order_item.content_type.model, 'flyercoupon')
+        self.assertEqual(order_item.item_id, flyer_coupon.id)
+        self.assertEqual(order_item.end_datetime, flyer.send_datetime)
+        send_datetime = flyer.send_datetime
+        flyer_sent(Flyer.objects.get(id=flyer.id), 5)
+        later_flyer = Flyer.objects.create(site_id=2, is_approved=True)
+        FlyerCoupon.objects.create(flyer=later_flyer, coupon=coupon)
+        flyer_sent(later_flyer, 5)
+        order_item = order.order_items.get()
+        self.assertEqual(order_item.item_id, flyer_coupon.id)
+        self.assertEqual(order_item.end_datetime, send_datetime)
+        self.assertEqual(Flyer.objects.get(id=flyer.id).send_datetime,
+            send_datetime)
+
+    def test_claim_flyer(self):
+        """ Assert an unsent flyer can be claimed for sending only once. """
+        flyer = Flyer.objects.create(site_id=2, is_approved=True)
+        self.assertTrue(claim_flyer(flyer.id))
+        self.assertEqual(Flyer.objects.get(id=flyer.id).send_status, '1')
+        self.assertFalse(claim_flyer(flyer.id))
+
+    def test_send_flyers_this_week_claimed(self):
+        """ Assert a flyer already claimed by another sender is not sent. """
+        flyer = Flyer.objects.create(site_id=2, is_approved=True)
+        consumer = CONSUMER_FACTORY.create_consumer()
+        claim_flyer(flyer.id)
+        send_flyers_this_week()
+        recipients = [message.to[0] for message in mail.outbox]
+        self.assertTrue(consumer.email not in recipients)
+        self.assertEqual(Flyer.objects.get(id=flyer.id).num_recipients, -1)
+
+    def test_flyer_send_concurrency(self):
+        """ Assert flyer sends are capped by the connections of a known relay,
+        and get one connection through an unknown relay.
+        """
+        email_host = settings.EMAIL_HOST
+        try:
+            settings.EMAIL_HOST = 'smtp01.strausdigital.com'
+            self.assertEqual(get_flyer_send_concurrency(),
+                min(2, FLYER_SEND_CONCURRENCY))
+            settings.EMAIL_HOST = 'smtp.example.com'
+            self.assertEqual(get_flyer_send_concurrency(), 1)
+        finally:
+            settings.EMAIL_HOST = email_host
+
+    def test_collect_sent_flyers(self):
+        """ Assert sent flyers are reported from their rows, failed ones are
+        no longer waited on, and those still sending stay pending.
+        """
+        sent_flyer = Flyer.objects.create(site_id=2, is_approved=True,
+            send_status='2', num_recipients=5)
+        sending_flyer = Flyer.objects.create(site_id=2, is_approved=True)
+        claim_flyer(sending_flyer.id)
+        failed_flyer = Flyer.objects.create(site_id=2, is_approved=True)
+        claim_flyer(failed_flyer.id)
+        release_flyer(failed_flyer.id)
+        queued = datetime.datetime.now()
+        flyer_log = []
+        pending = collect_sent_flyers(dict([(flyer.id, queued)
+            for flyer in (sent_flyer, sending_flyer, failed_flyer)]),
+            flyer_log)
+        self.assertEqual(pending.keys(), [sending_flyer.id])
+        self.assertEqual([row[:2] for row in flyer_log],
+            [[Site.objects.get(id=2).domain, 5]])
+
     def test_no_flyers_this_week(self):
         """ Assert no flyers are sent. """
         flyers_before = Flyer.objects.filter(send_status='2').count()
@@ -559,6 +656,83 @@ class TestFlyer(EnhancedTestCase):
         self.assertEqual(flyers_before, flyers_after)
 
 
+class TestSendFlyerChunks(EnhancedTestCase):
+    """ Tests for sending a flyer in chunks, and resuming an interrupted send.
+    """
+    urls = 'urls_local.urls_2'
+
+    def test_get_recipient_chunks(self):
+        """ Assert recipients are generated in chunks of chunk_size, in consumer
+        id order, after the given consumer id.
+        """
+        consumers = CONSUMER_FACTORY.create_consumers(create_count=6)
+        consumer_ids = [consumer.id for consumer in consumers]
+        chunks = list(get_recipient_chunks(
+            Consumer.objects.filter(id__in=consumer_ids),
+            after_consumer_id=consumer_ids[0], chunk_size=2))
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 2, 1])
+        self.assertEqual(
+            [consumer_id for chunk in chunks for consumer_id, email in chunk],
+            consumer_ids[1:])
+        self.assertEqual(chunks[0][0][1], consumers[1].email)
+
+    def test_record_flyer_consumers(self):
+        """ Assert a chunk of recipients recorded again, as on resuming, is
+        recorded once.
+        """
+        consumers = CONSUMER_FACTORY.create_consumers(create_count=3)
+        flyer = Flyer.objects.create(site_id=2, is_approved=True)
+        record_flyer_consumers(flyer, [consumers[0].id, consumers[1].id])
+        record_flyer_consumers(flyer, [consumer.id for consumer in consumers])
+        record_flyer_consumers(flyer, [])
+        self.assertEqual(sorted(flyer.flyer_consumers.values_list(
+            'consumer__id', flat=True)),
+            sorted([consumer.id for consumer in consumers]))
+
+    def test_resume_flyer(self):
+        """ Assert a flyer left sending resumes after its send_checkpoint. """
+        consumers = CONSUMER_FACTORY.create_consumers(create_count=3)
+        flyer = Flyer.objects.create(site_id=2, is_approved=True,
+            send_status='1', send_checkpoint=consumers[0].id)
+        resume_flyers_this_week()
+        recipients = [message.to[0] for message in mail.outbox]
+        self.assertTrue(consumers[0].email not in recipients)
+        self.assertTrue(consumers[1].email in recipients)
+        self.assertTrue(consumers[2].email in recipients)
+        flyer = Flyer.objects.get(id=flyer.id)
+        self.assertEqual(flyer.send_status, '2')
+        self.assertEqual(flyer.send_checkpoint, consumers[2].id)
+        self.assertEqual(FlyerConsumer.objects.filter(flyer=flyer,
+            consumer__id=consumers[2].id).count(), 1)
+
+    def test_resume_live_flyer(self):
+        """ Assert a flyer whose sender made progress recently is not resumed.
+        """
+        consumers = CONSUMER_FACTORY.create_consumers(create_count=2)
+        flyer = Flyer.objects.create(site_id=2, is_approved=True)
+        claim_flyer(flyer.id)
+        Flyer.objects.filter(id=flyer.id).update(
+            send_checkpoint=consumers[0].id)
+        self.assertEqual(resume_flyers_this_week(), [])
+        self.assertFalse(claim_stale_flyer(flyer.id))
+        recipients = [message.to[0] for message in mail.outbox]
+        self.assertTrue(consumers[1].email not in recipients)
+        self.assertEqual(Flyer.objects.get(id=flyer.id).send_status, '1')
+
+    def test_claim_stale_flyer(self):
+        """ Assert a flyer left sending can be taken over only once, and not
+        when unsent.
+        """
+        flyer = Flyer.objects.create(site_id=2, is_approved=True)
+        self.assertFalse(claim_stale_flyer(flyer.id))
+        claim_flyer(flyer.id)
+        Flyer.objects.filter(id=flyer.id).update(
+            send_heartbeat=datetime.datetime.now() - datetime.timedelta(
+                seconds=FLYER_SEND_STALE_SECONDS + 60))
+        self.assertTrue(claim_stale_flyer(flyer.id))
+        self.assertFalse(claim_stale_flyer(flyer.id))
+
+
 class TestGetCouponsForFlyer(TestCase):
     """ Test case for service function get_coupons_for_flyer. """
 
@@ -11,6 +11,8 @@ from common.test_utils import EnhancedTestCase
 from coupon.factories.slot_factory import SLOT_FACTORY
 from coupon.models import Coupon
 from coupon.service.coupons_service import ALL_COUPONS
+from coupon.service.search_index_service import (get_coupon_category_ids,
+    get_coupon_site_ids, get_id_ranges)
 from market.models import Site
 
 LOG = logging.getLogger('ten.%s' % __name__)
@@ -295,6 +297,56 @@ class TestSpellingSuggestion(SearchCouponsTestCase):
             '<strong><em><a href="/hudson-valley/coupons/',
             '?q=pizzeria" alt="pizzeria">pizzeria</a>'))
 
+
+class TestPrepareCouponBatch(EnhancedTestCase):
+    """ Test case for preparing coupons for the search index in batches. """
+
+    def test_prepare_batch(self):
+        """ Assert the site ids and categories of a batch of coupons are
+        fetched in one query each, and match those prepared per coupon.
+        """
+        coupons = SLOT_FACTORY.get_active_coupons(
+            slot_list=SLOT_FACTORY.create_slots(create_count=3))
+        coupons[0].offer.business.categories = [1, 2]
+        coupon_ids = [coupon.id for coupon in coupons]
+        with self.assertNumQueries(1):
+            site_ids = get_coupon_site_ids(coupon_ids)
+        with self.assertNumQueries(1):
+            category_ids = get_coupon_category_ids(coupon_ids)
+        index = haystack_site.get_index(Coupon)
+        for coupon in coupons:
+            self.assertTrue(site_ids[coupon.id])
+            self.assertEqual(site_ids[coupon.id],
+                index.prepare_site_id(coupon))
+            self.assertEqual(sorted(category_ids[coupon.id]),
+                sorted(index.prepare_categories(coupon)))
+        self.assertEqual(sorted(category_ids[coupons[0].id]), [1, 2])
+
+    def test_prepare_from_batch(self):
+        """ Assert a coupon carrying the site id and categories of its batch
+        is prepared from them, and another coupon is not.
+        """
+        coupons = SLOT_FACTORY.get_active_coupons(
+            slot_list=SLOT_FACTORY.create_slots(create_count=2))
+        coupons[0].index_site_id = None
+        coupons[0].index_category_ids = [2]
+        index = haystack_site.get_index(Coupon)
+        with self.assertNumQueries(0):
+            self.assertEqual(index.prepare_site_id(coupons[0]), None)
+            self.assertEqual(index.prepare_categories(coupons[0]), [2])
+        self.assertTrue(index.prepare_site_id(coupons[1]))
+
+    def test_get_id_ranges(self):
+        """ Assert id ranges cover every id once. """
+        id_ranges = get_id_ranges(3, 20, 4)
+        self.assertEqual(len(id_ranges), 4)
+        ids = []
+        for start, stop in id_ranges:
+            ids.extend(range(start, stop))
+        self.assertEqual(ids, range(3, 21))
+        self.assertEqual(get_id_ranges(5, 5, 4), [(5, 6)])
+        self.assertEqual(get_id_ranges(None, None, 4), [])
+
 ################################################################################
 #    def test_bad_page(self):
 #        """ Assert that on a GET of the keyword 'pizza' and a page number that 
@@ -4,19 +4,22 @@ import datetime
 import logging
 
 from django.contrib.contenttypes.models import ContentType
+from django.core.cache import get_cache
 from django.test import TestCase
 
 from advertiser.models import Advertiser
 from common.test_utils import EnhancedTestCase
 from coupon.factories.coupon_factory import COUPON_FACTORY
 from coupon.factories.slot_factory import SLOT_FACTORY
+from coupon.service import coupons_service
 from coupon.service.coupon_performance import CouponPerformance
 from coupon.service.twitter_service import TWITTER_SERVICE
 from coupon.service.coupons_service import ALL_COUPONS, SORT_COUPONS
 from coupon.service.expiration_date_service import default_expiration_date
 from coupon.service.flyer_create_service import (append_coupon_to_flyer)
 from coupon.service.flyer_service import get_coupons_scheduled_flyers
-from coupon.models import Coupon, CouponAction, CouponType, Flyer, RankDateTime
+from coupon.models import (Coupon, CouponAction, CouponType, Flyer,
+    FlyerPlacement, RankDateTime)
 from ecommerce.factories.order_factory import ORDER_FACTORY
 from ecommerce.models import OrderItem, Product
 from firestorm.factories.ad_rep_factory import AD_REP_FACTORY
@@ -193,7 +196,7 @@ class TestSortCoupons(TestCase):
         how many times it has been printed, and how many times it has been
         shared.
         """
-        self.assertNumQueries(4, SORT_COUPONS.sorted_coupons, self.coupon_ids)
+        self.assertNumQueries(2, SORT_COUPONS.sorted_coupons, self.coupon_ids)
 
     def test_sorted_coupons(self):
         """  Assert newer coupons are sorted first. """
@@ -204,6 +207,19 @@ class TestSortCoupons(TestCase):
             sorted_coupon_ids.index(self.coupon_ids[1]) <
             sorted_coupon_ids.index(self.coupon_ids[0]))
 
+    def test_tiers_preferred(self):
+        """ Assert a coupon created today sorts before a coupon in a flyer this
+        week, which sorts before a coupon ranked by rank_datetime.
+        """
+        self.coupon_1.coupon_create_datetime = datetime.datetime.now()
+        self.coupon_1.save()
+        slot = self.coupon_3.slot_time_frames.all()[0].slot
+        FlyerPlacement.objects.create(site_id=slot.site_id, slot=slot,
+            send_date=datetime.date.today() + datetime.timedelta(3))
+        sorted_coupon_ids = SORT_COUPONS.sort_coupon_ids(self.coupon_ids)
+        self.assertEqual(sorted_coupon_ids, [self.coupon_1.id,
+            self.coupon_3.id, self.coupon_2.id])
+
     def test_prints_preferred(self):
         """ Assert a coupon printed x times is considered 3x days "newer". """
         CouponAction.objects.create(coupon_id=self.coupon_ids[0], action_id=3,
@@ -229,6 +245,48 @@ class TestSortCoupons(TestCase):
             sorted_coupon_ids.index(self.coupon_ids[1]))
 
 
+class TestSiteCouponListing(TestCase):
+    """ Test case for the coupon listing of a site. """
+
+    def setUp(self):
+        """ Use a real cache; tests otherwise run with a dummy cache. """
+        super(TestSiteCouponListing, self).setUp()
+        self.cache = coupons_service.cache
+        coupons_service.cache = get_cache(
+            'django.core.cache.backends.locmem.LocMemCache')
+        self.slot = SLOT_FACTORY.create_slot()
+        self.coupon = self.slot.slot_time_frames.all()[0].coupon
+        self.site = self.slot.site
+
+    def tearDown(self):
+        coupons_service.cache = self.cache
+        super(TestSiteCouponListing, self).tearDown()
+
+    def test_get_all_coupons(self):
+        """ Assert once the listing is built, coupons for a site are fetched
+        in one query, in listing order.
+        """
+        listing = ALL_COUPONS.get_site_listing(self.site)
+        self.assertEqual(listing['slot_coupon_ids'], [self.coupon.id])
+        with self.assertNumQueries(1):
+            all_coupons, coupon_ids = ALL_COUPONS.get_all_coupons(self.site)
+        self.assertEqual(coupon_ids, listing['coupon_ids'])
+        self.assertEqual(all_coupons[0], self.coupon)
+
+    def test_slot_time_frame_change(self):
+        """ Assert ending the time frame of a coupon drops the listing of its
+        site, and the rebuilt listing excludes it.
+        """
+        ALL_COUPONS.get_site_listing(self.site)
+        slot_time_frame = self.slot.slot_time_frames.all()[0]
+        slot_time_frame.end_datetime = datetime.datetime.now()
+        slot_time_frame.save()
+        self.assertEqual(coupons_service.cache.get(
+            ALL_COUPONS.get_listing_cache_key(self.site.id)), None)
+        self.assertEqual(
+            ALL_COUPONS.get_site_listing(self.site)['slot_coupon_ids'], [])
+
+
 class TestCouponPerformance(TestCase):
     """ Test case for coupon service class CouponPerformance. This class's
     methods retrieve and display all the coupons related to this user."""
@@ -21,6 +21,8 @@ from coupon.factories.coupon_factory import COUPON_FACTORY
 from coupon.factories.slot_factory import SLOT_FACTORY
 from coupon.models import (Coupon, CouponAction, CouponType, ConsumerAction,
     FlyerCoupon, Flyer, RankDateTime, SlotTimeFrame)
+from coupon.service.coupon_action_service import (CouponActionBuffer,
+    update_rank_datetimes)
 from coupon.service.flyer_service import send_flyer
 from coupon.service.twitter_service import TWITTER_SERVICE
 from coupon.tasks import (CreateWidget, ExtendCouponExpirationDateTask,
@@ -101,6 +103,67 @@ class TestRecordAction(TestCase):
         self.assertTrue(consumer_action)
         LOG.debug('consumer_action = %s' % consumer_action)
 
+    def test_buffered_actions(self):
+        """ Assert actions buffered by a worker are written as one increment
+        per coupon when flushed, with consumer actions de-duplicated.
+        """
+        coupons = COUPON_FACTORY.create_coupons(create_count=2)
+        coupon_ids = [coupon.id for coupon in coupons]
+        consumer = CONSUMER_FACTORY.create_consumer()
+        buffer_ = CouponActionBuffer(flush_size=100, flush_seconds=3600)
+        always_eager = settings.CELERY_ALWAYS_EAGER
+        settings.CELERY_ALWAYS_EAGER = False
+        try:
+            buffer_.add(1, coupon_ids, consumer.id)
+            buffer_.add(1, coupon_ids, consumer.id)
+            buffer_.add(3, coupon_ids[:1])
+        finally:
+            settings.CELERY_ALWAYS_EAGER = always_eager
+        self.assertEqual(CouponAction.objects.filter(
+            coupon__id__in=coupon_ids).count(), 0)
+        self.assertTrue(buffer_.timer)
+        buffer_.flush()
+        self.assertEqual(buffer_.timer, None)
+        self.assertEqual(len(buffer_), 0)
+        for coupon in coupons:
+            self.assertEqual(CouponAction.objects.get(action__id=1,
+                coupon=coupon).count, 2)
+            self.assertEqual(ConsumerAction.objects.filter(action__id=1,
+                coupon=coupon, consumer=consumer).count(), 1)
+        self.assertEqual(CouponAction.objects.get(action__id=3,
+            coupon=coupons[0]).count, 1)
+        self.assertTrue(RankDateTime.objects.get(coupon=coupons[0]))
+
+    def test_rebuild_rank_datetimes(self):
+        """ Assert a rebuild creates missing rank datetimes and recomputes them
+        from shares and prints.
+        """
+        coupon = COUPON_FACTORY.create_coupon()
+        CouponAction.objects.create(coupon=coupon, action_id=7, count=2)
+        CouponAction.objects.create(coupon=coupon, action_id=3, count=1)
+        self.assertTrue(update_rank_datetimes(rebuild=True) > 0)
+        rank_datetime = RankDateTime.objects.get(coupon=coupon)
+        self.assertFalse(rank_datetime.is_dirty)
+        self.assertEqual(rank_datetime.rank_datetime,
+            coupon.coupon_create_datetime + datetime.timedelta(33))
+        self.assertEqual(update_rank_datetimes(), 0)
+
+    def test_update_dirty_rank_datetimes(self):
+        """ Assert only dirty rank datetimes are recomputed, in one query. """
+        coupons = COUPON_FACTORY.create_coupons(create_count=2)
+        update_rank_datetimes(rebuild=True)
+        for coupon in coupons:
+            CouponAction.objects.create(coupon=coupon, action_id=7, count=1)
+        RankDateTime.objects.filter(coupon=coupons[0]).update(is_dirty=True)
+        with self.assertNumQueries(1):
+            self.assertEqual(update_rank_datetimes(), 1)
+        self.assertEqual(RankDateTime.objects.get(
+            coupon=coupons[0]).rank_datetime,
+            coupons[0].coupon_create_datetime + datetime.timedelta(15))
+        self.assertEqual(RankDateTime.objects.get(
+            coupon=coupons[1]).rank_datetime,
+            coupons[1].coupon_create_datetime)
+
     def test_rank_date(self):
         """ Assert rank date is updated when a coupon is 'printed'. """
         coupon = COUPON_FACTORY.create_coupon()
@@ -18,6 +18,12 @@ DEFAULT_FROM_ADDRESS = 'Coupons@10Coupons.com'
 
 LIST_UNSUB_PREFIX = 'list_unsubscribe'
 
+# Rendered into bulk emails in place of per-recipient values, then replaced for
+# each recipient. Alphanumeric so escaping and url reversing leave them intact.
+RECIPIENT_EMAIL_PLACEHOLDER = 'TENxRECIPIENTxEMAILxPLACEHOLDER'
+
+PAYLOAD_PLACEHOLDER = 'TENxPAYLOADxPLACEHOLDER'
+
 ABANDONED_COUPON_SCHED_DICT = {
         'May': {
             'week_1':['20110517', '20110518'], 
@@ -2,6 +2,7 @@
 Routines for sending individual and mass emails that conform to our specs.
 """
 import logging
+import re
 from smtplib import SMTPRecipientsRefused
 import sys
 
@@ -9,7 +10,10 @@ from django.conf import settings
 from django.core import mail, urlresolvers
 from django.core.mail import EmailMultiAlternatives
 from django.core.urlresolvers import reverse
+from django.db.models import Q
 from django.template import loader, Context
+from django.utils.encoding import iri_to_uri
+from django.utils.html import escape
 
 from common.custom_format_for_display import list_as_text
 from common.service.payload_signing import PAYLOAD_SIGNING
@@ -23,6 +27,9 @@ from market.models import Site
 LOG = logging.getLogger('ten.%s' % __name__)
 LOG.setLevel(logging.ERROR)
 
+PLACEHOLDER_RE = re.compile('%s|%s' % (config.RECIPIENT_EMAIL_PLACEHOLDER,
+    config.PAYLOAD_PLACEHOLDER))
+
 
 class CustomEmailMultiAlternative(EmailMultiAlternatives):
     """" Derived from django EmailMultiAlternatives (EmailMessage) to allow more 
@@ -107,7 +114,28 @@ def prepare_send_list(_context):
     actual_send_list = set(actual_send_list)
     return _context, actual_send_list
 
-def send_email(template, site, context):
+def send_messages(connection, messages):
+    """ Send these messages over this open connection. When the SMTP server
+    refuses a recipient, flag that address as bouncing and restart the send
+    from the message after it.
+    """
+    while messages:
+        try:
+            connection.send_messages(messages)
+            break
+        except SMTPRecipientsRefused:
+            bad_email = sys.exc_info()[1][0].keys()[0]
+            LOG.debug("Bad email address %s, setting to bounce and continuing" % 
+                bad_email)
+            flag_bouncing_email(bad_email, 1)
+            recipients = [message.to[0] for message in messages]
+            if bad_email not in recipients:
+                break
+            messages = messages[recipients.index(bad_email) + 1:]
+            if messages:
+                LOG.info("Restarting send from the next address...")
+
+def send_email(template, site, context, connection=None):
     """
     Render this template as a multipart email to one or more email recipients, 
     given as iterable context['to_email']. 
@@ -126,6 +154,10 @@ def send_email(template, site, context):
             email.
         cc_signature_flag: When true, in conjunction with signature_email, the
             signature_email will be CC'd.
+
+    connection: optional open mail connection, for callers that send many
+        batches in a row (ie: a flyer sent in chunks). The caller is responsible
+        for closing it.
     """
     # Ensure modified context is contained within.
     _context = context.copy()
@@ -133,35 +165,29 @@ def send_email(template, site, context):
     LOG.debug("Generating emails")
     messages = []
     _context, actual_send_list = prepare_send_list(_context)
+    if not _context.get('bouncing_checked', False):
+        actual_send_list = filter_emailable_recipients(actual_send_list)
+        _context['bouncing_checked'] = True
     
-    for recipient_email in actual_send_list:
-        message = build_email(template, site, recipient_email, _context)
-        if message:
-            messages.append(message)
-        else:
-            LOG.error("Unknown Problem sending to email address: %s check " \
-                "previous output errors from build_email" % recipient_email)      
-    connection = mail.get_connection()
-    connection.open()
-    done = False
-    while done is False:
-        try:
-            connection.send_messages(messages)
-            done = True
-        except SMTPRecipientsRefused:
-            bad_email = sys.exc_info()[1][0].keys()[0]
-            LOG.debug("Bad email address %s, setting to bounce and continuing" % 
-                bad_email)
-            flag_bouncing_email(bad_email, 1)
-            bad_index = _context['to_email'].index(bad_email)
-            if len(_context['to_email']) == bad_index + 1:
-                # We're at the end of the list, don't bother to do try
-                # and continue.
-                done = True
+    if len(actual_send_list) > 1:
+        messages = build_bulk_emails(template, site, actual_send_list, 
+            _context)
+    else:
+        for recipient_email in actual_send_list:
+            message = build_email(template, site, recipient_email, _context)
+            if message:
+                messages.append(message)
             else:
-                messages = messages[bad_index + 1:]
-                LOG.info("Restarting send from the next address...")
-    connection.close()
+                LOG.error("Unknown Problem sending to email address: %s " \
+                    "check previous output errors from build_email" % 
+                    recipient_email)
+    if connection:
+        send_messages(connection, messages)
+    else:
+        connection = mail.get_connection()
+        connection.open()
+        send_messages(connection, messages)
+        connection.close()
     LOG.debug("Finished email send")
 
 def render_template(template, context):
@@ -185,9 +211,47 @@ def render_template(template, context):
     LOG.debug('html_content: %s' % html_content)
     return text_content, html_content
 
-def prepare_context(site, recipient_email, context):
-    """ Does some preprocessing of the context for build_email. """
-    # Set defaults.
+def filter_emailable_recipients(recipient_emails):
+    """ Return the set of these recipient emails that may be sent to, dropping
+    those of consumers that are not emailable or not active. Addresses not in
+    the consumer table are kept.
+    
+    All recipients are settled in one query, regardless of how many there are.
+    """
+    recipient_emails = set(recipient_emails)
+    if not recipient_emails:
+        return recipient_emails
+    LOG.debug("checking bounce status for %s" % recipient_emails)
+    nomail_reasons = {}
+    for email, is_emailable, is_active, reason in Consumer.objects.filter(
+                Q(is_emailable=False) | Q(is_active=False),
+                email__in=recipient_emails
+            ).values_list('email', 'is_emailable', 'is_active',
+                'nomail_reason__name'):
+        if is_emailable:
+            nomail_reasons[email] = None
+        else:
+            nomail_reasons.setdefault(email, [])
+            if reason is not None:
+                nomail_reasons[email].append(reason)
+    for email, reasons in nomail_reasons.items():
+        if reasons is None:
+            LOG.info("dropping email to address %s because is_active"
+                "is False" % email)
+        else:
+            LOG.info("dropping email to address %s because %s" % (
+                email, str(reasons)))
+    return recipient_emails - set(nomail_reasons)
+
+def is_recipient_emailable(recipient_email):
+    """ Return False if this recipient is a consumer that is not emailable or
+    not active.
+    """
+    return bool(filter_emailable_recipients([recipient_email]))
+
+def set_context_defaults(site, context):
+    """ Return a copy of context with defaults set and the From header built.
+    """
     defaults = {
         'real_name': None,
         'friendly_from': site.domain,
@@ -199,23 +263,6 @@ def prepare_context(site, recipient_email, context):
         }
     defaults.update(context)
     context = defaults
-    if not context['bouncing_checked']:
-        LOG.debug("checking bounce status for %s" % recipient_email)
-        try:
-            consumer = Consumer.objects.get(email=recipient_email)
-            if not consumer.is_emailable:
-                reasons = str(consumer.nomail_reason.values_list('name',
-                    flat=True))
-                LOG.info("dropping email to address %s because %s" % (
-                    recipient_email, reasons))
-                return False
-            if not consumer.is_active:
-                LOG.info("dropping email to address %s because is_active"
-                    "is False" % recipient_email)
-                return False
-        except Consumer.DoesNotExist:
-            LOG.info("address %s not in address table, proceeding" 
-                % recipient_email)
     LOG.debug("friendly_from: %s" % context['friendly_from'])
     # If from address was just a name w/o a domain, attach default domain.
     if not context['from_address'].partition('@')[2]:
@@ -226,6 +273,13 @@ def prepare_context(site, recipient_email, context):
     context['headers'].update({'From': combined_from})
     return context
 
+def prepare_context(site, recipient_email, context):
+    """ Does some preprocessing of the context for build_email. """
+    if not context.get('bouncing_checked', False) \
+    and not is_recipient_emailable(recipient_email):
+        return False
+    return set_context_defaults(site, context)
+
 def build_email(template, site, recipient_email, context):
     """ Build a multipart email to be sent. 
     old params: email, subject=config.DEFAULT_SUBJECT, 
@@ -304,3 +358,87 @@ def build_email(template, site, recipient_email, context):
         headers=context['headers'])
     message.attach_alternative(html_content, "text/html")
     return message
+
+def render_bulk_template(template, site, context):
+    """ Render this template once for many recipients, with placeholders where
+    the recipient email and payload go. Returns (text_content, html_content,
+    opt_out_path), where opt_out_path also holds the payload placeholder.
+    
+    Templates may use recipient_email and payload as plain variables or as
+    {% url %} arguments, but must not run them through filters, or the
+    placeholders would no longer match.
+    """
+    urlconf = 'urls_local.urls_%s' % site.id
+    initial_urlconf = urlresolvers.get_urlconf()
+    urlresolvers.set_urlconf(urlconf)
+    opt_out_path = reverse('opt_out', 
+        kwargs={'payload': config.PAYLOAD_PLACEHOLDER})
+    site.name_no_spaces = site.get_name_no_spaces()
+    context = context.copy()
+    context.update({'media_url': settings.MEDIA_URL,
+        'recipient_email': config.RECIPIENT_EMAIL_PLACEHOLDER,
+        'directory_name': site.directory_name,
+        'payload': config.PAYLOAD_PLACEHOLDER,
+        'base_url': settings.HTTP_PROTOCOL_HOST,
+        'from_email': context['from_address'],
+        'help_email_address': config.HELP_EMAIL_ADDRESS,
+        'site': site,
+        'current_site': site})
+    text_content, html_content = render_template(template, Context(context))
+    urlresolvers.set_urlconf(initial_urlconf)
+    return text_content, html_content, opt_out_path
+
+def is_spliceable(value):
+    """ Is this value rendered verbatim by a template, both as a variable and
+    as a {% url %} argument? If not, it cannot be spliced in for a placeholder.
+    """
+    return escape(value) == value and iri_to_uri(value) == value
+
+def personalize(content, tokens):
+    """ Replace each placeholder key of dict tokens in content, in one pass. """
+    return PLACEHOLDER_RE.sub(lambda match: tokens[match.group(0)], content)
+
+def build_bulk_emails(template, site, recipient_emails, context):
+    """ Build a list of multipart emails for these recipients, each identical to
+    the email build_email would build for that recipient.
+    
+    The templates are rendered and the opt out link reversed once, then the
+    per-recipient tokens (payload, bounce address and List-Unsubscribe header)
+    are spliced into each copy. A recipient whose email address would be
+    altered by escaping is built by build_email instead.
+    """
+    context = set_context_defaults(site, context)
+    text_content, html_content, opt_out_path = render_bulk_template(
+        template, site, context)
+    if not context['bouncing_checked']:
+        recipient_emails = filter_emailable_recipients(recipient_emails)
+    messages = []
+    for recipient_email in recipient_emails:
+        if not is_spliceable(recipient_email):
+            message = build_email(template, site, recipient_email, 
+                dict(context, bouncing_checked=True))
+            if message:
+                messages.append(message)
+            continue
+        email_hash = generate_email_hash(recipient_email, 'email')
+        payload = PAYLOAD_SIGNING.create_payload(
+            email=recipient_email, subscription_list=context['mailing_list'])
+        bounce_address = '%s-%s-%s@%s' % (config.DEFAULT_BOUNCE_USER, 
+            template, email_hash, config.DEFAULT_BOUNCE_DOMAIN)
+        tokens = {config.RECIPIENT_EMAIL_PLACEHOLDER: recipient_email,
+            config.PAYLOAD_PLACEHOLDER: payload}
+        headers = context['headers'].copy()
+        if context['show_unsubscribe']:
+            headers.update({
+                'List-Unsubscribe': '<%s%s>, <mailto:%s-%s-%s@%s>' % (
+                    settings.HTTP_PROTOCOL_HOST, 
+                    personalize(opt_out_path, tokens),
+                    config.LIST_UNSUB_PREFIX, template, email_hash,
+                    config.DEFAULT_BOUNCE_DOMAIN)})
+        message = CustomEmailMultiAlternative(subject=context['subject'], 
+            body=personalize(text_content, tokens), from_email=bounce_address,
+            to=[recipient_email], headers=headers)
+        message.attach_alternative(personalize(html_content, tokens),
+            "text/html")
+        messages.append(message)
+    return messages
@@ -4,7 +4,7 @@ from email_gateway.tests.test_context_processors import TestGetRepContext
 from email_gateway.tests.test_email_model import TestEmailModel
 from email_gateway.tests.test_process import TestProcess
 from email_gateway.tests.test_send import (TestEmailFilterSettings,
-    TestEmailDisplayHeaders)
+    TestEmailDisplayHeaders, TestBuildBulkEmails, TestFilterEmailableRecipients)
 from email_gateway.tests.test_service import TestService
 from email_gateway.tests.test_views import (TestViews, TestRemoteBounceReport,
     TestResetPasswordFromEmail, TestSaleRedirectWithSession)
@@ -6,7 +6,10 @@ from django.core import mail
 from django.core.urlresolvers import reverse
 
 from common.test_utils import EnhancedTestCase
-from email_gateway.send import send_email
+from consumer.factories.consumer_factory import CONSUMER_FACTORY
+from email_gateway import send
+from email_gateway.send import (build_bulk_emails, build_email,
+    filter_emailable_recipients, send_email)
 from market.models import Site
 
 LOG = logging.getLogger('ten.%s' % __name__)
@@ -252,4 +255,83 @@ class TestEmailDisplayHeaders(EnhancedTestCase):
         send_email(template='consumer_welcome', site=site, context=context)
         self.assertEqual(len(mail.outbox), 2)
         self.common_asserts(mail.outbox)
-        self.assertEqual(context.get('internal_cc', None), None)
\ No newline at end of file
+        self.assertEqual(context.get('internal_cc', None), None)
+
+
+class StubPayloadSigning(object):
+    """ Predictable payloads, so separately built emails can be compared. """
+    @staticmethod
+    def create_payload(**kwargs):
+        """ Return a payload that depends only on the email. """
+        return 'stub-%s:payload' % kwargs['email'].split('@')[0]
+
+
+class TestBuildBulkEmails(EnhancedTestCase):
+    """ Test build_bulk_emails builds the same emails as build_email. """
+
+    def setUp(self):
+        super(TestBuildBulkEmails, self).setUp()
+        self.payload_signing = send.PAYLOAD_SIGNING
+        self.generate_email_hash = send.generate_email_hash
+        send.PAYLOAD_SIGNING = StubPayloadSigning()
+        send.generate_email_hash = lambda email, mode: 'hash-%s' % len(email)
+
+    def tearDown(self):
+        send.PAYLOAD_SIGNING = self.payload_signing
+        send.generate_email_hash = self.generate_email_hash
+        super(TestBuildBulkEmails, self).tearDown()
+
+    def test_bulk_equals_build_email(self):
+        """ Assert each bulk email is identical to the one built by build_email
+        for that recipient, including one whose address is escaped.
+        """
+        recipients = ['tony@hotmail.com', 'geraldini@hi.com', 
+            "o'malley@example.com"]
+        context, site = build_common_context({'bouncing_checked': True})
+        messages = build_bulk_emails('consumer_welcome', site, recipients,
+            context.copy())
+        self.assertEqual(len(messages), 3)
+        for message in messages:
+            expected = build_email('consumer_welcome', site, message.to[0],
+                dict(context, headers={}))
+            self.assertEqual(message.from_email, expected.from_email)
+            self.assertEqual(message.subject, expected.subject)
+            self.assertEqual(message.extra_headers, expected.extra_headers)
+            self.assertEqual(message.body, expected.body)
+            self.assertEqual(message.alternatives, expected.alternatives)
+            self.assertTrue('stub-' in message.body)
+            self.assertTrue(send.PAYLOAD_SIGNING.create_payload(
+                email=message.to[0]) in message.extra_headers[
+                    'List-Unsubscribe'])
+
+
+class TestFilterEmailableRecipients(EnhancedTestCase):
+    """ Test filter_emailable_recipients. """
+
+    def test_filter_recipients(self):
+        """ Assert consumers not emailable or not active are dropped, addresses
+        not in the consumer table are kept, in a single query.
+        """
+        consumers = CONSUMER_FACTORY.create_consumers(create_count=4)
+        consumers[0].is_emailable = False
+        consumers[0].save()
+        consumers[1].is_active = False
+        consumers[1].save()
+        recipients = [consumer.email for consumer in consumers]
+        recipients.append('filter_emailable_recipients@example.com')
+        with self.assertNumQueries(1):
+            emailable = filter_emailable_recipients(recipients)
+        self.assertEqual(emailable, set(recipients[2:]))
+
+    def test_send_email_drops_recipient(self):
+        """ Assert send_email does not send to a consumer that is not emailable
+        when bouncing_checked is False.
+        """
+        consumers = CONSUMER_FACTORY.create_consumers(create_count=2)
+        consumers[0].is_emailable = False
+        consumers[0].save()
+        context, site = build_common_context({
+            'to_email': [consumer.email for consumer in consumers]})
+        send_email(template='consumer_welcome', site=site, context=context)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to[0], consumers[1].email)
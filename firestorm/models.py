@@ -9,7 +9,7 @@ from django.contrib.gis.measure import D
 from django.core.exceptions import ObjectDoesNotExist, ValidationError
 from django.core.validators import MinValueValidator
 from django.db import connection, transaction
-from django.db.models import Sum
+from django.db.models import Count, Sum
 from django.utils.translation import ugettext_lazy as _
 
 from advertiser.models import Advertiser
@@ -42,6 +42,8 @@ AD_REP_RANK_CHOICES = (
 BONUS_POOL_PERCENT = 10
 # How many ad_reps will share the Consumer Bonus Pool portion of an order.
 BONUS_POOL_MIN_SHARERS = 5
+# How many consumers an ad_rep needs to qualify for the Consumer Bonus Pool.
+BONUS_POOL_MIN_CONSUMERS = 10
 
 
 class AdRepManager(models.GeoManager):
@@ -103,6 +105,20 @@ class AdRepManager(models.GeoManager):
             raise AdRep.DoesNotExist
         return ad_rep
 
+    def get_qualified_consumer_points(self, ad_reps):
+        """ Return a dict of the consumer_points of each of these ad_reps that
+        is qualified, by ad_rep id. The consumers of all of them are counted in
+        one query.
+        """
+        ad_reps = list(ad_reps)
+        if not ad_reps:
+            return {}
+        consumer_counts = dict(AdRepConsumer.objects.filter(
+                ad_rep__id__in=[ad_rep.id for ad_rep in ad_reps]
+            ).values_list('ad_rep').annotate(Count('id')).order_by())
+        return dict((ad_rep.id, ad_rep.consumer_points) for ad_rep in ad_reps
+            if consumer_counts.get(ad_rep.id, 0) >= BONUS_POOL_MIN_CONSUMERS)
+
 
 class AdRep(Consumer):
     """ An Advertising Representative enrolled in the Firestorm product. """
@@ -222,7 +238,7 @@ class AdRep(Consumer):
 
     def is_qualified(self):
         """ Does this ad_rep have ten or more consumers? """
-        return bool(self.consumers().count() > 9)
+        return bool(self.consumers().count() >= BONUS_POOL_MIN_CONSUMERS)
 
     def qualified_consumer_points(self):
         """ The consumer_points of this ad_rep if the ad_rep has at least 10
@@ -574,6 +590,44 @@ class AdRepCompensation(models.Model):
         verbose_name_plural = 'Ad Rep Compensations'
 
 
+class BonusPoolFlyerManager(models.Manager):
+    """ Manager class of BonusPoolFlyer. """
+
+    @transaction.commit_on_success
+    def accrue(self, flyer_id):
+        """ Add to the consumer_points of each ad_rep a point per consumer of
+        the ad_rep who was sent this flyer, as recorded in FlyerConsumer.
+
+        The status of the flyer is claimed and the points added in one
+        transaction; a flyer already calculated is not added again. Return
+        whether points were added.
+        """
+        self.get_or_create(flyer_id=flyer_id)
+        cursor = connection.cursor()
+        cursor.execute("""
+            UPDATE firestorm_bonuspoolflyer
+            SET calculate_status = '2'
+            WHERE flyer_id = %s
+                AND calculate_status <> '2'""", [flyer_id])
+        if not cursor.rowcount:
+            return False
+        cursor.execute("""
+            UPDATE firestorm_adrep
+            SET consumer_points = consumer_points + flyer_counts.consumer_count,
+                ad_rep_modified_datetime = NOW()
+            FROM (
+                SELECT arc.ad_rep_id, COUNT(*) AS consumer_count
+                FROM coupon_flyerconsumer fc
+                JOIN firestorm_adrepconsumer arc
+                    ON arc.consumer_id = fc.consumer_id
+                WHERE fc.flyer_id = %s
+                GROUP BY arc.ad_rep_id
+                ) flyer_counts
+            WHERE firestorm_adrep.consumer_ptr_id = flyer_counts.ad_rep_id
+            """, [flyer_id])
+        return True
+
+
 class BonusPoolFlyer(models.Model):
     """ Has the consumer bonus pool already been incremented for ad reps having
     consumers who received this flyer?
@@ -581,6 +635,7 @@ class BonusPoolFlyer(models.Model):
     flyer = models.OneToOneField('coupon.Flyer')
     calculate_status = models.CharField(max_length=1, default='0',
         choices=CALCULATE_CHOICES)
+    objects = BonusPoolFlyerManager()
 
 
 class AdRepLeadManager(models.Manager):
@@ -685,3 +740,9 @@ class AdRepUSState(models.Model):
 # Signals for firestorm models:
 from firestorm.signals import (send_enrollment_email_callback,
     ad_rep_order_callback)
+from consumer.signals import on_save_consumer
+
+models.signals.post_save.connect(on_save_consumer, sender=AdRep,
+    dispatch_uid='ad_rep_consumer_counts')
+models.signals.post_save.connect(on_save_consumer, sender=AdRepLead,
+    dispatch_uid='ad_rep_lead_consumer_counts')
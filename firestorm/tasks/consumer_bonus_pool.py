@@ -3,7 +3,6 @@ from decimal import Decimal
 import logging
 
 from celery.task import Task
-from django.db.models import Count, F
 
 from firestorm.models import (AdRep, AdRepOrder, BonusPoolAllocation, 
     BonusPoolFlyer, BONUS_POOL_PERCENT, BONUS_POOL_MIN_SHARERS)
@@ -18,30 +17,37 @@ class AllocateBonusPool(Task):
 
     @staticmethod
     def get_qualified_ad_reps(ad_rep_order):
-        """ Return the list of ad_reps who should receive an allocation. """
-        qualified_ad_reps = []
+        """ Return the list of (ad_rep, consumer_points) of the ad_reps who
+        should receive an allocation.
+
+        The consumers of the candidate ad_reps are counted a set at a time:
+        those of this site, then if needed the close ad_reps.
+        """
+        selling_ad_rep = ad_rep_order.ad_rep
         # If qualified, the ad_rep who made the sale should be the first member
-        # of the list.
-        if ad_rep_order.ad_rep.is_qualified():
-            qualified_ad_reps.append(ad_rep_order.ad_rep)
-        # Get other qualified ad_reps for this site.
-        for ad_rep in (AdRep.objects
-                .filter(site=ad_rep_order.ad_rep.site)
-                .exclude(id=ad_rep_order.ad_rep.id)):
-            if ad_rep.is_qualified():
-                qualified_ad_reps.append(ad_rep)
+        # of the list, followed by other qualified ad_reps for this site.
+        candidates = [selling_ad_rep] + list(AdRep.objects
+            .filter(site__id=selling_ad_rep.site_id)
+            .exclude(id=selling_ad_rep.id))
+        points = AdRep.objects.get_qualified_consumer_points(candidates)
+        qualified_ad_reps = [(ad_rep, points[ad_rep.id])
+            for ad_rep in candidates if ad_rep.id in points]
         if len(qualified_ad_reps) < BONUS_POOL_MIN_SHARERS:
             # Assuming that if we get 50, at least 5 of them will be qualified.
-            close_ad_reps = ad_rep_order.ad_rep.close_ad_reps(miles=2000,
+            close_ad_reps = selling_ad_rep.close_ad_reps(miles=2000,
                 max_results=50)
             if not close_ad_reps:
                 LOG.warning('No close ad reps.')
             LOG.debug('close_ad_reps: %s' % close_ad_reps)
+            qualified_ids = set([ad_rep.id for ad_rep in candidates])
+            close_ad_reps = [ad_rep for ad_rep in close_ad_reps or []
+                if ad_rep.id not in qualified_ids]
+            points = AdRep.objects.get_qualified_consumer_points(close_ad_reps)
             for ad_rep in close_ad_reps:
-                if ad_rep not in qualified_ad_reps and ad_rep.is_qualified():
-                    qualified_ad_reps.append(ad_rep)
                 if len(qualified_ad_reps) == BONUS_POOL_MIN_SHARERS:
                     break
+                if ad_rep.id in points:
+                    qualified_ad_reps.append((ad_rep, points[ad_rep.id]))
         LOG.debug('qualified_ad_reps: %s' % qualified_ad_reps)
         return qualified_ad_reps
 
@@ -63,12 +69,8 @@ class AllocateBonusPool(Task):
             LOG.debug('Nothing to allocate.')
             return
         qualified_ad_reps = self.get_qualified_ad_reps(ad_rep_order)
-        total_consumer_points = 0
-        consumer_points_list = []
-        for ad_rep in qualified_ad_reps:
-            this_ad_rep_points = ad_rep.qualified_consumer_points()
-            total_consumer_points += this_ad_rep_points
-            consumer_points_list.append(this_ad_rep_points)
+        total_consumer_points = sum([consumer_points
+            for ad_rep, consumer_points in qualified_ad_reps])
         LOG.debug('total_consumer_points: %s' % total_consumer_points)
         if not total_consumer_points:
             LOG.warning('No consumer points for allocating %s.' % ad_rep_order)
@@ -79,20 +81,20 @@ class AllocateBonusPool(Task):
         running_allocation = Decimal(0)
         # qualified_ad_rep[0] is treated differently: gets the remainder after
         # rounding.
-        for counter, ad_rep in enumerate(qualified_ad_reps[1:]):
+        for ad_rep, consumer_points in qualified_ad_reps[1:]:
             allocation_this_ad_rep = Decimal(str(round(allocation_per_point *
-                ad_rep.qualified_consumer_points(), 2)))
+                consumer_points, 2)))
             LOG.debug('allocation_this_ad_rep: %s' % allocation_this_ad_rep)
             BonusPoolAllocation.objects.create(ad_rep=ad_rep,
                 ad_rep_order=ad_rep_order, amount=allocation_this_ad_rep,
-                consumer_points=consumer_points_list[counter + 1])
+                consumer_points=consumer_points)
             running_allocation += allocation_this_ad_rep
         # Remainder after rounding goes to ad_rep_order.ad_rep.
         remainder = Decimal(str(total_allocation)) - running_allocation
         LOG.debug('remainder: %s' % remainder)
-        BonusPoolAllocation.objects.create(ad_rep=qualified_ad_reps[0],
+        BonusPoolAllocation.objects.create(ad_rep=qualified_ad_reps[0][0],
             ad_rep_order=ad_rep_order, amount=remainder,
-            consumer_points=consumer_points_list[0])
+            consumer_points=qualified_ad_reps[0][1])
 
 
 class SaveFirestormOrder(Task):
@@ -111,30 +113,12 @@ class UpdateConsumerBonusPool(Task):
     consumers.
     """
     @staticmethod
-    def run(flyer_id, flyer_recipients):
-        """ For this flyer to these recipients, update the consumer bonus pool
-        for each ad_rep with related consumers.
-        
-        flyer_recipients = A list of consumer ids to whom this flyer was sent.
+    def run(flyer_id):
+        """ For this flyer, update the consumer bonus pool for each ad_rep with
+        related consumers among the recipients recorded in FlyerConsumer.
         """
-        # Is this flyer already calculated?
-        try:
-            bonus_pool_flyer = BonusPoolFlyer.objects.get(flyer__id=flyer_id)
-        except BonusPoolFlyer.DoesNotExist:
-            bonus_pool_flyer = BonusPoolFlyer.objects.create(flyer_id=flyer_id)
-        if bonus_pool_flyer.calculate_status == '2':
+        if not BonusPoolFlyer.objects.accrue(flyer_id):
             LOG.error("Flyer %s already calculated for bonus pool." % flyer_id)
-            return
-        bonus_pool_flyer.calculate_status = '1'
-        bonus_pool_flyer.save()
-        for ad_rep in (AdRep.objects
-                .filter(ad_rep_consumers__consumer__email__in=flyer_recipients)
-                .annotate(consumer_count=Count('ad_rep_consumers'))):
-            ad_rep.consumer_points = (
-                F('consumer_points') + ad_rep.consumer_count)
-            ad_rep.save()
-        bonus_pool_flyer.calculate_status = '2'
-        bonus_pool_flyer.save()
 
 ALLOCATE_BONUS_POOL = AllocateBonusPool()
 SAVE_FIRESTORM_ORDER = SaveFirestormOrder()
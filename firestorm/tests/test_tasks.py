@@ -13,7 +13,7 @@ from BeautifulSoup import BeautifulStoneSoup
 from advertiser.models import BillingRecord
 from consumer.factories.consumer_factory import CONSUMER_FACTORY
 from consumer.models import Consumer
-from coupon.models import Flyer
+from coupon.models import Flyer, FlyerConsumer
 from ecommerce.factories.order_factory import ORDER_FACTORY
 from ecommerce.models import Order, OrderItem, Promotion, PromotionCode
 from firestorm.factories.ad_rep_factory import AD_REP_FACTORY
@@ -177,25 +177,25 @@ class TestUpdateConsumerBonusPool(TestCase):
 
     def test_update_bonus_pool_good(self):
         """ Assert the consumer bonus pool count is accumulated for an ad_rep
-        with consumers in the recipient list.
+        with consumers in the recipient list, once per flyer.
         """
         ad_rep = AD_REP_FACTORY.create_ad_rep()
         self.assertEqual(ad_rep.consumer_points, 0)
         flyer = Flyer.objects.create(site_id=2, is_approved=True)
         consumer_ids = []
-        consumer_emails = []
         for consumer_x in range(5):
             email = 'test_update_bonus_pool_%s@example.com' % consumer_x
             consumer = Consumer.objects.create(site_id=2, email=email,
                 username=email)
             consumer_ids.append(consumer.id)
-            consumer_emails.append(email)
-        # Five consumers to receive this flyer
+        # Four consumers receive this flyer.
+        for consumer_id in consumer_ids[:4]:
+            FlyerConsumer.objects.create(flyer=flyer, consumer_id=consumer_id)
         # Two who receive this flyer will be related to this ad_rep.
         # A third consumer of this ad rep does not receive the flyer.
-        for consumer_id in consumer_ids[3:6]:
+        for consumer_id in consumer_ids[2:5]:
             AdRepConsumer.objects.create(ad_rep=ad_rep, consumer_id=consumer_id)
-        UPDATE_CONSUMER_BONUS_POOL(flyer.id, consumer_emails)
+        UPDATE_CONSUMER_BONUS_POOL(flyer.id)
         try:
             bonus_pool_flyer = BonusPoolFlyer.objects.get(flyer__id=flyer.id)
         except BonusPoolFlyer.DoesNotExist:
@@ -204,7 +204,10 @@ class TestUpdateConsumerBonusPool(TestCase):
         # flyer.
         self.assertEqual(bonus_pool_flyer.calculate_status, '2')
         ad_rep = AdRep.objects.get(id=ad_rep.id)
-        self.assertNotEqual(ad_rep.consumer_points, 0)
+        self.assertEqual(ad_rep.consumer_points, 2)
+        UPDATE_CONSUMER_BONUS_POOL(flyer.id)
+        ad_rep = AdRep.objects.get(id=ad_rep.id)
+        self.assertEqual(ad_rep.consumer_points, 2)
 
     def test_redo_update(self):
         """ Assert a flyer that has already been calculated into the consumer 
@@ -217,7 +220,7 @@ class TestUpdateConsumerBonusPool(TestCase):
         for consumer in flyer_recipients:
             AdRepConsumer.objects.create(ad_rep=ad_rep, consumer_id=consumer.id)
         BonusPoolFlyer.objects.create(flyer_id=flyer.id, calculate_status='2')
-        UPDATE_CONSUMER_BONUS_POOL(flyer.id, [])
+        UPDATE_CONSUMER_BONUS_POOL(flyer.id)
         ad_rep = AdRep.objects.get(id=ad_rep.id)
         self.assertEqual(ad_rep.consumer_points, 0)
 
@@ -579,6 +582,28 @@ class TestAllocateBonusPool(FirestormTestCase):
             ad_rep_order=ad_rep_order)
         self.assertEqual(len(bonus_pool_allocations), len(ad_reps))
 
+    def test_qualify_ad_reps_in_bulk(self):
+        """ Assert the consumers of the ad_reps of a site are counted in one
+        query, and the selling ad_rep is first among those qualified. The first
+        ad_rep has no consumers.
+        """
+        ad_reps = AD_REP_FACTORY.create_ad_reps(
+            create_count=BONUS_POOL_MIN_SHARERS + 1)
+        for ad_rep in ad_reps[1:]:
+            ad_rep.consumer_points = 2
+            ad_rep.save()
+            AD_REP_FACTORY.qualify_ad_rep(ad_rep)
+        order = ORDER_FACTORY.create_order()
+        ad_rep_order = AdRepOrder.objects.create(ad_rep=ad_reps[1], order=order)
+        ad_rep_order = AdRepOrder.objects.select_related('ad_rep').get(
+            id=ad_rep_order.id)
+        with self.assertNumQueries(2):
+            qualified_ad_reps = ALLOCATE_BONUS_POOL.get_qualified_ad_reps(
+                ad_rep_order)
+        self.assertEqual(qualified_ad_reps[0], (ad_reps[1], 2))
+        self.assertEqual(sorted([ad_rep.id for ad_rep, _ in qualified_ad_reps]),
+            sorted([ad_rep.id for ad_rep in ad_reps[1:]]))
+
     def test_allocation_not_qualified(self):
         """ Assert an ad_rep not qualified does not receive an allocation. """
         ad_rep = AD_REP_FACTORY.create_ad_rep()
@@ -0,0 +1,14 @@
+""" Config settings for geolocation app """
+
+# The most and fewest points of a simplified map shape, at each zoom level of
+# the maps, for the geometry tiles.
+GEOMETRY_TILE_ZOOMS = {
+    7: (80, 50),
+    10: (240, 150),
+    }
+
+# The zoom level of map data when none is requested.
+GEOMETRY_TILE_DEFAULT_ZOOM = 7
+
+# Bump to rebuild every geometry tile, when how they are built changes.
+GEOMETRY_TILE_VERSION = 2
@@ -0,0 +1 @@
+""" Management of the geolocation app of project ten. """
@@ -0,0 +1 @@
+""" Management commands of the geolocation app of project ten. """
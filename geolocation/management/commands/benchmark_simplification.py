@@ -0,0 +1,91 @@
+""" Management command to benchmark the simplification of map shapes. """
+import json
+import os
+import time
+
+from django.contrib.gis.geos import GEOSGeometry
+from django.core.management.base import NoArgsCommand
+
+from geolocation.config import GEOMETRY_TILE_ZOOMS
+from geolocation.service import transform_market_geom
+
+FIXTURE_NAMES = ('test_orange_geom.json', 'test_geolocation.json',
+    'us_county_fix.json')
+
+def get_fixture_geoms():
+    """ Return a list of (label, geom) of the geolocation fixture regions. """
+    fixture_dir = os.path.join(os.path.dirname(__file__), '..', '..',
+        'fixtures')
+    geoms = []
+    for fixture_name in FIXTURE_NAMES:
+        for obj in json.load(open(os.path.join(fixture_dir, fixture_name))):
+            if obj['fields'].get('geom'):
+                geom = GEOSGeometry(obj['fields']['geom'])
+                if not geom.srid:
+                    geom.srid = 4326
+                geoms.append(('%s %s' % (obj['model'].split('.')[-1],
+                    obj['pk']), geom))
+    return geoms
+
+def search_simplify(geom, default_max=80, simp_max=5000, min_points=50,
+        simp_start=35):
+    """ The tolerance search transform_market_geom made before it simplified
+    to a point count, kept as the baseline of this benchmark.
+    """
+    first_poly = geom.transform(900913, clone=True).simplify(simp_start)
+    poly = first_poly
+    temp_simp = int(first_poly.num_points * .45)
+    market_simp = int(first_poly.num_points * .1)
+    while poly.num_points > default_max and temp_simp <= simp_max:
+        poly = first_poly.simplify(temp_simp)
+        temp_simp += market_simp
+    if poly.num_points < min_points - 5:
+        temp_simp -= (int(market_simp * 2))
+        while poly.num_points < min_points and temp_simp >= 5:
+            poly = first_poly.simplify(temp_simp)
+            temp_simp -= market_simp
+            if temp_simp < 0 and poly.num_points < min_points:
+                if temp_simp <= simp_start - market_simp:
+                    temp_simp = 0
+                else:
+                    temp_simp = simp_start
+    if poly.num_points > min_points:
+        return poly
+    else:
+        return geom.transform(900913, clone=True)
+
+def time_simplify(simplify, geom, repeat, **kwargs):
+    """ Return the simplified geom and the mean seconds simplify took. """
+    start = time.time()
+    for _ in range(repeat):
+        poly = simplify(geom, **kwargs)
+    return poly, (time.time() - start) / repeat
+
+
+class Command(NoArgsCommand):
+    """
+    Simplify the geolocation fixture regions for each map zoom level, by the
+    tolerance search and by transform_market_geom, and report the points and
+    milliseconds of each.
+    """
+    help = 'Benchmark the simplification of map shapes.'
+    repeat = 5
+
+    def handle_noargs(self, **options):
+        totals = [0.0, 0.0]
+        for label, geom in get_fixture_geoms():
+            for zoom in sorted(GEOMETRY_TILE_ZOOMS):
+                default_max, min_points = GEOMETRY_TILE_ZOOMS[zoom]
+                results = [time_simplify(simplify, geom, self.repeat,
+                    default_max=default_max, min_points=min_points)
+                    for simplify in (search_simplify, transform_market_geom)]
+                for index, (poly, seconds) in enumerate(results):
+                    totals[index] += seconds
+                self.stdout.write(
+                    '%s zoom %s, %s points: search %s points %.1f ms, '
+                    'ranked %s points %.1f ms\n' % (label, zoom,
+                        geom.num_points, results[0][0].num_points,
+                        results[0][1] * 1000, results[1][0].num_points,
+                        results[1][1] * 1000))
+        self.stdout.write('Total: search %.1f ms, ranked %.1f ms\n' % (
+            totals[0] * 1000, totals[1] * 1000))
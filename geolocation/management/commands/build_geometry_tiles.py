@@ -0,0 +1,52 @@
+""" Management command to build the geometry tiles of the market maps. """
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand
+
+from geolocation.config import GEOMETRY_TILE_ZOOMS
+from geolocation.models import USCity, USZip
+from geolocation.service import build_geometry_tiles
+from market.models import Site
+
+
+class Command(NoArgsCommand):
+    """
+    Build the geometry tiles missing or of an old version for every county,
+    city and zip in a market, then the map data files of markets that have
+    none: those whose counties changed, clearing their geometry caches, and
+    those with a region rebuilt here.
+    """
+    help = 'Build the geometry tiles and map data files of the markets.'
+    option_list = NoArgsCommand.option_list + (
+        make_option('--rebuild', action='store_true', dest='rebuild',
+            default=False, help='Rebuild every tile.'),
+        )
+
+    def handle_noargs(self, **options):
+        county_ids = set()
+        for region_type, model in (('county', None), ('city', USCity),
+                ('zip', USZip)):
+            region_ids = set()
+            for tiles in build_geometry_tiles(region_type,
+                    rebuild=options['rebuild']).values():
+                region_ids.update(tiles)
+            self.stdout.write('Built tiles for %s %s regions.\n' % (
+                len(region_ids), region_type))
+            if model and region_ids:
+                region_ids = model.objects.filter(id__in=list(region_ids)
+                    ).values_list('us_county__id', flat=True)
+            county_ids.update(region_ids)
+        if county_ids:
+            for site_id in Site.objects.filter(
+                    us_county__id__in=list(county_ids)
+                    ).values_list('id', flat=True).distinct():
+                Site.objects.clear_geom_caches(site_id)
+        sites = Site.objects.exclude(id=1).only('id')
+        for site in sites:
+            for zoom in sorted(GEOMETRY_TILE_ZOOMS):
+                for region_file_type_extension in ('zip-geoms-data.txt',
+                        'city-geoms-data.txt'):
+                    site.get_or_set_geometries(region_file_type_extension,
+                        zoom)
+        self.stdout.write('Map data files are current for %s markets.\n' %
+            len(sites))
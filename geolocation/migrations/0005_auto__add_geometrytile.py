@@ -0,0 +1,90 @@
+# encoding: utf-8
+import datetime
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+
+class Migration(SchemaMigration):
+
+    def forwards(self, orm):
+        
+        # Adding model 'GeometryTile'
+        db.create_table('geolocation_geometrytile', (
+            ('id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('region_type', self.gf('django.db.models.fields.CharField')(max_length=6)),
+            ('region_id', self.gf('django.db.models.fields.PositiveIntegerField')()),
+            ('zoom', self.gf('django.db.models.fields.PositiveSmallIntegerField')()),
+            ('version', self.gf('django.db.models.fields.PositiveSmallIntegerField')()),
+            ('wkt', self.gf('django.db.models.fields.TextField')(blank=True)),
+        ))
+        db.send_create_signal('geolocation', ['GeometryTile'])
+
+        # Adding unique constraint on 'GeometryTile', fields ['region_type', 'region_id', 'zoom']
+        db.create_unique('geolocation_geometrytile', ['region_type', 'region_id', 'zoom'])
+
+
+    def backwards(self, orm):
+        
+        # Removing unique constraint on 'GeometryTile', fields ['region_type', 'region_id', 'zoom']
+        db.delete_unique('geolocation_geometrytile', ['region_type', 'region_id', 'zoom'])
+
+        # Deleting model 'GeometryTile'
+        db.delete_table('geolocation_geometrytile')
+
+
+    models = {
+        'geolocation.coordinate': {
+            'Meta': {'object_name': 'Coordinate'},
+            'cos_rad_lat': ('django.db.models.fields.FloatField', [], {}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'latitude': ('django.db.models.fields.FloatField', [], {}),
+            'longitude': ('django.db.models.fields.FloatField', [], {}),
+            'rad_lat': ('django.db.models.fields.FloatField', [], {}),
+            'rad_lon': ('django.db.models.fields.FloatField', [], {}),
+            'sin_rad_lat': ('django.db.models.fields.FloatField', [], {})
+        },
+        'geolocation.geometrytile': {
+            'Meta': {'unique_together': "(('region_type', 'region_id', 'zoom'),)", 'object_name': 'GeometryTile'},
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'region_id': ('django.db.models.fields.PositiveIntegerField', [], {}),
+            'region_type': ('django.db.models.fields.CharField', [], {'max_length': '6'}),
+            'version': ('django.db.models.fields.PositiveSmallIntegerField', [], {}),
+            'wkt': ('django.db.models.fields.TextField', [], {'blank': 'True'}),
+            'zoom': ('django.db.models.fields.PositiveSmallIntegerField', [], {})
+        },
+        'geolocation.uscity': {
+            'Meta': {'ordering': "('us_state', 'name')", 'object_name': 'USCity'},
+            'coordinate': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'us_cities'", 'to': "orm['geolocation.Coordinate']"}),
+            'geom': ('django.contrib.gis.db.models.fields.MultiPolygonField', [], {'null': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '33'}),
+            'us_county': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'us_cities'", 'to': "orm['geolocation.USCounty']"}),
+            'us_state': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'us_cities'", 'to': "orm['geolocation.USState']"})
+        },
+        'geolocation.uscounty': {
+            'Meta': {'ordering': "('us_state', 'name')", 'object_name': 'USCounty'},
+            'geom': ('django.contrib.gis.db.models.fields.MultiPolygonField', [], {'null': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '25'}),
+            'us_state': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'us_counties'", 'to': "orm['geolocation.USState']"})
+        },
+        'geolocation.usstate': {
+            'Meta': {'ordering': "('name',)", 'object_name': 'USState'},
+            'abbreviation': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '2'}),
+            'geom': ('django.contrib.gis.db.models.fields.MultiPolygonField', [], {'null': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '24'})
+        },
+        'geolocation.uszip': {
+            'Meta': {'ordering': "('code',)", 'object_name': 'USZip'},
+            'code': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '5'}),
+            'coordinate': ('django.db.models.fields.related.ForeignKey', [], {'default': '1', 'related_name': "'us_zips'", 'null': 'True', 'blank': 'True', 'to': "orm['geolocation.Coordinate']"}),
+            'geom': ('django.contrib.gis.db.models.fields.MultiPolygonField', [], {'null': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'us_city': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'us_zips'", 'to': "orm['geolocation.USCity']"}),
+            'us_county': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'us_zips'", 'to': "orm['geolocation.USCounty']"}),
+            'us_state': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'us_zips'", 'to': "orm['geolocation.USState']"})
+        }
+    }
+
+    complete_apps = ['geolocation']
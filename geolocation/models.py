@@ -4,6 +4,12 @@ from django.contrib.gis.db import models
 from django.contrib.gis.geos import Point
 from django.core.exceptions import ValidationError
 
+GEOMETRY_TILE_REGION_TYPE_CHOICES = (
+        ('county', 'County'),
+        ('city', 'City'),
+        ('zip', 'Zip'),
+    )
+
 
 class Coordinate(models.Model):
     """
@@ -121,9 +127,9 @@ class USZipManager(models.GeoManager):
         zips = self.raw("""
             SELECT z.id, z.code
             FROM geolocation_uszip z
-            JOIN market_site_us_county s_cn
-                ON s_cn.uscounty_id = z.us_county_id
-            WHERE s_cn.site_id = %s
+            JOIN market_sitezip sz
+                ON sz.us_zip_id = z.id
+            WHERE sz.site_id = %s
             """, [site.id])
         return zips
     
@@ -165,3 +171,26 @@ class USZip(models.Model):
         
     def delete(self):
         raise ValidationError('USZip cannot be deleted.')
+
+
+class GeometryTile(models.Model):
+    """
+    The shape of a county, city or zip for a map zoom level: transformed to
+    web mercator (900913), simplified and written as WKT to the meter.
+    Precomputed, so maps are served without GEOS work.
+    """
+    region_type = models.CharField(max_length=6,
+        choices=GEOMETRY_TILE_REGION_TYPE_CHOICES)
+    region_id = models.PositiveIntegerField()
+    zoom = models.PositiveSmallIntegerField()
+    version = models.PositiveSmallIntegerField()
+    wkt = models.TextField(blank=True,
+        help_text='Empty for a region with no geometry.')
+
+    class Meta:
+        unique_together = (('region_type', 'region_id', 'zoom'),)
+        verbose_name = 'Geometry Tile'
+        verbose_name_plural = 'Geometry Tiles'
+
+    def __unicode__(self):
+        return u'%s %s zoom %s' % (self.region_type, self.region_id, self.zoom)
@@ -1,61 +1,153 @@
 """ Service functions for geolocation app. """
+import logging
 import re
 
-from django.contrib.gis.geos import GEOSGeometry, Point
-from django.db import connection
+from django.contrib.gis.geos import Point
+from django.db import IntegrityError, connection, transaction
 
-from geolocation.models import USZip, USCity  
+from geolocation.config import (GEOMETRY_TILE_DEFAULT_ZOOM,
+    GEOMETRY_TILE_VERSION, GEOMETRY_TILE_ZOOMS)
+from geolocation.models import GeometryTile, USCity, USCounty, USZip
+from geolocation.simplify import simplify_to_point_count
 
-def build_county_geometries(site):
+LOG = logging.getLogger('ten.%s' % __name__)
+
+REGION_MODELS = {'county': USCounty, 'city': USCity, 'zip': USZip}
+
+
+def write_compact_wkt(geom):
+    """ Return the WKT of this geom with its coordinates rounded to whole
+    units, which are meters in web mercator (900913).
+    """
+    return re.sub(r'-?\d+\.\d+', lambda match: '%d' % round(
+        float(match.group(0))), geom.wkt)
+
+def build_region_shape(region, region_type, zoom):
+    """ Return the compact WKT of the shape of this county, city or zip for
+    this map zoom level; the point of a city or zip having no geometry; else
+    an empty string.
+    """
+    default_max, min_points = GEOMETRY_TILE_ZOOMS[zoom]
+    if region.geom:
+        poly = transform_market_geom(region.geom, default_max=default_max,
+            min_points=min_points)
+        if poly:
+            return write_compact_wkt(poly)
+    elif region_type != 'county' and region.coordinate:
+        return write_compact_wkt(Point(region.coordinate.longitude,
+            region.coordinate.latitude, srid=4326).transform(900913,
+                clone=True))
+    return ''
+
+@transaction.commit_on_success
+def build_geometry_tiles(region_type, region_ids=None, zooms=None,
+        rebuild=False):
+    """
+    Build the geometry tiles of these regions of region_type, or else of every
+    one in a market, at these zoom levels, or else at each. Tiles of this
+    GEOMETRY_TILE_VERSION are kept unless rebuild.
+    
+    Return a dict of zoom to a dict of region id to WKT, of the tiles built.
+    """
+    if zooms is None:
+        zooms = sorted(GEOMETRY_TILE_ZOOMS)
+    model = REGION_MODELS[region_type]
+    if region_ids is None:
+        if region_type == 'county':
+            market_regions = model.objects.filter(sites__isnull=False)
+        else:
+            market_regions = model.objects.filter(
+                us_county__sites__isnull=False)
+        regions = model.objects.filter(id__in=market_regions.values('id'))
+    else:
+        regions = model.objects.filter(id__in=list(region_ids))
+    current = set()
+    if not rebuild:
+        current_tiles = GeometryTile.objects.filter(region_type=region_type,
+            zoom__in=zooms, version=GEOMETRY_TILE_VERSION)
+        if region_ids is not None:
+            current_tiles = current_tiles.filter(region_id__in=list(region_ids))
+        current = set(current_tiles.values_list('region_id', 'zoom'))
+    if region_type != 'county':
+        regions = regions.select_related('coordinate')
+    built = dict([(zoom, {}) for zoom in zooms])
+    for region in regions.iterator():
+        for zoom in zooms:
+            if (region.id, zoom) not in current:
+                built[zoom][region.id] = build_region_shape(region,
+                    region_type, zoom)
+    cursor = connection.cursor()
+    for zoom in zooms:
+        region_ids_built = built[zoom].keys()
+        if not region_ids_built:
+            continue
+        GeometryTile.objects.filter(region_type=region_type, zoom=zoom,
+            region_id__in=region_ids_built).delete()
+        cursor.executemany("""
+            INSERT INTO "geolocation_geometrytile" (
+                "region_type", "region_id", "zoom", "version", "wkt")
+            VALUES (%s, %s, %s, %s, %s);""",
+            [(region_type, region_id, zoom, GEOMETRY_TILE_VERSION, wkt)
+                for region_id, wkt in built[zoom].iteritems()])
+    return built
+
+def get_geometry_tiles(region_type, region_ids, zoom):
+    """ Return a dict of region id to the WKT of its tile at this zoom, for
+    each of these regions of region_type; empty for a region having no
+    geometry. Tiles missing or of an old version are built now.
+    """
+    region_ids = list(region_ids)
+    tiles = GeometryTile.objects.filter(region_type=region_type, zoom=zoom,
+        version=GEOMETRY_TILE_VERSION, region_id__in=region_ids)
+    tile_dict = dict(tiles.values_list('region_id', 'wkt'))
+    for _ in range(2):
+        missing = set(region_ids) - set(tile_dict)
+        if not missing:
+            break
+        LOG.info('Building %s %s tiles for zoom %s.' % (len(missing),
+            region_type, zoom))
+        try:
+            tile_dict.update(build_geometry_tiles(region_type, missing,
+                [zoom])[zoom])
+        except IntegrityError:
+            # Another process built tiles first, maybe not all of these, so
+            # build the rest.
+            tile_dict = dict(tiles.values_list('region_id', 'wkt'))
+    # A region still without a tile, such as one that does not exist, has no
+    # shape.
+    for region_id in region_ids:
+        tile_dict.setdefault(region_id, '')
+    return tile_dict
+
+def build_county_geometries(site, zoom=GEOMETRY_TILE_DEFAULT_ZOOM):
     """ Return list of counties and their geometries for this market. """
-    county_list = []
-    map_coverage = ''
     site_counties = get_consumer_count_per_county(site)
-    for county in site_counties:
-        county_list.append(county[0])
-        poly = transform_market_geom(GEOSGeometry(county[1]))
-        if poly:
-            map_coverage = map_coverage + str(poly)  + ';' \
-                    +  str(county[0]) + ';' + str('directory/') + '|'
+    tiles = get_geometry_tiles('county',
+        [county_id for name, county_id, count in site_counties], zoom)
+    county_list = [name for name, county_id, count in site_counties]
+    map_coverage = ''.join(['%s;%s;directory/|' % (tiles[county_id], name)
+        for name, county_id, count in site_counties if tiles[county_id]])
     return county_list, map_coverage
 
-def build_zip_geometries(site):
+def build_zip_geometries(site, zoom=GEOMETRY_TILE_DEFAULT_ZOOM):
     """ Return list of zips and their geometries for this market. """
-    zip_data = ''
-    market_zips = USZip.objects.filter(
+    market_zips = list(USZip.objects.filter(
         us_county__sites__id=site.id
-        )
-    for _zip in market_zips:
-        if _zip.geom:
-            poly = transform_market_geom(_zip.geom, simp_start=15)
-            if poly:
-                zip_data += str(poly)  + ';' + str(_zip.code) + ';;' + \
-                str(_zip.id) + '|'
-        else:
-            zip_data += str(Point(
-                _zip.coordinate.longitude, _zip.coordinate.latitude, 
-                srid=4326).transform(900913, clone=True)) \
-                + ';' + str(_zip.code) + ';;' + str(_zip.id) + '|'
-    return zip_data
+        ).values_list('id', 'code'))
+    tiles = get_geometry_tiles('zip', [zip_id for zip_id, code in market_zips],
+        zoom)
+    return ''.join(['%s;%s;;%s|' % (tiles[zip_id], code, zip_id)
+        for zip_id, code in market_zips if tiles[zip_id]])
 
-def build_city_geometries(site):
+def build_city_geometries(site, zoom=GEOMETRY_TILE_DEFAULT_ZOOM):
     """ Return list of cities and their geometries for this market. """
-    city_data = ''
-    market_cities = USCity.objects.filter(
+    market_cities = list(USCity.objects.filter(
         us_county__sites__id=site.id
-        )
-    for city in market_cities:
-        if city.geom:
-            poly = transform_market_geom(city.geom, simp_start=15)
-            if poly:
-                city_data += str(poly)  + ';city_' + str(city.name) + ';;' + \
-                str(city.id) + '|'
-        else:
-            city_data += str(Point(
-                city.coordinate.longitude, city.coordinate.latitude, 
-                srid=4326).transform(900913, clone=True)) \
-                + ';city_' + str(city.name) + ';;' + str(city.id) + '|'
-    return city_data
+        ).values_list('id', 'name'))
+    tiles = get_geometry_tiles('city',
+        [city_id for city_id, name in market_cities], zoom)
+    return ''.join(['%s;city_%s;;%s|' % (tiles[city_id], name, city_id)
+        for city_id, name in market_cities if tiles[city_id]])
         
 def check_code_is_valid(code):
     """ Return true if us_zip is valid. """
@@ -84,7 +176,7 @@ def get_consumer_count_by_city(site, minimum=0):
     """
     cursor = connection.cursor()
     cursor.execute("""
-        SELECT ci.name, st.name, COUNT(c.user_ptr_id) AS consumer_count
+        SELECT ci.name, st.name, SUM(cc.consumer_count) AS consumer_count
         FROM geolocation_uscity ci
         JOIN geolocation_usstate st
             ON st.id = ci.us_state_id
@@ -92,11 +184,11 @@ def get_consumer_count_by_city(site, minimum=0):
             ON s_cn.uscounty_id = ci.us_county_id
         JOIN geolocation_uszip z
             ON z.us_city_id = ci.id
-        JOIN consumer_consumer c
-            ON c.consumer_zip_postal = z.code
+        JOIN consumer_consumercount cc
+            ON cc.us_zip_id = z.id
         WHERE s_cn.site_id = %s
         GROUP BY ci.name, st.name
-        HAVING COUNT(c.user_ptr_id) > %s
+        HAVING SUM(cc.consumer_count) > %s
         ORDER BY consumer_count DESC, ci.name""", [site.id, minimum])
     return cursor
 
@@ -106,13 +198,11 @@ def get_consumer_count_by_county(us_county):
     """
     cursor = connection.cursor()
     cursor.execute("""
-    SELECT COUNT(consumer.user_ptr_id) AS "id__count"
-    FROM consumer_consumer consumer
+    SELECT COALESCE(SUM(cc.consumer_count), 0) AS "id__count"
+    FROM consumer_consumercount cc
         INNER JOIN geolocation_uszip zip
-            ON consumer.geolocation_id = zip.id
-        INNER JOIN geolocation_uscounty county
-            ON zip.us_county_id = county.id
-    WHERE county.id = %s
+            ON cc.us_zip_id = zip.id
+    WHERE zip.us_county_id = %s
     """, [us_county.id])
     return cursor.fetchone()[0]
 
@@ -120,16 +210,17 @@ def get_consumer_count_per_county(site):
     """ Group counties in site and return count how many consumers in each.  """
     cursor = connection.cursor()
     cursor.execute("""
-        SELECT county.name, county.geom, count(user_ptr_id) as "consumer_count"
+        SELECT county.name, county.id,
+            COALESCE(SUM(cc.consumer_count), 0) as "consumer_count"
         FROM geolocation_uscounty county
             INNER JOIN market_site_us_county market_county_xref
                 ON county.id = market_county_xref.uscounty_id
-                AND site_id = %s
+                AND market_county_xref.site_id = %s
             INNER JOIN geolocation_uszip zip
                 ON zip.us_county_id = county.id
-            LEFT JOIN consumer_consumer
-                ON consumer_zip_postal = zip.code
-        GROUP BY county.name, county.geom
+            LEFT JOIN consumer_consumercount cc
+                ON cc.us_zip_id = zip.id
+        GROUP BY county.name, county.id
         ORDER BY consumer_count DESC, county.name ASC
         """, [site.id])
     return cursor.fetchall()
@@ -141,7 +232,8 @@ def qry_consumer_count_spread(site_id):
     cursor.execute("""
     SELECT geo_county.name AS "county", geo_county.id AS "county_id",
     geo_city.name AS "city", geo_city.id AS "city_id", 
-    geo_zip.code AS "zip", geo_zip.id AS "zip_id", COUNT(c.user_ptr_id) AS "zip_count"
+    geo_zip.code AS "zip", geo_zip.id AS "zip_id",
+    COALESCE(SUM(cc.mailable_count), 0) AS "zip_count"
     FROM market_site site
         INNER JOIN market_site_us_county market_county
             ON site.id = market_county.site_id
@@ -151,18 +243,9 @@ def qry_consumer_count_spread(site_id):
             ON geo_county.id = geo_zip.us_county_id
         INNER JOIN geolocation_uscity geo_city 
             ON geo_zip.us_city_id = geo_city.id
-        LEFT JOIN 
-            (Select c.user_ptr_id, c.consumer_zip_postal, c.site_id,
-                c.is_email_verified
-             From consumer_consumer c
-                 Inner Join consumer_consumer_email_subscription ces
-                    On c.user_ptr_id = ces.consumer_id
-                        And ces.emailsubscription_id = 1
-                        And c.site_id = %(site_id)s
-                        And c.is_emailable=True
-            ) c
-            ON c.consumer_zip_postal = geo_zip.code
-            AND c.site_id = site.id
+        LEFT JOIN consumer_consumercount cc
+            ON cc.us_zip_id = geo_zip.id
+            AND cc.site_id = site.id
     WHERE site.id = %(site_id)s
     GROUP by geo_county.name, geo_county.id, geo_city.name, geo_city.id, geo_zip.code, geo_zip.id
     ORDER BY geo_county.name, geo_city.name, geo_zip.code""",
@@ -175,37 +258,25 @@ def get_consumer_count_by_zip(us_zip):
     """
     cursor = connection.cursor()
     cursor.execute("""
-    SELECT COUNT(consumer.user_ptr_id) AS "id__count"
-    FROM consumer_consumer consumer
+    SELECT COALESCE(SUM(cc.consumer_count), 0) AS "id__count"
+    FROM consumer_consumercount cc
         INNER JOIN geolocation_uszip zip
-            ON consumer.geolocation_id = zip.id
+            ON cc.us_zip_id = zip.id
     WHERE zip.code = %s
     """, [us_zip.code])
     return cursor.fetchone()[0]
 
-def transform_market_geom(geom, default_max=80, simp_max=5000,
-        min_points=50, simp_start=35):
-    """ Return transformed market geom for map display. """
-    simp = simp_start # Smallest possible simp.
-    first_poly = geom.transform(900913, clone=True).simplify(simp)
-    poly = first_poly
-    temp_simp = int(first_poly.num_points * .45)
-    market_simp = int(first_poly.num_points * .1)
-    while poly.num_points > default_max and temp_simp <= simp_max:
-        poly = first_poly.simplify(temp_simp)  
-        temp_simp += market_simp
-    if poly.num_points < min_points - 5:
-        temp_simp -= (int(market_simp * 2))
-        while poly.num_points < min_points and temp_simp >= 5:
-            poly = first_poly.simplify(temp_simp)
-            temp_simp -= market_simp
-            if temp_simp < 0 and poly.num_points < min_points:
-                if temp_simp <= simp_start - market_simp:
-                    temp_simp = 0
-                else:
-                    temp_simp = simp_start
-    # Some geoms cannot be simplified (like Long Island).
-    if poly.num_points > min_points:
+def transform_market_geom(geom, default_max=80, min_points=50):
+    """ Return transformed market geom for map display, simplified to at most
+    default_max points.
+    """
+    poly = geom.transform(900913, clone=True)
+    if poly.num_points <= default_max or poly.geom_type not in (
+            'Polygon', 'MultiPolygon'):
         return poly
+    simplified = simplify_to_point_count(poly, default_max)
+    # Some geoms cannot be simplified (like Long Island).
+    if simplified.num_points > min_points:
+        return simplified
     else:
-        return geom.transform(900913, clone=True)
\ No newline at end of file
+        return poly
\ No newline at end of file
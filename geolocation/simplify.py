@@ -0,0 +1,146 @@
+""" Visvalingam-Whyatt simplification of polygons to a budget of points. """
+import heapq
+
+from django.contrib.gis.geos import MultiPolygon, Polygon
+
+def triangle_area(point_a, point_b, point_c):
+    """ Return the area of the triangle of these three points. """
+    return abs((point_b[0] - point_a[0]) * (point_c[1] - point_a[1]) -
+        (point_c[0] - point_a[0]) * (point_b[1] - point_a[1])) / 2.0
+
+def ring_area(points):
+    """ Return the area enclosed by these points of a ring. """
+    area = 0.0
+    for index, point in enumerate(points):
+        next_point = points[(index + 1) % len(points)]
+        area += point[0] * next_point[1] - next_point[0] * point[1]
+    return abs(area) / 2.0
+
+def rank_ring_vertices(coords, is_kept=False):
+    """
+    Return the vertices of this ring, less its closing vertex, and the
+    effective area of each: the area of the triangle it forms with its
+    neighbors when Visvalingam-Whyatt simplification removes it, never less
+    than that of a vertex removed before it.
+
+    The three vertices left, without which it is not a ring, have the area of
+    the ring, so that a simplification removing small areas drops small rings
+    whole; or if the ring is_kept, an infinite area.
+    """
+    points = list(coords)
+    if len(points) > 1 and points[0] == points[-1]:
+        points.pop()
+    count = len(points)
+    ranks = [None] * count
+    removed_area = 0.0
+    if count > 3:
+        previous = [index - 1 for index in range(count)]
+        previous[0] = count - 1
+        following = [index + 1 for index in range(count)]
+        following[-1] = 0
+        areas = [triangle_area(points[previous[index]], points[index],
+            points[following[index]]) for index in range(count)]
+        heap = [(area, index) for index, area in enumerate(areas)]
+        heapq.heapify(heap)
+        remaining = count
+        while remaining > 3:
+            area, index = heapq.heappop(heap)
+            if ranks[index] is not None or area != areas[index]:
+                # Removed already, or since pushed again with a new area.
+                continue
+            removed_area = max(removed_area, area)
+            ranks[index] = removed_area
+            before, after = previous[index], following[index]
+            following[before] = after
+            previous[after] = before
+            remaining -= 1
+            for neighbor in (before, after):
+                areas[neighbor] = max(removed_area, triangle_area(
+                    points[previous[neighbor]], points[neighbor],
+                    points[following[neighbor]]))
+                heapq.heappush(heap, (areas[neighbor], neighbor))
+    if is_kept:
+        final_area = float('inf')
+    else:
+        final_area = max(ring_area(points), removed_area)
+    ranks = [final_area if rank is None else rank for rank in ranks]
+    return points, ranks
+
+def rank_polygons(polygons):
+    """
+    Rank the vertices of these polygons, each a sequence of rings, exterior
+    first. Return a list of (points, ranks, final_rank) per ring, by polygon.
+
+    A hole ranks no higher than its exterior, so it is dropped with it. The
+    exterior of the largest polygon is never dropped.
+    """
+    exterior_areas = [polygon and ring_area(polygon[0]) or 0.0
+        for polygon in polygons]
+    largest = exterior_areas.index(max(exterior_areas))
+    ranked_polygons = []
+    for polygon_index, polygon in enumerate(polygons):
+        ranked_rings = []
+        for ring in polygon:
+            if ranked_rings:
+                exterior_rank = ranked_rings[0][2]
+                points, ranks = rank_ring_vertices(ring)
+                ranks = [min(rank, exterior_rank) for rank in ranks]
+            else:
+                points, ranks = rank_ring_vertices(ring,
+                    is_kept=polygon_index == largest)
+            ranked_rings.append((points, ranks, max(ranks or [0.0])))
+        ranked_polygons.append(ranked_rings)
+    return ranked_polygons
+
+def count_points(ranked_polygons, threshold):
+    """ Return how many points, closing points included, these ranked
+    polygons keep when vertices ranked below threshold are removed.
+    """
+    total = 0
+    for ranked_rings in ranked_polygons:
+        for points, ranks, final_rank in ranked_rings:
+            if final_rank >= threshold:
+                total += len([rank for rank in ranks if rank >= threshold]) + 1
+    return total
+
+def simplify_to_point_count(geom, max_points):
+    """
+    Return this Polygon or MultiPolygon simplified to at most max_points
+    points, removing the vertices of least effective area first and dropping
+    rings too small to keep. Vertices are ranked once, and the threshold
+    keeping the most points within the budget is found by bisection.
+    """
+    if geom.geom_type == 'Polygon':
+        polygons = [geom.coords]
+    else:
+        polygons = geom.coords
+    if not polygons:
+        return geom
+    ranked_polygons = rank_polygons(polygons)
+    thresholds = sorted(set([rank for ranked_rings in ranked_polygons
+        for points, ranks, final_rank in ranked_rings for rank in ranks]))
+    low, high = 0, len(thresholds) - 1
+    while low < high:
+        middle = (low + high) // 2
+        if count_points(ranked_polygons, thresholds[middle]) <= max_points:
+            high = middle
+        else:
+            low = middle + 1
+    threshold = thresholds[low]
+    simplified = []
+    for ranked_rings in ranked_polygons:
+        rings = []
+        for points, ranks, final_rank in ranked_rings:
+            if final_rank < threshold:
+                continue
+            ring = [point for point, rank in zip(points, ranks)
+                if rank >= threshold]
+            rings.append(ring + ring[:1])
+        if rings:
+            simplified.append(Polygon(*rings))
+    if geom.geom_type == 'Polygon':
+        result = simplified[0]
+    else:
+        result = MultiPolygon(*simplified)
+    result.srid = geom.srid
+    return result
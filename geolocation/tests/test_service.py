@@ -1,10 +1,12 @@
 """ Tests for service functions of geolocation app. """
 #pylint: disable=C0103
 from decimal import Decimal
+import math
 from random import randrange
 
 from django.conf import settings
-from django.contrib.gis.geos import GEOSGeometry
+from django.contrib.gis.geos import GEOSGeometry, MultiPolygon, Polygon
+from django.db import IntegrityError
 from django.test import TestCase
 
 from advertiser.models import Business, Location
@@ -12,10 +14,12 @@ from common.test_utils import EnhancedTestCase
 from consumer.factories.consumer_factory import CONSUMER_FACTORY
 from consumer.models import Consumer
 from geolocation.geocode_address import GEOCODE_LOCATION
-from geolocation.models import USCounty, USZip
+from geolocation import service
+from geolocation.models import GeometryTile, USCounty, USZip
 from geolocation.service import (build_county_geometries, get_city_and_state,
     get_consumer_count_per_county, get_consumer_count_by_county,
-    get_consumer_count_by_zip, build_zip_geometries, qry_consumer_count_spread)
+    get_consumer_count_by_zip, build_zip_geometries, get_geometry_tiles,
+    qry_consumer_count_spread, transform_market_geom)
 from market.models import Site
 
 
@@ -141,6 +145,65 @@ class TestService(TestCase):
         self.assertTrue('EMPTY' not in zip_geoms)
         self.assertEqual(len(zip_geoms), len(site.get_or_set_geometries('zip-geoms-data.txt')))
 
+    def test_geometry_tiles(self):
+        """ Assert geometry tiles are built once, as compact WKT in 900913, and
+        then read in one query.
+        """
+        site = Site.objects.get(id=2)
+        county_ids = list(site.us_county.values_list('id', flat=True))
+        tiles = get_geometry_tiles('county', county_ids, 7)
+        self.assertEqual(sorted(tiles), sorted(county_ids))
+        self.assertEqual(GeometryTile.objects.filter(region_type='county',
+            zoom=7).count(), len(county_ids))
+        for wkt in tiles.values():
+            self.assertTrue('.' not in wkt)
+            if wkt:
+                self.assertTrue(GEOSGeometry(wkt).num_points > 10)
+        with self.assertNumQueries(1):
+            self.assertEqual(get_geometry_tiles('county', county_ids, 7),
+                tiles)
+
+    def test_geometry_tiles_race(self):
+        """ Assert when another process built only some of the tiles first, the
+        rest are built, and a region that has no tile gets an empty one.
+        """
+        site = Site.objects.get(id=2)
+        county_ids = list(site.us_county.values_list('id', flat=True))
+        build_geometry_tiles = service.build_geometry_tiles
+        def build_first(region_type, region_ids, zooms):
+            """ Build the tile of the first county, as another process would,
+            and fail.
+            """
+            service.build_geometry_tiles = build_geometry_tiles
+            build_geometry_tiles(region_type, county_ids[:1], zooms)
+            raise IntegrityError
+        service.build_geometry_tiles = build_first
+        try:
+            tiles = get_geometry_tiles('county', county_ids + [0], 7)
+        finally:
+            service.build_geometry_tiles = build_geometry_tiles
+        self.assertEqual(sorted(tiles), sorted(county_ids + [0]))
+        self.assertEqual(tiles[0], '')
+        self.assertEqual(GeometryTile.objects.filter(region_type='county',
+            zoom=7).count(), len(county_ids))
+
+    def test_transform_market_geom(self):
+        """ Assert a shape is simplified within the points budget, keeping its
+        area and dropping an island too small to show.
+        """
+        circle = [(math.cos(math.pi * index / 500) * .5,
+            math.sin(math.pi * index / 500) * .5) for index in range(1000)]
+        island = [(1, 1), (1.001, 1), (1.001, 1.001), (1, 1.001), (1, 1)]
+        geom = MultiPolygon(Polygon(circle + circle[:1]), Polygon(island),
+            srid=4326)
+        poly = transform_market_geom(geom)
+        self.assertTrue(50 < poly.num_points <= 80)
+        self.assertEqual(len(poly), 1)
+        full_area = geom.transform(900913, clone=True).area
+        self.assertTrue(abs(poly.area - full_area) < full_area * .01)
+        poly = transform_market_geom(geom, default_max=240, min_points=150)
+        self.assertTrue(150 < poly.num_points <= 240)
+
     def test_zip_detail_good(self):
         """ Assert service method returns city and state for this zip. """
         city, state = get_city_and_state('12550')
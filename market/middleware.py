@@ -1,10 +1,8 @@
 """ Middleware logic for market app. """
-import copy
 import datetime
 import logging
 import re
 
-from django.core.exceptions import ObjectDoesNotExist
 from django.http import HttpResponsePermanentRedirect
 
 from market.models import Site
@@ -89,6 +87,7 @@ class URLHandlerMiddleware(object):
         """ If the domain name is NOT the unified name, configure redirect. """
         # Example paths: '/', '/reno/', '/reno/sales/', '/sales/'
         # Leading and trailing slashes create empty nodes, so remove them.
+        routing_index = Site.objects.get_routing_index()
         path_list = path_info.split('/')
         for node in path_list:
             if node == '':
@@ -103,23 +102,21 @@ class URLHandlerMiddleware(object):
                 request.META['page_locale'] = path_list[0]
             # Check relevant dir to see if it is a valid local directory_name.
             # Ex: 'hudson-valley', 'reno'
-            try:
-                this_site = Site.objects.get_or_set_cache().values('id',
-                    'id').get(directory_name__iexact=path_list[dir_to_check])
-                request.flags['local_dir_site_id'] = this_site['id']
-            except (IndexError, ObjectDoesNotExist):
-                # The directory is not a valid local site dir.
-                # They are on the 10coupons.com corp site.
-                # or deep in a local site: 10renocoupons.com/sales/hello/
-                # or their only path is i18n: 10hudsonvalleycoupons.com/sp-us/
-                pass
+            # If it is not a valid local site dir, they are on the
+            # 10coupons.com corp site,
+            # or deep in a local site: 10renocoupons.com/sales/hello/
+            # or their only path is i18n: 10hudsonvalleycoupons.com/sp-us/
+            if dir_to_check < len(path_list):
+                local_dir_site_id = routing_index.directory_names.get(
+                    path_list[dir_to_check].lower())
+                if local_dir_site_id:
+                    request.flags['local_dir_site_id'] = local_dir_site_id
         if host[0] != self.unified_host.lower():
             # Check normalized host againt site cache.
             request.flags['redirect_flag'] = 1
-            try:
-                this_site = Site.objects.get_or_set_cache().values('id',
-                    'directory_name').get(domain__iexact=host[0])
-                request.flags['site_id'] = this_site['id']
+            this_site = routing_index.domains.get(host[0].lower())
+            if this_site:
+                request.flags['site_id'] = this_site[0]
                 if request.flags[
                         'local_dir_site_id'] == request.flags['site_id']:
                     # This case like 10hudsonvalleycoupons.com/hudson-valley/.
@@ -135,8 +132,8 @@ class URLHandlerMiddleware(object):
                         request.flags['local_dir_site_id'] = 0
                     if request.flags['i18n_flag']:
                         insert_at = 1
-                    path_list.insert(insert_at, this_site['directory_name'])
-            except ObjectDoesNotExist:
+                    path_list.insert(insert_at, this_site[1])
+            else:
                 # Not unified domain and not valid local domain...
                 # Case: local site not launched yet?
                 # 10localcoupons.com and strausmedia.com etc will also end up
@@ -167,7 +164,8 @@ class URLHandlerMiddleware(object):
         Because we want to do string manipulation with 'host', it will be a
         (mutable) list of one item.
         """
-        request.flags = copy.deepcopy(self.flags)
+        # Flags are flat, so a shallow copy is enough.
+        request.flags = dict(self.flags)
         # Get the domain name of the current request, as a (mutable) list.
         host = [request.get_host()]
         path_info = request.META['PATH_INFO']
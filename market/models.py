@@ -8,20 +8,24 @@ Differences:
     from request.HTTP_HOST in market.middleware.
 """
 #pylint: disable=W0613
+import glob
 import logging
 from decimal import Decimal
-from math import cos, sin, radians
+from math import asin, cos, sin, sqrt, radians
 import os
+import time
 
 from django.conf import settings
 from django.contrib.gis.db import models
-from django.contrib.gis.geos import Point
+from django.db import connection, transaction
 from django.contrib.gis.measure import D
 from django.core.cache import cache
 from django.utils.translation import ugettext_lazy as _
 from django.template import Context
 from django.template.loader import get_template
 
+from common.utils import write_file_atomically
+from geolocation.config import GEOMETRY_TILE_DEFAULT_ZOOM
 from geolocation.models import Coordinate, USCounty, USState, USZip
 from geolocation.service import build_zip_geometries, build_city_geometries
 
@@ -37,6 +41,188 @@ class SiteDeferredManager(models.Manager):
             'envelope', 'geom', 'point')
 
 
+SITE_ROUTING_VERSION_KEY = 'site-routing-version'
+
+
+class SiteRoutingIndex(object):
+    """ A process-local index of cacheable sites, for routing requests without
+    touching the database.
+
+    domains: lowercased domain -> (site id, directory_name)
+    directory_names: lowercased directory_name -> site id
+
+    The index is rebuilt when the version in cache (bumped by
+    SiteManager.clear_cache in any process) differs from the version it was
+    built at. If there is no version in cache, it is rebuilt once it is older
+    than max_age seconds.
+    """
+    max_age = 300
+
+    def __init__(self):
+        self.version = None
+        self.built_time = 0
+        self.domains = {}
+        self.directory_names = {}
+
+    def invalidate(self):
+        """ Force a rebuild on next use. """
+        self.built_time = 0
+
+    def is_stale(self, version):
+        """ Is this index out of date with this version from cache? """
+        if not self.built_time:
+            return True
+        if version is None:
+            return time.time() - self.built_time > self.max_age
+        return version != self.version
+
+    def build(self, version):
+        """ Load the sites and index them, at this version. """
+        domains = {}
+        directory_names = {}
+        for site_id, domain, directory_name in (Site.objects.cacheable_sites()
+                .values_list('id', 'domain', 'directory_name')):
+            if domain:
+                domains[domain.lower()] = (site_id, directory_name)
+            if directory_name:
+                directory_names[directory_name.lower()] = site_id
+        self.domains = domains
+        self.directory_names = directory_names
+        self.version = version
+        self.built_time = time.time()
+        LOG.debug('SiteRoutingIndex built at version %s' % version)
+
+    def refresh(self):
+        """ Rebuild this index if it is stale, and return it. """
+        version = cache.get(SITE_ROUTING_VERSION_KEY)
+        if self.is_stale(version):
+            self.build(version)
+        return self
+
+SITE_ROUTING_INDEX = SiteRoutingIndex()
+
+# The radius of the sphere PostGIS measures distances on, in meters.
+EARTH_RADIUS = 6370986
+
+CLOSE_SITE_FIELDS = ('id', 'name', 'directory_name', 'domain',
+    'default_zip_postal', 'default_state_province__abbreviation',
+    'default_state_province__name')
+
+
+def get_sphere_distance(longitude_1, latitude_1, longitude_2, latitude_2):
+    """ Return the distance in meters between two points, in degrees, on the
+    sphere.
+    """
+    longitude_1, latitude_1, longitude_2, latitude_2 = [radians(degrees)
+        for degrees in (longitude_1, latitude_1, longitude_2, latitude_2)]
+    haversine = sin((latitude_2 - latitude_1) / 2) ** 2 + cos(latitude_1) * \
+        cos(latitude_2) * sin((longitude_2 - longitude_1) / 2) ** 2
+    return 2 * EARTH_RADIUS * asin(min(1, sqrt(haversine)))
+
+
+class SiteProximityIndex(SiteRoutingIndex):
+    """ A process-local index of the envelopes and zips of sites, for finding
+    the sites close to or including a zip, and the zips of a site, without
+    touching the database. Kept current as the SiteRoutingIndex is.
+
+    bounds: a list of (min lon, min lat, max lon, max lat, close site dict)
+    zip_sites: zip code -> tuple of ids of the sites including it
+    site_zips: site id -> tuple of the zip codes it includes
+    zips: zip code -> (longitude, latitude)
+    close_sites: (zip code, miles, max results, excluded site id) -> list of
+        (distance, close site dict); the zip-to-nearest-sites lookups so far
+
+    Markets number in the tens, so a scan of their bounds is the index. Each
+    known zip is looked up once per build.
+    """
+    def __init__(self):
+        super(SiteProximityIndex, self).__init__()
+        self.bounds = []
+        self.zip_sites = {}
+        self.site_zips = {}
+        self.zips = {}
+        self.close_sites = {}
+
+    def build(self, version):
+        """ Load the site envelopes and zips, at this version. """
+        bounds = []
+        for close_site in Site.objects.exclude(envelope=None).values(
+                'envelope', *CLOSE_SITE_FIELDS):
+            envelope = close_site.pop('envelope')
+            bounds.append(envelope.extent + (close_site,))
+        zip_sites = {}
+        site_zips = {}
+        for code, site_id in SiteZip.objects.values_list('code',
+                'site').order_by('site', 'code'):
+            zip_sites.setdefault(code, []).append(site_id)
+            site_zips.setdefault(site_id, []).append(code)
+        self.bounds = bounds
+        self.zip_sites = dict((code, tuple(site_ids))
+            for code, site_ids in zip_sites.iteritems())
+        self.site_zips = dict((site_id, tuple(codes))
+            for site_id, codes in site_zips.iteritems())
+        self.zips = {}
+        self.close_sites = {}
+        self.version = version
+        self.built_time = time.time()
+        LOG.debug('SiteProximityIndex built at version %s' % version)
+
+    def get_zip(self, code):
+        """ Return the (longitude, latitude) of this zip code, or None if it
+        is not known.
+        """
+        try:
+            return self.zips[code]
+        except KeyError:
+            for longitude, latitude in USZip.objects.filter(
+                    code=code).values_list('coordinate__longitude',
+                    'coordinate__latitude')[:1]:
+                if longitude is not None:
+                    self.zips[code] = (longitude, latitude)
+                    return self.zips[code]
+            return None
+
+    def get_close_sites(self, code, miles, max_results, exclude_site_id):
+        """ Return a list of the dicts of the max_results closest sites within
+        miles of this zip, nearest first, or None if the zip is not known.
+        Each has the distance from the zip to the envelope of the site.
+        """
+        us_zip = self.get_zip(code)
+        if not us_zip:
+            return None
+        key = (code, miles, max_results, exclude_site_id)
+        try:
+            close_sites = self.close_sites[key]
+        except KeyError:
+            longitude, latitude = us_zip
+            meters = D(mi=miles).m
+            close_sites = []
+            for min_lon, min_lat, max_lon, max_lat, close_site in self.bounds:
+                if close_site['id'] == exclude_site_id:
+                    continue
+                # The nearest point of the envelope to the zip.
+                distance = get_sphere_distance(longitude, latitude,
+                    min(max(longitude, min_lon), max_lon),
+                    min(max(latitude, min_lat), max_lat))
+                if distance <= meters:
+                    close_sites.append((distance, close_site))
+            close_sites.sort(key=lambda close_site: close_site[0])
+            close_sites = close_sites[:max_results]
+            self.close_sites[key] = close_sites
+        return [dict(close_site, distance=D(m=distance))
+            for distance, close_site in close_sites]
+
+    def get_site_ids_this_zip(self, code):
+        """ Return a tuple of the ids of the sites including this zip code. """
+        return self.zip_sites.get(code, ())
+
+    def get_zips_this_site(self, site_id):
+        """ Return a tuple of the zip codes this site includes. """
+        return self.site_zips.get(site_id, ())
+
+SITE_PROXIMITY_INDEX = SiteProximityIndex()
+
+
 class SiteManager(models.GeoManager):
     """ Default manager for Site model. """ 
     def get_current(self):
@@ -79,10 +265,25 @@ class SiteManager(models.GeoManager):
             cache.set(key, site_count)
         return site_count
 
+    @staticmethod
+    def get_routing_index():
+        """ Return the process-local SiteRoutingIndex, up to date. """
+        return SITE_ROUTING_INDEX.refresh()
+
+    @staticmethod
+    def get_proximity_index():
+        """ Return the process-local SiteProximityIndex, up to date. """
+        return SITE_PROXIMITY_INDEX.refresh()
+
     @staticmethod
     def clear_cache():
-        """ Clears the Site object cache. """
+        """ Clears the Site object cache, and invalidates the routing and
+        proximity indexes of every process.
+        """
         cache.delete_many(['site-cache', 'site-state-list', 'site-count'])
+        cache.set(SITE_ROUTING_VERSION_KEY, repr(time.time()))
+        SITE_ROUTING_INDEX.invalidate()
+        SITE_PROXIMITY_INDEX.invalidate()
     
     @staticmethod
     def clear_geom_caches(site_id):
@@ -91,24 +292,22 @@ class SiteManager(models.GeoManager):
         """
         cache.delete_many(['site-markers', 'site-%s-counties' % site_id,
             'site-%s-close-sites' % site_id, 'site-%s-geom' % site_id])
-        zip_data_file = '%sdynamic/map-data/site-%s-zip-geom-data.txt' \
-            % (settings.MEDIA_ROOT, site_id)
-        if os.path.exists(zip_data_file):
-            os.remove(zip_data_file)
+        for data_filename in glob.glob('%sdynamic/map-data/site-%s-*'
+                % (settings.MEDIA_ROOT, site_id)):
+            try:
+                os.remove(data_filename)
+            except OSError:
+                # Already removed by another process.
+                pass
 
     @staticmethod
     def get_sites_this_zip(code):
         """ Return all the sites related to this zip code. """
-        sites = Site.objects.raw("""
-            SELECT site.*
-            FROM market_site site
-            JOIN market_site_us_county s_cn
-                ON s_cn.site_id = site.id
-            JOIN geolocation_uszip z
-
-                ON z.us_county_id = s_cn.uscounty_id
-                WHERE z.code = %s""", [code])
-        return sites
+        site_ids = Site.objects.get_proximity_index().get_site_ids_this_zip(
+            code)
+        if not site_ids:
+            return Site.objects.none()
+        return Site.objects.filter(id__in=site_ids)
 
 class Site(models.Model):
     """ Sites are 10LocalCoupons, 10HudsonValleyCoupons etc. """
@@ -226,6 +425,7 @@ class Site(models.Model):
         except (ValueError, AttributeError, KeyError) as error:
             LOG.info('Site %s.save(): %s' % (self.name, error)) 
         super(Site, self).save()
+        SiteZip.objects.rebuild(site_ids=[self.id])
         return self
         
     def close_sites(self, code=None, miles=100, max_results=5):
@@ -234,22 +434,13 @@ class Site(models.Model):
         """
         if not code:
             code = self.default_zip_postal
-        sites = None
-        try:
-            coordinate = USZip.objects.select_related('coordinate').only(
-                'coordinate__longitude', 'coordinate__latitude'
-                ).get(code=code).coordinate
-            _point = Point(coordinate.longitude, coordinate.latitude)
-            sites = Site.objects.filter(envelope__distance_lte=(_point, 
-                D(mi=miles))).exclude(id=self.id).distance(_point).values(
-                'id', 'name', 'directory_name', 'domain', 'default_zip_postal',
-                'default_state_province__abbreviation', 
-                'default_state_province__name', 'distance').order_by(
-                'distance')[:max_results]
-        except USZip.DoesNotExist:
-            pass
-        return sites
+        return Site.objects.get_proximity_index().get_close_sites(code, miles,
+            max_results, self.id)
    
+    def get_zip_codes(self):
+        """ Return a tuple of the zip codes of this market. """
+        return Site.objects.get_proximity_index().get_zips_this_site(self.id)
+
     def get_name_no_spaces(self):
         """ Return market name with no spaces (for coupon web logo display). """
         name_no_spaces = str(self.name)
@@ -290,24 +481,26 @@ class Site(models.Model):
             counties = self.us_county.values_list('name', flat=True)
             cache.set(("site-%s-counties" % self.id), counties)
         return counties
-    
-    def get_or_set_geometries(self, region_file_type_extension):
-        """  Get zip geometry data from cached file if it exists, or set cached  
-        file and return.
+
+    def get_or_set_geometries(self, region_file_type_extension,
+            zoom=GEOMETRY_TILE_DEFAULT_ZOOM):
+        """  Get zip or city geometry data for this zoom level from cached file
+        if it exists, or else build it from the geometry tiles, set cached file
+        and return.
         """
-        data_filename = '%sdynamic/map-data/site-%s-%s' \
-            % (settings.MEDIA_ROOT, self.id, region_file_type_extension)
+        data_filename = '%sdynamic/map-data/site-%s-%s-%s' \
+            % (settings.MEDIA_ROOT, self.id, zoom, region_file_type_extension)
         if os.path.exists(data_filename):
             data_file = open(data_filename)
             geoms = data_file.read()
+            data_file.close()
         else:
             if 'city' in region_file_type_extension:
-                geoms = build_city_geometries(self)
+                geoms = build_city_geometries(self, zoom)
             elif 'zip' in region_file_type_extension:
-                geoms = build_zip_geometries(self)
-            data_file = open(data_filename, 'w')
-            data_file.write(geoms)
-        data_file.close()
+                geoms = build_zip_geometries(self, zoom)
+            geoms = geoms.encode('utf-8')
+            write_file_atomically(data_filename, geoms)
         return geoms
     
     def get_or_set_geom(self):
@@ -375,6 +568,60 @@ class Site(models.Model):
             return False
 
 
+class SiteZipManager(models.Manager):
+    """ Default manager for SiteZip. """
+    def rebuild(self, site_ids=None, county_ids=None, zip_ids=None):
+        """ Rebuild the zips of these sites, the zips in these counties, or
+        these zips, from the counties of the sites. Then clear the site cache,
+        for the index of every process to reload them.
+        """
+        for column, ids, delete_sql in (
+                ('s_cn.site_id', site_ids, """
+                    DELETE FROM market_sitezip WHERE site_id IN %s"""),
+                ('z.us_county_id', county_ids, """
+                    DELETE FROM market_sitezip sz
+                    USING geolocation_uszip z
+                    WHERE z.id = sz.us_zip_id
+                        AND z.us_county_id IN %s"""),
+                ('z.id', zip_ids, """
+                    DELETE FROM market_sitezip WHERE us_zip_id IN %s""")):
+            if ids:
+                break
+        else:
+            return
+        ids = tuple(ids)
+        cursor = connection.cursor()
+        cursor.execute(delete_sql, [ids])
+        cursor.execute("""
+            INSERT INTO market_sitezip (site_id, us_zip_id, code)
+            SELECT s_cn.site_id, z.id, z.code
+            FROM market_site_us_county s_cn
+            JOIN geolocation_uszip z
+                ON z.us_county_id = s_cn.uscounty_id
+            WHERE %s IN %%s""" % column, [ids])
+        transaction.commit_unless_managed()
+        Site.objects.clear_cache()
+
+
+class SiteZip(models.Model):
+    """ A zip of a market, by the counties of the market. Rebuilt as the
+    counties of a market and the zips change, for resolving the sites of a zip
+    and the zips of a site without a join.
+    """
+    site = models.ForeignKey(Site, related_name='site_zips')
+    us_zip = models.ForeignKey(USZip, related_name='site_zips')
+    code = models.CharField('Zip', max_length=9, db_index=True)
+    objects = SiteZipManager()
+
+    class Meta:
+        verbose_name = 'Site Zip'
+        verbose_name_plural = 'Site Zips'
+        unique_together = (('site', 'us_zip'),)
+
+    def __unicode__(self):
+        return u'%s %s' % (self.site_id, self.code)
+
+
 class TwitterAccount(models.Model):
     """ Stores the Twitter account info for each local site """
     site = models.OneToOneField(Site, verbose_name='related market', 
@@ -397,4 +644,21 @@ class TwitterAccount(models.Model):
         verbose_name_plural = _('Twitter Accounts',)
     
     def __unicode__(self):
-        return self.twitter_name if self.twitter_name else u'%s' % self.id
\ No newline at end of file
+        return self.twitter_name if self.twitter_name else u'%s' % self.id
+
+
+####### Signals for Site #######
+from market.signals import (site_changed_callback, site_counties_changed,
+    zip_changed)
+
+# Site.save clears the cache before writing, and fixtures skip Site.save, so
+# also clear it after any write.
+models.signals.post_save.connect(site_changed_callback, sender=Site,
+    dispatch_uid=__name__)
+models.signals.post_delete.connect(site_changed_callback, sender=Site,
+    dispatch_uid=__name__)
+# Rebuild the zips of a site as its counties change, or as zips are added.
+models.signals.m2m_changed.connect(site_counties_changed,
+    sender=Site.us_county.through, dispatch_uid=__name__)
+models.signals.post_save.connect(zip_changed, sender=USZip,
+    dispatch_uid=__name__)
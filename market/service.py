@@ -144,8 +144,9 @@ def check_for_cross_site_redirect(request, zip_postal, redirect_path=None):
     passed in.  If the site is different, modify the redirect path.
     """
     curr_site = site = get_current_site(request)
-    sites = list(Site.objects.get_sites_this_zip(code=zip_postal))
-    if len(sites) > 0 and curr_site not in sites:
+    site_ids = Site.objects.get_proximity_index().get_site_ids_this_zip(
+        zip_postal)
+    if site_ids and curr_site.id not in site_ids:
         found_old_path = 0
         if redirect_path:
             redirect_path_list = redirect_path.split('/')
@@ -158,7 +159,8 @@ def check_for_cross_site_redirect(request, zip_postal, redirect_path=None):
                 redirect_path_list = '/' + redirect_path_list
         else:
             redirect_path_list = ''
-        site = sites[0]
+        site = Site.objects.defer('envelope', 'geom', 'point').get(
+            id=site_ids[0])
         redirect_path = 'http://%s/%s%s/' % (request.get_host(),  
             site.directory_name, redirect_path_list.rstrip('/'))
     return site, redirect_path, curr_site
@@ -199,8 +201,8 @@ def get_close_sites(code, miles=100, exclude_site_id=1, max_results=5):
     from the list when it is known and unwanted in the result (how-it-works 
     page), ie: "get sites close to me."
     """
-    site = Site.objects.get(id=exclude_site_id)
-    return site.close_sites(code=code, miles=miles, max_results=max_results)
+    return Site.objects.get_proximity_index().get_close_sites(code, miles,
+        max_results, exclude_site_id)
 
 def get_markets_in_state(state):
     """ Return list of markets residing in state (passed in). """
@@ -0,0 +1,31 @@
+""" Signals for models of market app """
+#pylint: disable=W0613
+import logging
+
+LOG = logging.getLogger('ten.%s' % __name__)
+LOG.setLevel(logging.ERROR)
+
+def site_changed_callback(sender, instance, **kwargs):
+    """ Receive signal that a site was saved or deleted. """
+    LOG.debug('site_changed_callback signal called')
+    sender.objects.clear_cache()
+
+def site_counties_changed(sender, instance, action, reverse, pk_set,
+        **kwargs):
+    """ Receive signal that the counties of a site changed, and rebuild the
+    zips of the sites, or of the county, changed.
+    """
+    from market.models import SiteZip
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        SiteZip.objects.rebuild(site_ids=[instance.id])
+    elif action == 'post_clear':
+        SiteZip.objects.rebuild(county_ids=[instance.id])
+    else:
+        SiteZip.objects.rebuild(site_ids=pk_set)
+
+def zip_changed(sender, instance, **kwargs):
+    """ Receive signal that a zip was saved, and rebuild its sites. """
+    from market.models import SiteZip
+    SiteZip.objects.rebuild(zip_ids=[instance.id])
@@ -6,6 +6,7 @@ from django.test import TestCase
 from django.test.client import Client, RequestFactory
 
 from market.middleware import URLHandlerMiddleware
+from market.models import Site
 
 class TestMiddleware(TestCase):
     """
@@ -178,3 +179,31 @@ class TestMiddleware(TestCase):
         response = client.get('/hudson-valley/foo/')
         self.failUnlessEqual(response.status_code, 404)
 
+    def test_routing_no_queries(self):
+        """ Assert once the site routing index is warm, routing a request to a
+        local dir or redirecting a local domain does not query the database.
+        """
+        Site.objects.get_routing_index()
+        dir_request = self.factory.get('/hudson-valley/A/')
+        dir_request.META['SERVER_NAME'] = settings.HTTP_HOST
+        domain_request = self.factory.get('/sp-us/')
+        domain_request.META['SERVER_NAME'] = '10hudsonvalleycoupons.com'
+        with self.assertNumQueries(0):
+            for _ in range(1000):
+                self.url_handler.process_request(dir_request)
+                response = self.url_handler.process_request(domain_request)
+        self.assertEqual(dir_request.META['site_id'], 2)
+        self.assertEqual(response['location'],
+            'http://10coupons.com/sp-us/hudson-valley/')
+
+    def test_routing_index_site_change(self):
+        """ Assert saving a site invalidates the site routing index. """
+        site = Site.objects.get(id=2)
+        self.assertEqual(
+            Site.objects.get_routing_index().directory_names['hudson-valley'],
+            2)
+        site.directory_name = 'hv'
+        site.save()
+        routing_index = Site.objects.get_routing_index()
+        self.assertEqual(routing_index.directory_names['hv'], 2)
+        self.assertTrue('hudson-valley' not in routing_index.directory_names)
@@ -60,6 +60,23 @@ class TestSiteModel(TestCase):
         site = Site.objects.get(id=2)
         sites = Site.objects.get_sites_this_zip('12550')
         self.assertTrue(site in sites)
+
+    def test_site_zips_follow_counties(self):
+        """ Assert the sites of a zip and the zips of a site are resolved
+        without a join, and follow the counties of the site.
+        """
+        site = Site.objects.get(id=2)
+        us_county = USZip.objects.get(code='12550').us_county
+        self.assertTrue('12550' in site.get_zip_codes())
+        Site.objects.get_sites_this_zip('12550')
+        with self.assertNumQueries(1):
+            self.assertTrue(site in list(
+                Site.objects.get_sites_this_zip('12550')))
+        site.us_county.remove(us_county)
+        self.assertTrue('12550' not in site.get_zip_codes())
+        self.assertTrue(site not in Site.objects.get_sites_this_zip('12550'))
+        us_county.sites.add(site)
+        self.assertTrue('12550' in site.get_zip_codes())
         
     def test_site_default_state(self):
         """ Test method that retrieves the abbreviated default state for a given
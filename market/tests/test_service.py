@@ -110,8 +110,29 @@ class TestService(TestCase):
         self.assertEqual(neighboring_markets, None)
         zip2 = '12601' # Poughkeepsie.
         neighboring_markets = get_close_sites(zip2, 100)
-        self.assertTrue(neighboring_markets.count() >= 1)
-        self.assertTrue(neighboring_markets.count() <= 5)
+        self.assertTrue(len(neighboring_markets) >= 1)
+        self.assertTrue(len(neighboring_markets) <= 5)
+
+    def test_close_sites_no_queries(self):
+        """ Assert once the site proximity index is warm, the close sites of a
+        zip are found without querying the database, nearest first, and that
+        clearing the site cache invalidates them.
+        """
+        site2 = Site.objects.get(id=2)
+        site2.save()
+        get_close_sites('12601', 100)
+        with self.assertNumQueries(0):
+            neighboring_markets = get_close_sites('12601', 100)
+        market_ids = [market['id'] for market in neighboring_markets]
+        self.assertTrue(2 in market_ids)
+        self.assertTrue(1 not in market_ids)
+        distances = [market['distance'] for market in neighboring_markets]
+        self.assertEqual(distances, sorted(distances))
+        self.assertTrue(distances[-1] <= D(mi=100))
+        Site.objects.filter(id=2).update(envelope=None)
+        Site.objects.clear_cache()
+        self.assertTrue(2 not in [market['id']
+            for market in get_close_sites('12601', 100)])
     
     def test_geoms_w_close_sites(self):
         """ Test append_geoms_to_close_sites service function that adds a site's
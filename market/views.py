@@ -2,14 +2,21 @@
 #pylint: disable=W0613
 from django.http import HttpResponse
 
+from geolocation.config import GEOMETRY_TILE_DEFAULT_ZOOM, GEOMETRY_TILE_ZOOMS
 from market.models import Site
 from market.service import get_or_set_site_markers
 
 def get_or_set_site_geoms(request, requested_file):
     """ 
     Return txt data file of all zip geometries for this site in 900913
-    projection. 
+    projection, simplified for the zoom level requested, if any.
     """
+    try:
+        zoom = int(request.GET.get('zoom', GEOMETRY_TILE_DEFAULT_ZOOM))
+    except ValueError:
+        zoom = GEOMETRY_TILE_DEFAULT_ZOOM
+    if zoom not in GEOMETRY_TILE_ZOOMS:
+        zoom = GEOMETRY_TILE_DEFAULT_ZOOM
     if 'zip-geoms.txt' in requested_file:
         region_file_type_extension = 'zip-geoms-data.txt'
     elif 'city-geoms.txt' in requested_file:
@@ -17,7 +24,8 @@ def get_or_set_site_geoms(request, requested_file):
     try:
         site_name = requested_file.replace('-zip-geoms.txt','').replace('-city-geoms.txt','').lower()
         site = Site.objects.get(directory_name=site_name)
-        geom_data = site.get_or_set_geometries(region_file_type_extension)
+        geom_data = site.get_or_set_geometries(region_file_type_extension,
+            zoom)
     except Site.DoesNotExist:
         geom_data = 'Error: %s is invalid for this feature.' % site_name
     
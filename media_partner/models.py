@@ -203,3 +203,9 @@ class Outlet(models.Model):
     def __unicode__(self):
         return self.name
     
+
+####### Signals for MediaPartner #######
+from consumer.signals import on_save_consumer
+
+models.signals.post_save.connect(on_save_consumer, sender=MediaPartner,
+    dispatch_uid='media_partner_consumer_counts')
@@ -321,6 +321,7 @@ CELERY_AMQP_TASK_RESULT_EXPIRES = 60
 CELERY_IMPORTS = (
     "advertiser.business.location.tasks",
     "advertiser.business.tasks",
+    "consumer.tasks",
     "coupon.tasks",
     "email_gateway.tasks",
     "firestorm.tasks",
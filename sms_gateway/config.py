@@ -13,6 +13,26 @@ SMS_REPORT_TYPE = 7
 
 SMS_SHORT_CODE = '71010'
 
+# How many requests a bulk send keeps open to the SMS API at once.
+SMS_SEND_CONCURRENCY = 8
+
+# The most requests per second a bulk send makes of the SMS API. 0 is no limit.
+SMS_SEND_RATE_LIMIT = 30
+
+# Stands in for the coupon code when an sms is rendered once for many
+# subscribers.
+SMS_CODE_PLACEHOLDER = 'TENxCODExPLACEHOLDER'
+
+# The most text blasts a subscriber is sent in a month.
+SMS_BLAST_MONTHLY_LIMIT = 5
+
+# How many subscribers of a text blast audience are read per query.
+SMS_BLAST_PAGE_SIZE = 500
+
+# Seconds to process a received sms within, from task start to response
+# recorded. Slower messages are logged as warnings.
+SMS_RECEIVED_LATENCY_SLO = 2.0
+
 SMS_SEND_URL = 'https://sms.mxtelecom.com/SMSSend' 
                #'https://api.eztexting.com/SMSSend'
 
@@ -1,26 +1,32 @@
 """ Service methods for sms_gateway app """
 
+import datetime
 import logging
 import pycurl
+import time
 
 from django.core.exceptions import ValidationError
+from django.db import connection, transaction
 from django.template import Context
 from django.template.loader import get_template
 from django.utils.http import urlquote
 
 from common.contest import check_contest_is_running
+from common.custom_cleaning import clean_phone_number
 from common.custom_format_for_display import format_phone
 from common.utils import CurlBuffer, replace_problem_ascii
 from consumer.models import Consumer
 from email_gateway.send import send_email
 from market.models import Site
 from sms_gateway import config
-from sms_gateway.models import SMSMessageReceived, SMSMessageSent, SMSResponse
+from sms_gateway.models import SMSMessageReceived, SMSMessageSent
 from subscriber.models import Carrier, MobilePhone, Subscriber
 from subscriber.service import add_update_subscriber
 
 LOG = logging.getLogger('ten.%s' % __name__)
 LOG.setLevel(logging.ERROR)
+LATENCY_LOG = logging.getLogger('ten.%s.latency' % __name__)
+LATENCY_LOG.setLevel(logging.INFO)
 
 
 class BadRequestError(Exception):
@@ -92,6 +98,41 @@ def curl_sms(sms, query_string):
     curl.close()
     return sms
 
+def render_smsmsg(template, context=None):
+    """ Render this sms template with this context, as an smsmsg. """
+    if context is None:
+        context = {}
+    # Contest logic.
+    context.update({'contest_is_running': check_contest_is_running()})
+    templ = get_template(template)
+    LOG.debug('send_sms context %s' % context)
+    # Trim trailing newline.
+    return templ.render(Context(context))[:-1]
+
+def clean_smsmsg(smsmsg):
+    """ Strip. Replace smart quotes etc. Remove extra internal whitespace. """
+    return replace_problem_ascii(smsmsg.strip()).replace('  ', ' ')
+
+def check_carrier_credentials(carrier):
+    """ We must have a username and password for this Carrier. """
+    if not carrier.user_name or not carrier.password:
+        error_message = ('send_sms failed: no carrier credentials for %s' %
+            carrier.carrier_display_name)
+        LOG.error(error_message)
+        raise ValidationError(error_message)
+
+def build_sms_query_string(carrier, smsto, smsfrom, smsmsg):
+    """ Build a query string of the send API out of allowed inputs. """
+    # smsmsg will be stored in our database. Encode a version for delivery.
+    # Fix for &
+    smsmsg_encoded = urlquote(smsmsg).replace('%26amp%3B', '%26')
+    LOG.debug('send_sms smsmsg_encoded %s' % smsmsg_encoded)
+    # Note: prepending 1 to the outgoing phonenumber here only.
+    # report = 7 because we always want delivery notification.
+    return '?user=%s&pass=%s&smsto=1%s&smsfrom=%s&smsmsg=%s&%s' % (
+        carrier.user_name, carrier.password, smsto, smsfrom, smsmsg_encoded,
+        'report=7')
+
 def send_sms(template, smsto, smsfrom=config.SMS_SHORT_CODE, context=None, 
     smsmsg=None):
     """
@@ -117,22 +158,9 @@ def send_sms(template, smsto, smsfrom=config.SMS_SHORT_CODE, context=None,
     """
     # Build smsmsg out of template and context passed in.
     if template:
-        # Render the template.
-        if context is None:
-            context = {}
-        # Contest logic.
-        context.update({'contest_is_running': check_contest_is_running()})
-        templ = get_template(template)
-        LOG.debug('send_sms context %s' % context)
-        # Trim trailing newline.
-        smsmsg = templ.render(Context(context))[:-1]
-    # Strip. Replace smart quotes etc. Remove extra internal whitespace.
-    smsmsg = replace_problem_ascii(smsmsg.strip()).replace('  ', ' ')
+        smsmsg = render_smsmsg(template, context)
+    smsmsg = clean_smsmsg(smsmsg)
     LOG.debug('send_sms smsmsg %s' % smsmsg)
-    # smsmsg will be stored in our database. Encode a version for delivery.
-    # Fix for &
-    smsmsg_encoded = urlquote(smsmsg).replace('%26amp%3B', '%26')
-    LOG.debug('send_sms smsmsg_encoded %s' % smsmsg_encoded)
     # smsto must be a MobilePhone
     try:
         carrier = MobilePhone.objects.select_related(
@@ -141,18 +169,8 @@ def send_sms(template, smsto, smsfrom=config.SMS_SHORT_CODE, context=None,
         error_message = 'send_sms failed: no MobilePhone %s' % smsto
         LOG.error(error_message)
         raise ValidationError(error_message)
-    # We must have a username and password for this Carrier
-    if not carrier.user_name or not carrier.password:
-        error_message = ('send_sms failed: no carrier credentials for %s' %
-            carrier.carrier_display_name)
-        LOG.error(error_message)
-        raise ValidationError(error_message)
-    # Build a query string out of allowed inputs:
-    # Note: prepending 1 to the outgoing phonenumber here only.
-    # report = 7 because we always want delivery notification.
-    query_string = '?user=%s&pass=%s&smsto=1%s&smsfrom=%s&smsmsg=%s&%s' % (
-        carrier.user_name, carrier.password, smsto, smsfrom, smsmsg_encoded,
-        'report=7')
+    check_carrier_credentials(carrier)
+    query_string = build_sms_query_string(carrier, smsto, smsfrom, smsmsg)
     sms = SMSMessageSent(smsto=smsto, smsfrom=smsfrom, smsmsg=smsmsg)
     if config.TEST_MODE:
         LOG.warning('In TEST_MODE! sms not really sent!!')
@@ -176,6 +194,279 @@ def send_sms(template, smsto, smsfrom=config.SMS_SHORT_CODE, context=None,
     LOG.debug('send_sms saved new smsid %s' % sms.smsid)
     return sms.smsid
     
+
+
+class CurlPool(object):
+    """ A pool of curl handles, reused across requests to keep connections
+    alive, that performs requests concurrently through a CurlMulti at no more
+    than rate_limit requests per second.
+    """
+    def __init__(self, concurrency=config.SMS_SEND_CONCURRENCY,
+            rate_limit=config.SMS_SEND_RATE_LIMIT):
+        self.multi = pycurl.CurlMulti()
+        self.handles = [pycurl.Curl() for x in range(concurrency)]
+        self.rate_limit = rate_limit
+
+    def close(self):
+        """ Close the handles of this pool. """
+        for curl in self.handles:
+            curl.close()
+        self.multi.close()
+
+    def read_finished(self, free, results):
+        """ Collect the responses of finished requests into results, by key,
+        as (HTTP status code, content), freeing their handles.
+        """
+        while True:
+            num_queued, ok_list, err_list = self.multi.info_read()
+            for curl in ok_list:
+                self.multi.remove_handle(curl)
+                results[curl.key] = (curl.getinfo(pycurl.HTTP_CODE),
+                    curl.buffer.content)
+                free.append(curl)
+            for curl, errno, errmsg in err_list:
+                self.multi.remove_handle(curl)
+                LOG.error('CurlPool request failed %s: %s' % (errno, errmsg))
+                results[curl.key] = (None, '')
+                free.append(curl)
+            if num_queued == 0:
+                break
+
+    def perform(self, requests):
+        """ Perform these (key, url) GET requests. Return a dict of key to
+        (HTTP status code, content); status code is None if the request failed.
+        """
+        queue = list(requests)
+        queue.reverse()
+        free = list(self.handles)
+        results = {}
+        started = time.time()
+        sent = 0
+        while queue or len(free) < len(self.handles):
+            wait = 0
+            while queue and free:
+                if self.rate_limit:
+                    wait = started + float(sent) / self.rate_limit - time.time()
+                    if wait > 0:
+                        break
+                key, url = queue.pop()
+                curl = free.pop()
+                curl.key = key
+                curl.buffer = CurlBuffer()
+                curl.setopt(pycurl.VERBOSE, config.SMS_CURL_VERBOSITY)
+                curl.setopt(pycurl.WRITEFUNCTION, curl.buffer.body_callback)
+                # url can't be Unicode.
+                curl.setopt(pycurl.URL, str(url))
+                self.multi.add_handle(curl)
+                sent += 1
+            while True:
+                ret, num_handles = self.multi.perform()
+                if ret != pycurl.E_CALL_MULTI_PERFORM:
+                    break
+            self.read_finished(free, results)
+            if len(free) < len(self.handles):
+                self.multi.select(min(1.0, max(wait, 0.01)))
+            elif wait > 0:
+                time.sleep(wait)
+        return results
+
+def insert_sms_messages_sent(messages):
+    """ Insert these unsaved SMSMessageSent instances, and set their ids.
+    Three statements however many messages there are.
+    """
+    cursor = connection.cursor()
+    cursor.execute("""
+        SELECT nextval('sms_gateway_smsmessage_id_seq')
+        FROM generate_series(1, %s);""", [len(messages)])
+    for sms, row in zip(messages, cursor.fetchall()):
+        sms.id = sms.smsmessage_ptr_id = row[0]
+    values = []
+    params = []
+    for sms in messages:
+        values.append('(%s, %s, %s, %s, %s, %s)')
+        params.extend([sms.id, sms.smsid, sms.smsto, sms.smsfrom,
+            sms.mobile_phone_id, sms.report])
+    cursor.execute("""
+        INSERT INTO "sms_gateway_smsmessage" ("id", "smsid", "smsto",
+            "smsfrom", "mobile_phone_id", "report")
+        VALUES %s;""" % ', '.join(values), params)
+    values = []
+    params = []
+    for sms in messages:
+        values.append('(%s, %s, %s, %s, now())')
+        params.extend([sms.id, sms.smsmsg, sms.flash, sms.split])
+    cursor.execute("""
+        INSERT INTO "sms_gateway_smsmessagesent" ("smsmessage_ptr_id",
+            "smsmsg", "flash", "split", "sent_datetime")
+        VALUES %s;""" % ', '.join(values), params)
+    transaction.commit_unless_managed()
+
+def send_bulk_sms(messages, smsfrom=config.SMS_SHORT_CODE):
+    """
+    Send these (mobile_phone, smsmsg) pairs, the carrier of each mobile_phone
+    already loaded, through a CurlPool, and save them in bulk. Return the
+    SMSMessageSent instances saved. If test mode is configured, it does not
+    contact EzTexting but computes next smsids.
+    
+    Messages to phones without carrier credentials, or that are not valid,
+    are logged and skipped.
+    """
+    smsfrom = clean_phone_number(smsfrom)
+    sms_messages = []
+    requests = []
+    for mobile_phone, smsmsg in messages:
+        smsto = clean_phone_number(mobile_phone.mobile_phone_number)
+        smsmsg = clean_smsmsg(smsmsg)
+        sms = SMSMessageSent(smsto=smsto, smsfrom=smsfrom, smsmsg=smsmsg,
+            mobile_phone=mobile_phone)
+        try:
+            check_carrier_credentials(mobile_phone.carrier)
+            sms.clean_fields(exclude=['mobile_phone'])
+            sms.clean()
+        except ValidationError, exception:
+            LOG.error('send_bulk_sms validation error %s' % exception)
+            continue
+        requests.append((len(sms_messages), '%s%s' % (config.SMS_SEND_URL,
+            build_sms_query_string(mobile_phone.carrier, smsto, smsfrom,
+                smsmsg))))
+        sms_messages.append(sms)
+    if not sms_messages:
+        return []
+    if config.TEST_MODE:
+        LOG.warning('In TEST_MODE! sms not really sent!!')
+        try:
+            smsid = SMSMessageSent.objects.latest('smsid').smsid
+        except SMSMessageSent.DoesNotExist:
+            # No messages so far!
+            smsid = 0
+        for sms in sms_messages:
+            smsid += 1
+            sms.smsid = smsid
+    else:
+        curl_pool = CurlPool()
+        try:
+            results = curl_pool.perform(requests)
+        finally:
+            curl_pool.close()
+        for index, sms in enumerate(sms_messages):
+            status_code, content = results.get(index, (None, ''))
+            if status_code != 200:
+                LOG.error('send_bulk_sms bad status code returned %s' %
+                    status_code)
+                LOG.error('sms: %s' % sms.__dict__)
+            else:
+                try:
+                    sms.smsid = int(content.rstrip())
+                except ValueError:
+                    LOG.error('send_bulk_sms bad smsid returned %s' % content)
+    insert_sms_messages_sent(sms_messages)
+    LOG.info('send_bulk_sms sent %s sms' % len(sms_messages))
+    return sms_messages
+
+class BlastAudience(object):
+    """
+    Resolves the subscribers a coupon is text blasted to: those subscribed to
+    sms in the zip of the coupon who are not inactive consumers, were not
+    already sent this coupon, were not sent a coupon of this business in the
+    past 30 days, and are under the monthly blast limit; plus the subscriber of
+    the advertiser.
+    
+    Each page of subscribers is one query of anti-joins, keyed on subscriber
+    id, so blasts written between pages do not disturb the pages to come.
+    Carriers are loaded once, so one audience can resolve many coupons.
+    """
+    def __init__(self, page_size=config.SMS_BLAST_PAGE_SIZE,
+            monthly_limit=config.SMS_BLAST_MONTHLY_LIMIT):
+        self.page_size = page_size
+        self.monthly_limit = monthly_limit
+        self._carriers = None
+
+    @property
+    def carriers(self):
+        """ Every carrier, by id. """
+        if self._carriers is None:
+            self._carriers = dict([(carrier.id, carrier)
+                for carrier in Carrier.objects.all()])
+        return self._carriers
+
+    def resolve(self, coupon, zipcode):
+        """ Yield (subscriber_id, mobile_phone, carrier) for the audience of
+        this coupon in zipcode, by subscriber id. The mobile_phone is the first
+        of the subscriber, with its carrier set.
+        """
+        params = {'after_id': 0,
+            'advertiser_subscriber_id':
+                coupon.offer.business.advertiser.subscriber_id,
+            'zipcode': zipcode,
+            'coupon_id': coupon.id,
+            'business_id': coupon.offer.business_id,
+            'since': datetime.datetime.today() - datetime.timedelta(days=30),
+            'monthly_limit': self.monthly_limit,
+            'page_size': self.page_size}
+        cursor = connection.cursor()
+        while True:
+            cursor.execute("""
+                SELECT DISTINCT ON (s.id) s.id, mp.id, mp.mobile_phone_number,
+                    mp.carrier_id
+                FROM "subscriber_subscriber" s
+                JOIN "subscriber_mobilephone" mp
+                    ON mp.subscriber_id = s.id
+                WHERE s.id > %(after_id)s
+                AND (s.id = %(advertiser_subscriber_id)s OR (
+                    s.subscriber_zip_postal = %(zipcode)s
+                    AND EXISTS (
+                        SELECT 1
+                        FROM "subscriber_subscriber_sms_subscription" ss
+                        WHERE ss.subscriber_id = s.id
+                        AND ss.smssubscription_id = 1
+                        )
+                    AND NOT EXISTS (
+                        SELECT 1
+                        FROM "consumer_consumer" con
+                        JOIN "auth_user" u
+                            ON u.id = con.user_ptr_id
+                        WHERE con.subscriber_id = s.id
+                        AND NOT u.is_active
+                        )
+                    AND NOT EXISTS (
+                        SELECT 1
+                        FROM "coupon_subscriberaction" sa
+                        WHERE sa.subscriber_id = s.id
+                        AND sa.coupon_id = %(coupon_id)s
+                        )
+                    AND NOT EXISTS (
+                        SELECT 1
+                        FROM "coupon_subscriberaction" sa
+                        JOIN "coupon_coupon" c
+                            ON c.id = sa.coupon_id
+                        JOIN "coupon_offer" o
+                            ON o.id = c.offer_id
+                        WHERE sa.subscriber_id = s.id
+                        AND o.business_id = %(business_id)s
+                        AND sa.create_datetime > %(since)s
+                        )
+                    AND NOT EXISTS (
+                        SELECT 1
+                        FROM "subscriber_subscriberblastcount" b
+                        WHERE b.subscriber_id = s.id
+                        AND b.month = date_trunc('month', now())::date
+                        AND b.blast_count >= %(monthly_limit)s
+                        )
+                    ))
+                ORDER BY s.id, mp.id
+                LIMIT %(page_size)s;""", params)
+            rows = cursor.fetchall()
+            for subscriber_id, mobile_phone_id, mobile_phone_number, \
+                    carrier_id in rows:
+                carrier = self.carriers[carrier_id]
+                mobile_phone = MobilePhone(id=mobile_phone_id,
+                    mobile_phone_number=mobile_phone_number, carrier=carrier,
+                    subscriber_id=subscriber_id)
+                yield subscriber_id, mobile_phone, carrier
+            if len(rows) < self.page_size:
+                return
+            params['after_id'] = rows[-1][0]
+
 def send_carrier_lookup(mobile_phone_number):
     """ 
     Lookup a carrier for a phone number by EzTexting API. If test mode is 
@@ -269,44 +560,167 @@ def save_phone_by_carrier_lookup(mobile_phone_number):
     else:
         return False
 
-def create_response_relationship(received_smsid, sent_smsid, is_opt_out=False):
+def create_response_relationships(received_smsid, sent_smsids,
+        is_opt_out=False):
     """
-    When we have responded, create a response relationship between message 
-    we received and the message we sent.
+    When we have responded, create response relationships between the message
+    we received and the messages we sent, in one statement. Return how many
+    were created.
+    
+    A smsid received or sent more than once, or not at all, relates nothing.
     """
-    sms_response = SMSResponse()
-    try:
-        sms_response.sent = SMSMessageSent.objects.get(smsid=sent_smsid)
-    except SMSMessageSent.MultipleObjectsReturned:
-        # We sent this smsid multiple times.
-        LOG.error("""create_response_relationship failed. Multiple
-            sent messages with smsid %s""" % sent_smsid)
-        return False
-    except SMSMessageSent.DoesNotExist:
-        # Not a real sent message. Is this a test?
-        LOG.error("""create_response_relationship failed on new 
-            sms_response sent %s""" % sent_smsid)
-        return False
-    try:
-        sms_response.received = SMSMessageReceived.objects.get(
-            smsid=received_smsid)
-    except SMSMessageReceived.MultipleObjectsReturned:
-        # We recieved this smsid multiple times. Allowed behavior.
-        LOG.error("""create_response_relationship bailed. Multiple
-            received messages with smsid %s""" % received_smsid)
-        return False
-    except SMSMessageReceived.DoesNotExist:
-        # Not a real sent message. Is this a test?
-        LOG.error("""create_response_relationship failed on new 
-            sms_response received %s""" % received_smsid)
-        return False
-    sms_response.response_direction = 'out'
-    sms_response.is_opt_out = is_opt_out
-    sms_response.save()
-    LOG.debug('create_response_relationship saved new sms_response %s' % 
-        sms_response.id)
-    return sms_response
-        
+    sent_smsids = tuple(set([smsid for smsid in sent_smsids if smsid]))
+    if not sent_smsids:
+        return 0
+    cursor = connection.cursor()
+    cursor.execute("""
+        INSERT INTO "sms_gateway_smsresponse" (
+            "sent_id", "received_id", "response_direction", "is_opt_out")
+        SELECT min(m.id), received.id, 'out', %(is_opt_out)s
+        FROM "sms_gateway_smsmessage" m
+        JOIN "sms_gateway_smsmessagesent" s
+            ON s.smsmessage_ptr_id = m.id
+        CROSS JOIN (
+            SELECT min(rm.id) AS id
+            FROM "sms_gateway_smsmessage" rm
+            JOIN "sms_gateway_smsmessagereceived" r
+                ON r.smsmessage_ptr_id = rm.id
+            WHERE rm.smsid = %(received_smsid)s
+            HAVING count(*) = 1
+            ) received
+        WHERE m.smsid IN %(sent_smsids)s
+        GROUP BY m.smsid, received.id
+        HAVING count(*) = 1
+        RETURNING "id";""", {'received_smsid': received_smsid,
+            'sent_smsids': sent_smsids, 'is_opt_out': is_opt_out})
+    created = len(cursor.fetchall())
+    transaction.commit_unless_managed()
+    if created < len(sent_smsids):
+        LOG.error("""create_response_relationships related %s of sent %s to
+            received %s""" % (created, sent_smsids, received_smsid))
+    return created
+    
+class InboundSMS(object):
+    """
+    A received sms, its message normalized for matching, and its sender: the
+    mobile phone, subscriber, sms subscription and consumer, each looked up
+    when first needed.
+    """
+    def __init__(self, sms_message_received):
+        self.sms_message_received = sms_message_received
+        smsmsg = sms_message_received.smsmsg.lower().strip()
+        # Remove a common prefix.
+        if smsmsg[:4] == 're:|':
+            smsmsg = smsmsg[4:]
+        self.smsmsg = smsmsg
+        self._lookups = {}
+
+    def _lookup(self, name, function):
+        """ Return the value of this lookup, calling function the first time.
+        """
+        if name not in self._lookups:
+            self._lookups[name] = function()
+        return self._lookups[name]
+
+    @property
+    def mobile_phone(self):
+        """ The mobile phone of the sender, with its carrier and subscriber. """
+        def get_mobile_phone():
+            try:
+                return MobilePhone.objects.select_related('carrier',
+                    'subscriber').get(
+                        mobile_phone_number=self.sms_message_received.smsfrom)
+            except MobilePhone.DoesNotExist:
+                LOG.debug('no subscriber')
+                return None
+        return self._lookup('mobile_phone', get_mobile_phone)
+
+    @property
+    def subscriber(self):
+        """ The subscriber of the sender, if known. """
+        return self.mobile_phone and self.mobile_phone.subscriber or None
+
+    @property
+    def sms_subscription(self):
+        """ 1 if the subscriber has an sms subscription, else 0; None if there
+        is no subscriber.
+        """
+        def get_sms_subscription():
+            if not self.subscriber:
+                return None
+            return self.subscriber.sms_subscription.filter(id=1).count()
+        return self._lookup('sms_subscription', get_sms_subscription)
+
+    @property
+    def consumer(self):
+        """ The consumer of the subscriber, if any. """
+        def get_consumer():
+            if not self.subscriber:
+                return None
+            try:
+                return Consumer.objects.get(subscriber=self.subscriber)
+            except Consumer.DoesNotExist:
+                LOG.debug('no consumer')
+                return None
+        return self._lookup('consumer', get_consumer)
+
+    def update_mobile_phone(self):
+        """
+        Update the carrier of the mobile phone if the sms came from another
+        network, and verify it: to send a text message is to verify.
+        """
+        mobile_phone = self.mobile_phone
+        if not mobile_phone:
+            return
+        is_mobile_phone_update = False
+        network = self.sms_message_received.network
+        if mobile_phone.carrier.carrier != network:
+            try:
+                carrier = Carrier.objects.get(carrier=network)
+            except Carrier.DoesNotExist:
+                error_message = "No carrier matching %s" % network
+                LOG.error(error_message)
+                raise Carrier.DoesNotExist(error_message)
+            LOG.debug('replacing %s with %s' % (mobile_phone.carrier.carrier,
+                network))
+            mobile_phone.carrier = carrier
+            is_mobile_phone_update = True
+        if not mobile_phone.is_verified:
+            mobile_phone.is_verified = True
+            is_mobile_phone_update = True
+        if is_mobile_phone_update:
+            mobile_phone.save()
+
+
+class StageTimer(object):
+    """ Times the stages of handling a message, and logs them, so latency can
+    be watched against an objective of slo seconds.
+    """
+    def __init__(self, name, slo=config.SMS_RECEIVED_LATENCY_SLO):
+        self.name = name
+        self.slo = slo
+        self.stages = []
+        self.started = self.last = time.time()
+
+    def mark(self, stage):
+        """ End this stage, which began when the last one ended. """
+        now = time.time()
+        self.stages.append((stage, now - self.last))
+        self.last = now
+
+    def total(self):
+        """ Seconds from start to the end of the last stage. """
+        return self.last - self.started
+
+    def report(self):
+        """ Log the stage timings, as a warning if over the objective. """
+        message = '%s took %.3fs (%s)' % (self.name, self.total(),
+            ', '.join(['%s %.3fs' % stage for stage in self.stages]))
+        if self.total() > self.slo:
+            LATENCY_LOG.warning('Over %ss: %s' % (self.slo, message))
+        else:
+            LATENCY_LOG.info(message)
+
 def subscribe_sender(sms_message_received, subscriber_zip_postal):
     """
     Create or update Subscriber from a SMSMessageReceived and a zip/postal.
@@ -3,25 +3,27 @@
 import datetime
 import logging
 import re
+from itertools import islice
 
 from django.core import validators
 from django.core.exceptions import ValidationError
-from django.db.models import Count
+from django.db import IntegrityError
 
 from celery.decorators import task
 
 from common.contest import check_contest_is_running
 from consumer.models import Consumer
 from consumer.service import create_consumer_from_email
-from coupon.models import Coupon, SubscriberAction
-from coupon.service.coupon_code_service import create_coupon_code
-from coupon.tasks import RecordAction
+from coupon.config import COUPON_CODE_BATCH_SIZE
+from coupon.models import Coupon
+from coupon.service.coupon_action_service import write_coupon_actions
+from coupon.service.coupon_code_service import CouponCodePool
 from geolocation.models import USZip
 from market.models import Site
-from sms_gateway.service import (create_response_relationship,
+from sms_gateway.config import SMS_CODE_PLACEHOLDER
+from sms_gateway.service import (BlastAudience, InboundSMS, StageTimer,
+    create_response_relationships, render_smsmsg, send_bulk_sms,
     send_consumer_welcome, send_sms, subscribe_sender)
-from subscriber.models import (Carrier, MobilePhone, SMSSubscription,
-    Subscriber)
 
 LOG = logging.getLogger('ten.%s' % __name__)
 LOG.setLevel(logging.ERROR)
@@ -131,6 +133,8 @@ def no_consumer_subhandler(sms_message_received, subscriber, sms_subscription,
         - a new subscriber who should also become a consumer.
         - an existing subscriber who doesn't have a consumer yet.
         - an existing subscriber who already has a different consumer.
+    
+    Returns the smsid sent, or a list of them when two responses are sent.
     """
     LOG.debug('In no_consumer_subhandler')
     if subscriber:
@@ -148,11 +152,8 @@ def no_consumer_subhandler(sms_message_received, subscriber, sms_subscription,
                 smsto=sms_message_received.smsfrom)
         else:
             # Send confirmation email for consumer...
-            sent = send_consumer_welcome(consumer, 
+            welcome_sent = send_consumer_welcome(consumer, 
                 sms_message_received.smsfrom)
-            # Record this reponse rel now, before sending 2nd response.
-            create_response_relationship(
-                received_smsid=sms_message_received.smsid, sent_smsid=sent)
             if sms_subscription:
                 sent = send_sms(template='sms/opt_in_success.html', 
                     smsto=sms_message_received.smsfrom, 
@@ -160,6 +161,8 @@ def no_consumer_subhandler(sms_message_received, subscriber, sms_subscription,
             else:
                 sent = send_sms(template='sms/request_double_opt_in.html', 
                     smsto=sms_message_received.smsfrom)
+            # Both responses are related to the message received.
+            sent = [welcome_sent, sent]
     else:
         LOG.debug('Calling create_consumer_from_email')
         subscriber = subscribe_sender(sms_message_received, '00000')
@@ -348,54 +351,56 @@ def zip_handler(smsmsg, sms_message_received, subscriber, sms_subscription,
             smsto=sms_message_received.smsfrom)
     return sent
 
-def info_collector(sms_message_received):
-    """
-    Return objects needed to make decisions. Perform initial processing on them.
-    """
-    is_mobile_phone_update = False
-    mobile_phone = None
-    subscriber = None
-    sms_subscription = None
-    consumer = None
-    try:
-        mobile_phone = MobilePhone.objects.get(
-            mobile_phone_number=sms_message_received.smsfrom)
-        subscriber = Subscriber.objects.get(mobile_phones=mobile_phone)
-        sms_subscription = SMSSubscription.objects.filter(
-            subscribers=subscriber, id=1).count()
-        LOG.debug('subscriber %s' % subscriber)
-        LOG.debug('subscriber.subscriber_zip_postal %s'
-             % subscriber.subscriber_zip_postal)
-        LOG.debug('sms_subscription %s' % sms_subscription)     
-        try:
-            consumer = Consumer.objects.get(subscriber=subscriber)
-            LOG.debug('consumer %s' % consumer)
-            LOG.debug('consumer.consumer_zip_postal %s' 
-                % consumer.consumer_zip_postal)
-        except Consumer.DoesNotExist:
-            LOG.debug('no consumer')
-    except (MobilePhone.DoesNotExist, Subscriber.DoesNotExist):
-        LOG.debug('no subscriber')
-    # Update mobile_phone.carrier if this info is different.
-    if subscriber \
-    and mobile_phone.carrier.carrier != sms_message_received.network:
-        try:
-            mobile_phone.carrier = Carrier.objects.get(
-                carrier=sms_message_received.network)
-        except Carrier.DoesNotExist:
-            error_message = "No carrier matching %s" % (
-                sms_message_received.network)
-            LOG.error(error_message)
-            raise Carrier.DoesNotExist(error_message)
-        LOG.debug('replacing %s with %s' %
-            (mobile_phone.carrier.carrier, sms_message_received.network))
-        is_mobile_phone_update = True
-    if mobile_phone and not mobile_phone.is_verified:
-        mobile_phone.is_verified = True
-        is_mobile_phone_update = True
-    if is_mobile_phone_update:
-        mobile_phone.save()
-    return subscriber, sms_subscription, consumer
+# The keyword grammar of received sms, in order of precedence: the first route
+# matching the start of the normalized message handles it. Each route names its
+# handler and the arguments to pass it, read from the InboundSMS.
+SMS_ROUTES = (
+    ('help', r'help|[a-z0-9]*elp$', help_handler,
+        ('sms_message_received', 'subscriber')),
+    # Spec to match: STOP, STOP*, *STOP, STOPALL, STOPALL*, *STOPALL, 
+    # TOPALL, *TOPALL, STOPAL, STOPAL*, QUIT, QUIT*, *QUIT, QUI, UIT, END, 
+    # END*, *END, CANCEL, CANCEL*, *CANCEL, ANCEL, *ANCEL, CANCE, CANCE*, 
+    # UNSUBSCRIBE, UNSUBSCRIBE*, *UNSUBSCRIBE, NSUBSCRIBE, NSUBSCRIBE, 
+    # UNSUB********
+    ('stop', r'stop|[a-z0-9]*stop(?:all)?$|[a-z0-9]*topall$|stopal'
+        r'|quit|qui$|[a-z0-9]*quit|uit$|end'
+        r'|[a-z0-9]*end$|cance|[a-z0-9]*ancel$'
+        r'|unsub|[a-z0-9]*unsubscribe$|nsubscribe$', unsubscribe_handler,
+        ('sms_message_received', 'subscriber')),
+    ('save', r'(?:save|sav|ave)$', save_handler,
+        ('sms_message_received', 'subscriber')),
+    ('no', r'no', no_handler,
+        ('sms_message_received', 'subscriber', 'sms_subscription',
+        'consumer')),
+    ('yes', r'y$|yes', yes_handler,
+        ('sms_message_received', 'subscriber', 'sms_subscription',
+        'consumer')),
+    ('zip', r'\d{5}', zip_handler,
+        ('smsmsg', 'sms_message_received', 'subscriber', 'sms_subscription',
+        'consumer')),
+    ('email', r'.*@', email_handler,
+        ('smsmsg', 'sms_message_received', 'subscriber', 'sms_subscription',
+        'consumer')),
+    ('ad', r'(?:ad|advert|advertise|advertiser)$', advertise_handler,
+        ('sms_message_received', 'subscriber', 'consumer')),
+    # Not an actual email address, but the word 'EMAIL' etc. This needs to be
+    # late as the regular expression is loose.
+    ('word_email', r'email|coupon', word_email_handler,
+        ('sms_message_received', 'subscriber', 'consumer')),
+    )
+
+SMS_ROUTE_PATTERN = re.compile('|'.join(['(?P<%s>%s)' % (name, pattern)
+    for name, pattern, handler, arg_names in SMS_ROUTES]), re.DOTALL)
+
+SMS_HANDLERS = dict([(name, (handler, arg_names))
+    for name, pattern, handler, arg_names in SMS_ROUTES])
+
+def route_smsmsg(smsmsg):
+    """ Return the name of the route this normalized smsmsg takes, if any. """
+    match = SMS_ROUTE_PATTERN.match(smsmsg)
+    if match:
+        return match.lastgroup
+    return None
 
 @task()
 def process_received_sms(sms_message_received):
@@ -403,66 +408,44 @@ def process_received_sms(sms_message_received):
     Process a received message.
     
     If sender requested an action, perform that action and send a response. 
+    The sender is looked up only as far as the handler needs, and the time of
+    each stage is logged.
     """
     LOG.debug('process_received_sms task running for %s' % 
         sms_message_received.id) 
-    is_opt_out = False
-    # Get info we will need to make decisions.
-    subscriber, sms_subscription, consumer = info_collector(
-        sms_message_received)
-    # Parse the message to see if we need to respond.
-    smsmsg = sms_message_received.smsmsg.lower().strip()
-    # Remove a common prefix.
-    if smsmsg[:4] == 're:|':
-        smsmsg = smsmsg[4:]
-    # help, help*, *elp
-    if re.match('help|[a-z0-9]*elp$', smsmsg):
-        sent = help_handler(sms_message_received, subscriber)
-    # Spec to match: STOP, STOP*, *STOP, STOPALL, STOPALL*, *STOPALL, 
-    # TOPALL, *TOPALL, STOPAL, STOPAL*, QUIT, QUIT*, *QUIT, QUI, UIT, END, 
-    # END*, *END, CANCEL, CANCEL*, *CANCEL, ANCEL, *ANCEL, CANCE, CANCE*, 
-    # UNSUBSCRIBE, UNSUBSCRIBE*, *UNSUBSCRIBE, NSUBSCRIBE, NSUBSCRIBE, 
-    # UNSUB********
-    elif re.match('stop|[a-z0-9]*stop(?:all)?$|[a-z0-9]*topall$|stopal', smsmsg) \
-        or re.match('quit|qui$|[a-z0-9]*quit|uit$|end', smsmsg) \
-        or re.match('[a-z0-9]*end$|cance|[a-z0-9]*ancel$', smsmsg) \
-        or re.match('unsub|[a-z0-9]*unsubscribe$|nsubscribe$', smsmsg):
-        LOG.debug('matched stop %s' % smsmsg)
-        is_opt_out = True
-        sent = unsubscribe_handler(sms_message_received, subscriber)
-    elif smsmsg in ('save', 'sav', 'ave'):
-        sent = save_handler(sms_message_received, subscriber)
-    elif re.match('no', smsmsg):
-        sent = no_handler(sms_message_received, subscriber, sms_subscription,
-            consumer)
-    elif re.match('y$|yes', smsmsg):
-        sent = yes_handler(sms_message_received, subscriber, sms_subscription, 
-            consumer)
-    elif re.match("\d{5}", smsmsg):
-        sent = zip_handler(smsmsg, sms_message_received, subscriber, 
-            sms_subscription, consumer)
-    elif re.search('@', smsmsg):
+    timer = StageTimer('process_received_sms %s' % sms_message_received.id)
+    try:
+        inbound_sms = InboundSMS(sms_message_received)
+        route = route_smsmsg(inbound_sms.smsmsg)
+        timer.mark('route')
+        inbound_sms.update_mobile_phone()
+        timer.mark('lookup')
+        if not route:
+            LOG.info('quit. No matching pattern: %s' % inbound_sms.smsmsg)
+            return
+        LOG.debug('matched %s %s' % (route, inbound_sms.smsmsg))
+        handler, arg_names = SMS_HANDLERS[route]
         try:
-            sent = email_handler(smsmsg, sms_message_received, subscriber, 
-                sms_subscription, consumer)
+            sent = handler(*[getattr(inbound_sms, arg_name)
+                for arg_name in arg_names])
         except ValidationError:
+            if route != 'email':
+                raise
             return
-    elif smsmsg in ('ad', 'advert', 'advertise', 'advertiser'):
-        sent = advertise_handler(sms_message_received, subscriber, consumer)
-    # Not an actual email address, but the word 'EMAIL' etc. This needs to be
-    # late as the regular expression is loose.
-    elif re.match('email|coupon', smsmsg) :
-        sent = word_email_handler(sms_message_received, subscriber, consumer)
-    else:
-        error_message = 'quit. No matching pattern: %s' % smsmsg
-        LOG.info(error_message)
-        return
-    create_response_relationship(received_smsid=sms_message_received.smsid, 
-        sent_smsid=sent, is_opt_out=is_opt_out)
+        timer.mark('handle')
+        if not isinstance(sent, list):
+            sent = [sent]
+        create_response_relationships(sms_message_received.smsid, sent,
+            is_opt_out=route == 'stop')
+        timer.mark('record')
+    finally:
+        timer.report()
 
 @task()
-def text_blast_coupon(coupon):
-    """ Sends an SMS coupon to opted in subscribers. """
+def text_blast_coupon(coupon, audience=None):
+    """ Sends an SMS coupon to opted in subscribers. An audience may be given
+    to share its carriers across coupons.
+    """
     LOG.info('Text blast beginning for coupon %s.' % (coupon.id))
     action_id = 11 # Text Blasted
     if coupon.coupon_type.coupon_type_name != 'Paid':
@@ -486,61 +469,35 @@ def text_blast_coupon(coupon):
         LOG.debug('coupon has no zipcode')
         return 
     LOG.debug('zipcode: %s' % (zipcode))
-    # Exclude subscribers who who have already been blasted 4 times this month.
-    today = datetime.datetime.today()
-    first_of_month = today.strftime("%Y-%m-01")
-    max_blasted = Subscriber.objects.filter(
-            subscriber_actions__action__id=action_id,
-            subscriber_actions__create_datetime__gt=first_of_month
-        ).annotate(number_of_blasts=Count('subscriber_actions')).filter(
-            number_of_blasts__gt=4)
-    LOG.info('max blasted: %s' % (max_blasted.count()))
-    # Exclude subscribers who have already been SMS blasted this coupon
-    # or texted it to themselves.
-    previously_blasted = Subscriber.objects.filter(
-        subscriber_actions__coupon=coupon)
-    LOG.info('previously blasted: %s' % (previously_blasted.count()))    
-    # Exclude subscribers who have received a blast from this business in the 
-    # past 30 days.
-    thirty_days_ago = today - datetime.timedelta(days=30)
-    previously_business_blasted = Subscriber.objects.filter(
-        subscriber_actions__in=(
-            SubscriberAction.objects.filter(
-                coupon__offer__business=coupon.offer.business,
-                create_datetime__gt=thirty_days_ago)))
-    LOG.info('previously_business_blasted: %s' % (
-        previously_business_blasted.count()))
-    # Exclude subscribers who are inactive consumers.
-    subscribers = Subscriber.objects.select_related(
-            'mobile_phone__mobile_phone_number'
-        ).filter(
-            subscriber_zip_postal=zipcode, sms_subscription=1
-        ).exclude(
-            id__in=Consumer.objects.filter(
-                    subscriber__id__gt=0, is_active=False
-                ).values_list('subscriber__id', flat=True)
-        ).exclude(
-            id__in=previously_blasted
-        ).exclude(
-            id__in=previously_business_blasted
-        ).exclude(
-            id__in=max_blasted
-        )
-    LOG.info('so far to do %s subscribers' % (subscribers.count()))
-    # Include the advertiser.
-    if coupon.offer.business.advertiser.subscriber:
-        advertiser_sub = Subscriber.objects.filter(
-            id=coupon.offer.business.advertiser.subscriber.id)
-        LOG.info('Also sending to advertiser sub: %s' % (advertiser_sub[0].id))
-        subscribers = subscribers | advertiser_sub
-    LOG.info('to do %s subscribers' % (subscribers.count()))
-    for subscriber in subscribers:
-        coupon_code = create_coupon_code(coupon, 4)
-        context = { 'coupon': coupon, 'coupon_code': coupon_code }
-        send_sms(template='sms/coupon.html', 
-            smsto=subscriber.mobile_phones.all()[0].mobile_phone_number, 
-            context=context)
-        RecordAction().run(action_id, coupon.id, [], subscriber.id)
+    if audience is None:
+        audience = BlastAudience()
+    recipients = audience.resolve(coupon, zipcode)
+    # Render once, then splice in the coupon code of each subscriber.
+    smsmsg = render_smsmsg('sms/coupon.html', {'coupon': coupon,
+        'coupon_code': {'code': SMS_CODE_PLACEHOLDER}})
+    sent_count = 0
+    while True:
+        mobile_phones = [mobile_phone for subscriber_id, mobile_phone, carrier
+            in islice(recipients, COUPON_CODE_BATCH_SIZE)]
+        if not mobile_phones:
+            break
+        coupon_codes = CouponCodePool(coupon, len(mobile_phones), 4)
+        sms_messages = send_bulk_sms([(mobile_phone, smsmsg.replace(
+                SMS_CODE_PLACEHOLDER, coupon_codes.draw().code))
+            for mobile_phone in mobile_phones])
+        subscriber_actions = set([(action_id, coupon.id,
+            sms.mobile_phone.subscriber_id) for sms in sms_messages])
+        if not subscriber_actions:
+            continue
+        coupon_counts = {(action_id, coupon.id): len(subscriber_actions)}
+        try:
+            write_coupon_actions(coupon_counts, set(), subscriber_actions)
+        except IntegrityError:
+            # Another blast counted one of these subscribers first.
+            write_coupon_actions(coupon_counts, set(), subscriber_actions)
+        sent_count += len(subscriber_actions)
+    LOG.info('Text blasted coupon %s to %s subscribers.' % (coupon.id,
+        sent_count))
 
 @task()
 def text_blast_approved_coupons():
@@ -552,5 +509,6 @@ def text_blast_approved_coupons():
     coupons = Coupon.objects.filter(is_approved=True, is_redeemed_by_sms=True,
         coupon_create_datetime__gt=catchup_date,
         coupon_type__coupon_type_name='Paid')
+    audience = BlastAudience()
     for coupon in coupons:
-        text_blast_coupon(coupon)
+        text_blast_coupon(coupon, audience)
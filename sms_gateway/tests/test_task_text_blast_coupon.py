@@ -1,11 +1,16 @@
 """
 Tests of sms_gateway app tasks.
 """
+import datetime
+
 from django.conf import settings
 
 from coupon.models import Action, Coupon, CouponAction, SubscriberAction
+from sms_gateway.models import SMSMessageSent
+from sms_gateway.service import BlastAudience, send_bulk_sms
 from sms_gateway.tasks import text_blast_coupon
 from sms_gateway.tests.sms_gateway_test_case import SMSGatewayTestCase
+from subscriber.models import MobilePhone, SubscriberBlastCount
 
 settings.CELERY_ALWAYS_EAGER = True
 
@@ -100,3 +105,46 @@ class TestTextBlast(SMSGatewayTestCase):
                 coupon=coupon,
                 action=self.action
             ).count(), 0)
+
+    def test_send_bulk_sms(self):
+        """ Assert sms to many phones are saved in bulk, with consecutive
+        smsids, skipping phones of carriers without credentials.
+        """
+        mobile_phones = list(MobilePhone.objects.select_related('carrier'))
+        sendable = [mobile_phone for mobile_phone in mobile_phones
+            if mobile_phone.carrier.user_name and mobile_phone.carrier.password]
+        self.assertTrue(len(sendable) > 1)
+        before_count = SMSMessageSent.objects.count()
+        with self.assertNumQueries(4):
+            sms_messages = send_bulk_sms([(mobile_phone, 'Bulk %s' % index)
+                for index, mobile_phone in enumerate(mobile_phones)])
+        self.assertEqual(len(sms_messages), len(sendable))
+        self.assertEqual(SMSMessageSent.objects.count(),
+            before_count + len(sendable))
+        smsids = [sms.smsid for sms in sms_messages]
+        self.assertEqual(smsids, range(smsids[0], smsids[0] + len(smsids)))
+        sms = SMSMessageSent.objects.get(id=sms_messages[0].id)
+        self.assertEqual(sms.smsmsg, sms_messages[0].smsmsg)
+        self.assertEqual(sms.mobile_phone, sendable[0])
+
+    def test_blast_audience(self):
+        """ Assert the audience of a coupon leaves out subscribers at the
+        monthly blast limit, and that a blast counts toward it.
+        """
+        coupon = Coupon.objects.get(id=1)
+        zipcode = coupon.location.filter(
+            location_zip_postal__gt=0)[0].location_zip_postal
+        recipients = list(BlastAudience().resolve(coupon, zipcode))
+        self.assertEqual([recipient[0] for recipient in recipients], [2])
+        subscriber_id, mobile_phone, carrier = recipients[0]
+        self.assertEqual(mobile_phone.id, 2)
+        self.assertEqual(mobile_phone.carrier, carrier)
+        SubscriberBlastCount.objects.create(subscriber_id=subscriber_id,
+            month=datetime.date.today().replace(day=1), blast_count=1)
+        self.assertEqual(list(BlastAudience(monthly_limit=1).resolve(coupon,
+            zipcode)), [])
+        coupon.sms = coupon.get_default_sms()
+        coupon.save()
+        text_blast_coupon(coupon)
+        self.assertEqual(SubscriberBlastCount.objects.get(
+            subscriber__id=subscriber_id).blast_count, 2)
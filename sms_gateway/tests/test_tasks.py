@@ -6,6 +6,9 @@ from django.conf import settings
 
 from consumer.models import Consumer
 from sms_gateway.models import SMSMessageSent, SMSMessageReceived, SMSResponse
+from sms_gateway.service import (create_response_relationships, InboundSMS,
+    StageTimer)
+from sms_gateway.tasks import route_smsmsg
 from sms_gateway.tests.sms_gateway_test_case import SMSGatewayTestCase
 from subscriber.models import Subscriber, MobilePhone, SMSSubscription
 
@@ -702,4 +705,102 @@ class TestTasksNo(SMSGatewayTestCase):
                 )
         self.assertEqual(subscriber.sms_subscription.count(), 0)
         self.assertTrue(MobilePhone.objects.get(
-            mobile_phone_number='8455553013').is_verified)
\ No newline at end of file
+            mobile_phone_number='8455553013').is_verified)
+
+
+class TestRouteReceivedSMS(SMSGatewayTestCase):
+    """ Tests of routing, looking up and recording a received sms. """
+
+    def test_route_smsmsg(self):
+        """ Assert each keyword takes its route, in order of precedence. """
+        routes = {
+            'help': 'help', 'yelp': 'help',
+            'stop': 'stop', 'stopall': 'stop', 'quit': 'stop', 'end': 'stop',
+            'cancel': 'stop', 'unsubscribe': 'stop', 'nsubscribe': 'stop',
+            'save': 'save', 'sav': 'save',
+            'no': 'no', 'nope': 'no',
+            'y': 'yes', 'yes': 'yes',
+            '12550': 'zip',
+            'joe@example.com': 'email',
+            'ad': 'ad', 'advertise': 'ad',
+            'email': 'word_email', 'coupon': 'word_email',
+            'hello there': None, '': None}
+        for smsmsg, route in routes.items():
+            self.assertEqual(route_smsmsg(smsmsg), route,
+                '%s routed to %s' % (smsmsg, route_smsmsg(smsmsg)))
+
+    def test_inbound_sms_lookups(self):
+        """ Assert the sender of an sms is looked up one query at a time, only
+        when asked for, and only once.
+        """
+        consumer = Consumer(email='test-inbound-sms@example.com',
+            username='test-inbound-sms@example.com')
+        consumer.save()
+        subscriber = Subscriber(subscriber_zip_postal='12550', site_id=2)
+        subscriber.save()
+        subscriber.sms_subscription.add(1)
+        MobilePhone(mobile_phone_number='8455553020', carrier_id=2,
+            subscriber=subscriber, is_verified=True).save()
+        consumer.subscriber = subscriber
+        consumer.save()
+        inbound_sms = InboundSMS(SMSMessageReceived(smsid='720',
+            smsfrom='8455553020', smsmsg='re:| YES ', network='ATTUS',
+            smsdate='2000-01-01'))
+        self.assertEqual(inbound_sms.smsmsg, 'yes')
+        with self.assertNumQueries(1):
+            self.assertEqual(inbound_sms.subscriber, subscriber)
+            self.assertEqual(inbound_sms.mobile_phone.carrier_id, 2)
+        with self.assertNumQueries(1):
+            self.assertEqual(inbound_sms.sms_subscription, 1)
+        with self.assertNumQueries(1):
+            self.assertEqual(inbound_sms.consumer, consumer)
+        with self.assertNumQueries(0):
+            inbound_sms.subscriber
+            inbound_sms.sms_subscription
+            inbound_sms.consumer
+            # Same carrier, already verified: nothing to save.
+            inbound_sms.update_mobile_phone()
+
+    def test_inbound_sms_unknown_sender(self):
+        """ Assert a sender with no mobile phone is looked up in one query. """
+        inbound_sms = InboundSMS(SMSMessageReceived(smsid='721',
+            smsfrom='8455553021', smsmsg='help', network='ATTUS',
+            smsdate='2000-01-01'))
+        with self.assertNumQueries(1):
+            self.assertEqual(inbound_sms.subscriber, None)
+            self.assertEqual(inbound_sms.sms_subscription, None)
+            self.assertEqual(inbound_sms.consumer, None)
+            inbound_sms.update_mobile_phone()
+
+    def test_create_response_relationships(self):
+        """ Assert responses are related to the message received in one query,
+        skipping smsids blank, repeated or not sent.
+        """
+        # Routes nowhere, so nothing is sent in response.
+        SMSMessageReceived(smsid='722', smsfrom='8455553022',
+            smsmsg='hello there', network='ATTUS',
+            smsdate='2000-01-01').save()
+        for smsid in ('900722', '900723'):
+            SMSMessageSent(smsid=smsid, smsto='8455553022',
+                smsmsg='response').save()
+        with self.assertNumQueries(1):
+            created = create_response_relationships('722',
+                ['900722', '900723', '900723', None, '900724'])
+        self.assertEqual(created, 2)
+        self.assertEqual(sorted(SMSResponse.objects.filter(
+            received__smsid=722).values_list('sent__smsid', flat=True)),
+            [900722, 900723])
+        self.assertEqual(SMSResponse.objects.filter(received__smsid=722,
+            is_opt_out=True).count(), 0)
+        self.assertEqual(create_response_relationships('722', [None]), 0)
+
+    def test_stage_timer(self):
+        """ Assert the stages of a timer add up to its total. """
+        timer = StageTimer('test', slo=0)
+        timer.mark('route')
+        timer.mark('handle')
+        self.assertEqual([stage for stage, seconds in timer.stages],
+            ['route', 'handle'])
+        self.assertAlmostEqual(sum([seconds
+            for stage, seconds in timer.stages]), timer.total())
+        timer.report()
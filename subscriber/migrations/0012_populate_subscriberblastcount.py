@@ -0,0 +1,191 @@
+# encoding: utf-8
+import datetime
+from south.db import db
+from south.v2 import DataMigration
+from django.db import models
+
+class Migration(DataMigration):
+
+    depends_on = (
+        ("coupon", "0013_auto__add_subscriberaction"),
+    )
+
+    def forwards(self, orm):
+        "Count the text blasts of this month so far."
+        db.execute("""
+            INSERT INTO "subscriber_subscriberblastcount" (
+                "subscriber_id", "month", "blast_count")
+            SELECT "subscriber_id", date_trunc('month', now())::date, count(*)
+            FROM "coupon_subscriberaction"
+            WHERE "action_id" = 11
+            AND "create_datetime" >= date_trunc('month', now())
+            GROUP BY "subscriber_id";""")
+
+
+    def backwards(self, orm):
+        "Write your backwards methods here."
+        pass
+
+    models = {
+        'geolocation.coordinate': {
+            'Meta': {'object_name': 'Coordinate'},
+            'cos_rad_lat': ('django.db.models.fields.FloatField', [], {}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'latitude': ('django.db.models.fields.FloatField', [], {}),
+            'longitude': ('django.db.models.fields.FloatField', [], {}),
+            'rad_lat': ('django.db.models.fields.FloatField', [], {}),
+            'rad_lon': ('django.db.models.fields.FloatField', [], {}),
+            'sin_rad_lat': ('django.db.models.fields.FloatField', [], {})
+        },
+        'geolocation.uscity': {
+            'Meta': {'ordering': "('us_state', 'name')", 'object_name': 'USCity'},
+            'coordinate': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'us_cities'", 'to': "orm['geolocation.Coordinate']"}),
+            'geom': ('django.contrib.gis.db.models.fields.MultiPolygonField', [], {'null': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '33'}),
+            'us_county': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'us_cities'", 'to': "orm['geolocation.USCounty']"}),
+            'us_state': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'us_cities'", 'to': "orm['geolocation.USState']"})
+        },
+        'geolocation.uscounty': {
+            'Meta': {'ordering': "('us_state', 'name')", 'object_name': 'USCounty'},
+            'geom': ('django.contrib.gis.db.models.fields.MultiPolygonField', [], {'null': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '25'}),
+            'us_state': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'us_counties'", 'to': "orm['geolocation.USState']"})
+        },
+        'geolocation.usstate': {
+            'Meta': {'ordering': "('name',)", 'object_name': 'USState'},
+            'abbreviation': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '2'}),
+            'geom': ('django.contrib.gis.db.models.fields.MultiPolygonField', [], {'null': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '24'})
+        },
+        'geolocation.uszip': {
+            'Meta': {'ordering': "('code',)", 'object_name': 'USZip'},
+            'code': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '5'}),
+            'coordinate': ('django.db.models.fields.related.ForeignKey', [], {'default': '1', 'related_name': "'us_zips'", 'null': 'True', 'blank': 'True', 'to': "orm['geolocation.Coordinate']"}),
+            'geom': ('django.contrib.gis.db.models.fields.MultiPolygonField', [], {'null': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'us_city': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'us_zips'", 'to': "orm['geolocation.USCity']"}),
+            'us_county': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'us_zips'", 'to': "orm['geolocation.USCounty']"}),
+            'us_state': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'us_zips'", 'to': "orm['geolocation.USState']"})
+        },
+        'market.site': {
+            'Meta': {'ordering': "('id',)", 'object_name': 'Site'},
+            'base_rate': ('django.db.models.fields.DecimalField', [], {'default': '0', 'max_digits': '6', 'decimal_places': '0'}),
+            'coordinate': ('django.db.models.fields.related.ForeignKey', [], {'blank': 'True', 'related_name': "'sites'", 'null': 'True', 'to': "orm['geolocation.Coordinate']"}),
+            'default_state_province': ('django.db.models.fields.related.ForeignKey', [], {'blank': 'True', 'related_name': "'site'", 'null': 'True', 'to': "orm['geolocation.USState']"}),
+            'default_zip_postal': ('django.db.models.fields.CharField', [], {'max_length': '9', 'null': 'True', 'blank': 'True'}),
+            'directory_name': ('django.db.models.fields.CharField', [], {'max_length': '50', 'unique': 'True', 'null': 'True', 'blank': 'True'}),
+            'domain': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '100'}),
+            'envelope': ('django.contrib.gis.db.models.fields.GeometryField', [], {'null': 'True', 'blank': 'True'}),
+            'geom': ('django.contrib.gis.db.models.fields.GeometryField', [], {'null': 'True', 'blank': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'inactive_flag': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'launch_date': ('django.db.models.fields.DateField', [], {'max_length': '50', 'null': 'True', 'blank': 'True'}),
+            'market_cities': ('django.db.models.fields.CharField', [], {'max_length': '100', 'null': 'True', 'blank': 'True'}),
+            'media_partner_allotment': ('django.db.models.fields.PositiveSmallIntegerField', [], {'default': '0'}),
+            'name': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '50'}),
+            'phase': ('django.db.models.fields.PositiveSmallIntegerField', [], {'default': '1'}),
+            'point': ('django.contrib.gis.db.models.fields.PointField', [], {'null': 'True', 'blank': 'True'}),
+            'region': ('django.db.models.fields.CharField', [], {'max_length': '50'}),
+            'short_name': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '22'}),
+            'us_city': ('django.db.models.fields.related.ManyToManyField', [], {'blank': 'True', 'related_name': "'sites'", 'null': 'True', 'symmetrical': 'False', 'to': "orm['geolocation.USCity']"}),
+            'us_county': ('django.db.models.fields.related.ManyToManyField', [], {'blank': 'True', 'related_name': "'sites'", 'null': 'True', 'symmetrical': 'False', 'to': "orm['geolocation.USCounty']"}),
+            'us_state': ('django.db.models.fields.related.ForeignKey', [], {'blank': 'True', 'related_name': "'sites'", 'null': 'True', 'to': "orm['geolocation.USState']"}),
+            'us_zip': ('django.db.models.fields.related.ManyToManyField', [], {'blank': 'True', 'related_name': "'sites'", 'null': 'True', 'symmetrical': 'False', 'to': "orm['geolocation.USZip']"})
+        },
+        'sms_gateway.smsmessage': {
+            'Meta': {'ordering': "('smsid',)", 'object_name': 'SMSMessage'},
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'mobile_phone': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'sms_messages'", 'null': 'True', 'to': "orm['subscriber.MobilePhone']"}),
+            'note': ('django.db.models.fields.CharField', [], {'max_length': '160', 'null': 'True', 'blank': 'True'}),
+            'report': ('django.db.models.fields.PositiveSmallIntegerField', [], {'default': '0', 'max_length': '1', 'null': 'True', 'blank': 'True'}),
+            'smsfrom': ('django.db.models.fields.CharField', [], {'max_length': '16', 'null': 'True', 'blank': 'True'}),
+            'smsid': ('django.db.models.fields.BigIntegerField', [], {'null': 'True', 'blank': 'True'}),
+            'smsto': ('django.db.models.fields.CharField', [], {'max_length': '16'}),
+            'subaccount': ('django.db.models.fields.CharField', [], {'max_length': '10', 'null': 'True', 'blank': 'True'}),
+            'vp': ('django.db.models.fields.PositiveSmallIntegerField', [], {'null': 'True', 'blank': 'True'})
+        },
+        'sms_gateway.smsmessagereceived': {
+            'Meta': {'ordering': "('smsid',)", 'object_name': 'SMSMessageReceived', '_ormbases': ['sms_gateway.SMSMessage']},
+            'bits': ('django.db.models.fields.PositiveSmallIntegerField', [], {'default': '7', 'max_length': '2'}),
+            'network': ('django.db.models.fields.CharField', [], {'max_length': '20', 'null': 'True', 'blank': 'True'}),
+            'received_datetime': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'blank': 'True'}),
+            'response': ('django.db.models.fields.related.ManyToManyField', [], {'related_name': "'sms_messages_received'", 'symmetrical': 'False', 'through': "orm['sms_gateway.SMSResponse']", 'to': "orm['sms_gateway.SMSMessageSent']"}),
+            'smsc': ('django.db.models.fields.CharField', [], {'max_length': '20', 'null': 'True', 'blank': 'True'}),
+            'smsdate': ('django.db.models.fields.DateTimeField', [], {}),
+            'smsmessage_ptr': ('django.db.models.fields.related.OneToOneField', [], {'to': "orm['sms_gateway.SMSMessage']", 'unique': 'True', 'primary_key': 'True'}),
+            'smsmsg': ('django.db.models.fields.CharField', [], {'max_length': '160'}),
+            'smsucs2': ('django.db.models.fields.CharField', [], {'max_length': '20', 'null': 'True', 'blank': 'True'}),
+            'smsudh': ('django.db.models.fields.CharField', [], {'max_length': '20', 'null': 'True', 'blank': 'True'})
+        },
+        'sms_gateway.smsmessagesent': {
+            'Meta': {'ordering': "('smsid',)", 'object_name': 'SMSMessageSent', '_ormbases': ['sms_gateway.SMSMessage']},
+            'flash': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'sent_datetime': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'blank': 'True'}),
+            'smsmessage_ptr': ('django.db.models.fields.related.OneToOneField', [], {'to': "orm['sms_gateway.SMSMessage']", 'unique': 'True', 'primary_key': 'True'}),
+            'smsmsg': ('django.db.models.fields.TextField', [], {'max_length': '800'}),
+            'smsudh': ('django.db.models.fields.CharField', [], {'max_length': '20', 'null': 'True', 'blank': 'True'}),
+            'split': ('django.db.models.fields.PositiveSmallIntegerField', [], {'default': '0', 'max_length': '1'})
+        },
+        'sms_gateway.smsreport': {
+            'Meta': {'ordering': "('smsid',)", 'object_name': 'SMSReport'},
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'reason': ('django.db.models.fields.CharField', [], {'max_length': '10'}),
+            'smsdate': ('django.db.models.fields.DateTimeField', [], {}),
+            'smsfrom': ('django.db.models.fields.CharField', [], {'max_length': '16'}),
+            'smsid': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'sms_reports'", 'to': "orm['sms_gateway.SMSMessageSent']"}),
+            'smsmsg': ('django.db.models.fields.CharField', [], {'max_length': '160'}),
+            'status': ('django.db.models.fields.CharField', [], {'max_length': "'14'"})
+        },
+        'sms_gateway.smsresponse': {
+            'Meta': {'object_name': 'SMSResponse'},
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'is_opt_out': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'received': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'sms_responses'", 'to': "orm['sms_gateway.SMSMessageReceived']"}),
+            'response_direction': ('django.db.models.fields.CharField', [], {'max_length': '3'}),
+            'sent': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'sms_responses'", 'to': "orm['sms_gateway.SMSMessageSent']"})
+        },
+        'subscriber.carrier': {
+            'Meta': {'ordering': "('-is_major_carrier', 'carrier_display_name')", 'object_name': 'Carrier'},
+            'carrier': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '20'}),
+            'carrier_display_name': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '75'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'is_major_carrier': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'password': ('django.db.models.fields.CharField', [], {'max_length': '25', 'null': 'True', 'blank': 'True'}),
+            'site': ('django.db.models.fields.related.ManyToManyField', [], {'related_name': "'carriers'", 'symmetrical': 'False', 'to': "orm['market.Site']"}),
+            'user_name': ('django.db.models.fields.CharField', [], {'max_length': '25', 'null': 'True', 'blank': 'True'})
+        },
+        'subscriber.mobilephone': {
+            'Meta': {'object_name': 'MobilePhone'},
+            'carrier': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'mobile_phones'", 'to': "orm['subscriber.Carrier']"}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'is_verified': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'mobile_phone_number': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '20'}),
+            'subscriber': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'mobile_phones'", 'to': "orm['subscriber.Subscriber']"})
+        },
+        'subscriber.smssubscription': {
+            'Meta': {'object_name': 'SMSSubscription'},
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'sms_subscription_name': ('django.db.models.fields.CharField', [], {'max_length': '25'})
+        },
+        'subscriber.subscriber': {
+            'Meta': {'object_name': 'Subscriber'},
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'site': ('django.db.models.fields.related.ForeignKey', [], {'default': '1', 'related_name': "'subscribers'", 'to': "orm['market.Site']"}),
+            'sms_subscription': ('django.db.models.fields.related.ManyToManyField', [], {'blank': 'True', 'related_name': "'subscribers'", 'null': 'True', 'symmetrical': 'False', 'to': "orm['subscriber.SMSSubscription']"}),
+            'subscriber_create_datetime': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'blank': 'True'}),
+            'subscriber_modified_datetime': ('django.db.models.fields.DateTimeField', [], {'auto_now': 'True', 'blank': 'True'}),
+            'subscriber_zip_postal': ('django.db.models.fields.CharField', [], {'max_length': '9', 'null': 'True'})
+        },
+        'subscriber.subscriberblastcount': {
+            'Meta': {'unique_together': "(('subscriber', 'month'),)", 'object_name': 'SubscriberBlastCount'},
+            'blast_count': ('django.db.models.fields.PositiveIntegerField', [], {'default': '0'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'month': ('django.db.models.fields.DateField', [], {}),
+            'subscriber': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'blast_counts'", 'to': "orm['subscriber.Subscriber']"})
+        }
+    }
+
+    complete_apps = ['sms_gateway', 'subscriber']
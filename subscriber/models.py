@@ -118,3 +118,20 @@ class MobilePhone(models.Model):
 
     def __unicode__(self):
         return u'%s' % self.mobile_phone_number
+
+
+class SubscriberBlastCount(models.Model):
+    """ How many times a subscriber was text blasted in a month. Counted as
+    blasts are written, so the monthly blast limit is one indexed lookup.
+    """
+    subscriber = models.ForeignKey(Subscriber, related_name='blast_counts')
+    month = models.DateField('First day of the month')
+    blast_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'Subscriber Blast Count'
+        verbose_name_plural = 'Subscriber Blast Counts'
+        unique_together = (('subscriber', 'month'),)
+
+    def __unicode__(self):
+        return u'%s %s' % (self.subscriber_id, self.month)